@@ -0,0 +1,315 @@
+"""进程内 sherpa-onnx 识别引擎及其微批处理
+
+asr_openai_api.py（ASR_BACKEND=local）和 shm_recognizer_worker.py 共用；
+导入本模块不读取 API 的模型清单等配置，也不配置日志。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from asr_metrics import _request_timer, metrics, stage_timer
+
+# 进程内识别引擎为可选功能，未安装 sherpa_onnx 时只能使用 WebSocket 后端
+try:
+    import sherpa_onnx
+except ImportError:
+    sherpa_onnx = None
+
+logger = logging.getLogger(__name__)
+
+# 与 start_voice_services.sh 启动 Sherpa 时使用的同一套 SenseVoice 模型
+SENSE_VOICE_DIR = os.environ.get("SENSE_VOICE_DIR", "./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17")
+SENSE_VOICE_MODEL = os.environ.get("SENSE_VOICE_MODEL", os.path.join(SENSE_VOICE_DIR, "model.int8.onnx"))
+SENSE_VOICE_TOKENS = os.environ.get("SENSE_VOICE_TOKENS", os.path.join(SENSE_VOICE_DIR, "tokens.txt"))
+SENSE_VOICE_USE_ITN = os.environ.get("SENSE_VOICE_USE_ITN", "1") == "1"
+ASR_ENGINE_WORKERS = int(os.environ.get("ASR_ENGINE_WORKERS", str(os.cpu_count() or 1)))
+ASR_ENGINE_NUM_THREADS = int(os.environ.get("ASR_ENGINE_NUM_THREADS", "1"))
+# 微批处理：窗口内到达的短音频合并为一次 decode_streams 调用；窗口为 0 时关闭
+ASR_BATCH_WINDOW_MS = float(os.environ.get("ASR_BATCH_WINDOW_MS", "10"))
+ASR_BATCH_MAX_SIZE = int(os.environ.get("ASR_BATCH_MAX_SIZE", "8"))
+ASR_BATCH_MAX_AUDIO_SECONDS = float(os.environ.get("ASR_BATCH_MAX_AUDIO_SECONDS", "60"))  # 单批音频总时长上限
+BATCH_SIZE_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+BATCH_WAIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+ENGINE_BATCH_SIZE = metrics.histogram(
+    "asr_engine_batch_size", "Segments decoded together in one batched recognizer call", BATCH_SIZE_BUCKETS,
+    labels=("model",),
+)
+ENGINE_BATCH_WAIT_SECONDS = metrics.histogram(
+    "asr_engine_batch_wait_seconds", "Time a segment waited for its batch to start decoding", BATCH_WAIT_BUCKETS,
+    labels=("model",),
+)
+
+
+class _BatchItem:
+    __slots__ = ("samples", "sample_rate", "future", "enqueued", "wait")
+
+    def __init__(self, samples: np.ndarray, sample_rate: int, future):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.wait = 0.0
+
+
+# 进程内识别的微批处理
+class MicroBatcher:
+    """把短时间内到达的多段音频合并成一批，交给 decode_batch 一次解码，结果按顺序分发回各请求
+
+    没有批次在解码时（空闲）新到的音频立即单独解码，不增加延迟；
+    否则批次在达到 max_size 段或 max_audio_seconds 秒音频时立即提交，未满时等待 window 秒。
+    窗口到期时若所有工作线程都在解码，则继续攒批，等有线程空闲再提交（负载越高批次越大）。
+    单段超过 max_audio_seconds 的长音频不等待，单独成批。
+    """
+
+    def __init__(self, name: str, decode_batch, executor_fn, workers: int,
+                 window: float, max_size: int, max_audio_seconds: float):
+        self.name = name
+        self.decode_batch = decode_batch  # 同步函数：[(samples, sample_rate), ...] -> [text, ...]
+        self.executor_fn = executor_fn    # 返回执行解码的线程池（模型卸载后会变化）
+        self.workers = max(1, workers)
+        self.window = max(0.0, window)
+        self.max_size = max(1, max_size)
+        self.max_audio_seconds = max_audio_seconds
+        self._pending = []
+        self._pending_seconds = 0.0
+        self._timer = None
+        self._due = False
+        self.running = 0
+
+        self.batches_total = 0
+        self.items_total = 0
+        self.flushes = {"idle": 0, "size": 0, "audio": 0, "window": 0}
+        self.wait_seconds_total = 0.0
+        self.recent_waits = deque(maxlen=1000)
+        self.size_counts = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_size > 1
+
+    def stats(self) -> dict:
+        waits = sorted(self.recent_waits)
+        return {
+            "enabled": self.enabled,
+            "window_ms": round(self.window * 1000, 2),
+            "max_size": self.max_size,
+            "max_audio_seconds": self.max_audio_seconds,
+            "pending": len(self._pending),
+            "running": self.running,
+            "batches_total": self.batches_total,
+            "items_total": self.items_total,
+            "avg_batch_size": round(self.items_total / self.batches_total, 2) if self.batches_total else 0.0,
+            "batch_sizes": dict(sorted(self.size_counts.items())),
+            "flushes": dict(self.flushes),
+            "avg_wait_ms": round(self.wait_seconds_total / self.items_total * 1000, 2) if self.items_total else 0.0,
+            "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+        }
+
+    async def submit(self, samples: np.ndarray, sample_rate: int) -> str:
+        loop = asyncio.get_running_loop()
+        item = _BatchItem(samples, sample_rate, loop.create_future())
+        seconds = len(samples) / sample_rate
+        if seconds >= self.max_audio_seconds:
+            self._start([item], "audio")
+        elif self.running == 0 and not self._pending:
+            self._start([item], "idle")
+        else:
+            if self._pending and self._pending_seconds + seconds > self.max_audio_seconds:
+                self._flush("audio")
+            self._pending.append(item)
+            self._pending_seconds += seconds
+            if len(self._pending) >= self.max_size:
+                self._flush("size")
+            elif self._timer is None and not self._due:
+                self._timer = loop.call_later(self.window, self._on_window)
+        text = await item.future
+        timer = _request_timer.get()
+        if timer is not None:
+            timer.add("batch_wait", item.wait)
+        return text
+
+    def _on_window(self):
+        self._timer = None
+        if self.running < self.workers:
+            self._flush("window")
+        else:
+            self._due = True  # 线程都在忙，等有批次完成再提交
+
+    def _flush(self, reason: str):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._due = False
+        batch, self._pending, self._pending_seconds = self._pending, [], 0.0
+        if batch:
+            self._start(batch, reason)
+
+    def _start(self, batch: list, reason: str):
+        self.flushes[reason] += 1
+        self.running += 1
+        asyncio.get_running_loop().create_task(self._run(batch))
+
+    def _decode(self, batch: list) -> list:
+        start = time.perf_counter()
+        for item in batch:
+            item.wait = start - item.enqueued
+        return self.decode_batch([(item.samples, item.sample_rate) for item in batch])
+
+    async def _run(self, batch: list):
+        try:
+            loop = asyncio.get_running_loop()
+            texts = await loop.run_in_executor(self.executor_fn(), self._decode, batch)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        else:
+            for item, text in zip(batch, texts):
+                if not item.future.done():
+                    item.future.set_result(text)
+        finally:
+            self.running -= 1
+            self.batches_total += 1
+            self.items_total += len(batch)
+            self.size_counts[len(batch)] = self.size_counts.get(len(batch), 0) + 1
+            ENGINE_BATCH_SIZE.observe(len(batch), self.name)
+            for item in batch:
+                self.wait_seconds_total += item.wait
+                self.recent_waits.append(item.wait)
+                ENGINE_BATCH_WAIT_SECONDS.observe(item.wait, self.name)
+            if self._pending and (self._due or self._timer is None):
+                self._flush("window")
+
+
+# 进程内 sherpa-onnx 识别引擎
+class LocalRecognizerEngine:
+    """直接在 API 进程中加载 sherpa-onnx 模型，省去 WebSocket 转发和样本序列化
+
+    与 non_streaming_server.py 相同，所有工作线程共享一个 OfflineRecognizer，
+    解码在线程池中执行（onnxruntime 计算期间释放 GIL），线程数默认等于 CPU 核数。
+    recognizer_type 对应 OfflineRecognizer.from_<type>（sense_voice、paraformer、whisper、transducer 等），
+    recognizer_args 原样传给该构造函数，其中的字符串参数若是已存在的文件路径则视为模型文件。
+    并发到达的短音频经 MicroBatcher 合并，用一次 decode_streams 解码。
+    """
+
+    def __init__(self, recognizer_type: str, recognizer_args: dict, workers: int, num_threads: int,
+                 batch_window_ms: float = ASR_BATCH_WINDOW_MS, batch_max_size: int = ASR_BATCH_MAX_SIZE,
+                 batch_max_audio_seconds: float = ASR_BATCH_MAX_AUDIO_SECONDS, name: str = ""):
+        self.recognizer_type = recognizer_type
+        self.recognizer_args = dict(recognizer_args)
+        self.model = self.recognizer_args.get("model") or next(iter(self.model_files()), "")
+        self.workers = max(1, workers)
+        self.num_threads = max(1, num_threads)
+        self.recognizer = None
+        self._executor = None
+        self._stats_lock = threading.Lock()
+        self.batcher = MicroBatcher(
+            name or recognizer_type, self.decode_batch, lambda: self._executor, self.workers,
+            batch_window_ms / 1000, batch_max_size, batch_max_audio_seconds,
+        )
+
+        self.in_flight = 0
+        self.decoded_total = 0
+        self.audio_seconds_total = 0.0
+        self.compute_seconds_total = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.recognizer is not None
+
+    def model_files(self) -> list:
+        return [
+            v for k, v in self.recognizer_args.items()
+            if isinstance(v, str) and (k in ("model", "tokens", "encoder", "decoder", "joiner", "paraformer")
+                                       or v.endswith(".onnx"))
+        ]
+
+    def model_bytes(self) -> int:
+        """模型文件总大小，用于估算加载后的内存占用"""
+        return sum(os.path.getsize(path) for path in self.model_files() if os.path.isfile(path))
+
+    def load(self):
+        """加载模型（耗时数秒，应在线程中调用）"""
+        if sherpa_onnx is None:
+            raise RuntimeError("未安装 sherpa_onnx，无法使用进程内识别引擎")
+        for path in self.model_files():
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"缺少模型文件: {path}")
+        factory = getattr(sherpa_onnx.OfflineRecognizer, f"from_{self.recognizer_type}", None)
+        if factory is None:
+            raise ValueError(f"sherpa_onnx 不支持的模型类型: {self.recognizer_type}")
+        start = time.perf_counter()
+        self.recognizer = factory(num_threads=self.num_threads, **self.recognizer_args)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asr-engine")
+        logger.info(
+            f"进程内识别引擎已加载: {self.model}, 工作线程={self.workers}, "
+            f"每次解码线程数={self.num_threads}, 耗时 {time.perf_counter() - start:.2f} 秒"
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.recognizer = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "type": self.recognizer_type,
+            "model": self.model,
+            "workers": self.workers,
+            "num_threads": self.num_threads,
+            "in_flight": self.in_flight,
+            "decoded_total": self.decoded_total,
+            "audio_seconds_total": round(self.audio_seconds_total, 3),
+            "rtf": round(self.compute_seconds_total / self.audio_seconds_total, 4)
+            if self.audio_seconds_total else 0.0,
+            "batching": self.batcher.stats(),
+        }
+
+    def decode(self, samples: np.ndarray, sample_rate: int) -> str:
+        """同步解码一段音频（在工作线程中执行）"""
+        start = time.perf_counter()
+        stream = self.recognizer.create_stream()
+        stream.accept_waveform(sample_rate, samples)
+        self.recognizer.decode_stream(stream)
+        with self._stats_lock:
+            self.compute_seconds_total += time.perf_counter() - start
+            self.audio_seconds_total += len(samples) / sample_rate
+            self.decoded_total += 1
+        return stream.result.text
+
+    def decode_batch(self, items: list) -> list:
+        """同步解码一批音频（在工作线程中执行），返回与 items 顺序一致的文本"""
+        if len(items) == 1:
+            return [self.decode(*items[0])]
+        start = time.perf_counter()
+        streams = []
+        for samples, sample_rate in items:
+            stream = self.recognizer.create_stream()
+            stream.accept_waveform(sample_rate, samples)
+            streams.append(stream)
+        self.recognizer.decode_streams(streams)
+        with self._stats_lock:
+            self.compute_seconds_total += time.perf_counter() - start
+            self.audio_seconds_total += sum(len(samples) / sample_rate for samples, sample_rate in items)
+            self.decoded_total += len(items)
+        return [stream.result.text for stream in streams]
+
+    async def recognize(self, samples: np.ndarray, sample_rate: int) -> str:
+        self.in_flight += 1
+        try:
+            with stage_timer("engine_decode"):
+                if self.batcher.enabled:
+                    return await self.batcher.submit(samples, sample_rate)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self.decode, samples, sample_rate)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,201 @@
+"""Prometheus 指标与请求分阶段计时
+
+API 进程和同机识别进程共用；导入本模块没有副作用（只创建空的指标注册表）。
+"""
+import bisect
+import contextvars
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Prometheus 指标（只在事件循环中更新，无锁，开销为一次字典操作）
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {} if self.labels else {(): 0}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self._values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float):
+        self._values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # 标签值 -> [各桶计数（非累计）..., +Inf 计数, 总和]
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        le_names = self.labels + ("le",)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(le_names, label_values + (_format_value(bound),)), cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, series[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """收集所有指标，按 Prometheus 文本格式导出
+
+    连接池、解码池、缓存等已有 stats() 的组件不在热路径上重复计数，
+    而是注册采集函数，在抓取 /metrics 时读取当前状态。
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, labels=()) -> Gauge:
+        metric = Gauge(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets=METRICS_LATENCY_BUCKETS, labels=()) -> Histogram:
+        metric = Histogram(name, help, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """注册采集函数：返回 [(指标名, 类型, 说明, 标签名, [(标签值, 数值), ...]), ...]"""
+        self._collectors.append(fn)
+        return fn
+
+    def families(self) -> list:
+        """当前进程的全部指标：[(指标名, 类型, 说明, [(样本名, 标签串, 数值), ...]), ...]"""
+        result = [(metric.name, metric.kind, metric.help, list(metric.samples())) for metric in self._metrics]
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                logger.warning(f"指标采集失败 {getattr(collect, '__name__', collect)}: {e}")
+                continue
+            for name, kind, help, labels, samples in families:
+                result.append((
+                    name, kind, help,
+                    [(name, _format_labels(labels, label_values), value) for label_values, value in samples],
+                ))
+        return result
+
+    def render(self, families=None) -> str:
+        lines = []
+        for name, kind, help, samples in self.families() if families is None else families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, labels, value in samples:
+                lines.append(f"{sample}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "asr_stage_seconds", "Time spent in each stage of a transcription request", labels=("stage",)
+)
+
+
+# 单个请求的分阶段计时
+class RequestTimer:
+    """累计一个请求在各阶段的耗时，结束时写入 asr_stage_seconds
+
+    通过 contextvar 传递，识别后端的发送/等待耗时也能记到当前请求上。
+    并发识别多个语音段时，同一阶段的耗时是各段之和。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.upload_bytes = 0
+        self.audio_seconds = 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def finish(self):
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, name)
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头，浏览器开发者工具可直接展示"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items())
+
+
+_request_timer = contextvars.ContextVar("asr_request_timer", default=None)
+
+
+def stage_timer(name: str):
+    """在当前请求的计时器上记录一个阶段；没有计时器（如流式识别）时不做任何事"""
+    timer = _request_timer.get()
+    return timer.stage(name) if timer is not None else nullcontext()
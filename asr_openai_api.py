@@ -1,23 +1,1594 @@
-import wave
+import json
+import hashlib
+import sqlite3
+import threading
+import io
+import math
+import mmap
+import struct
+import functools
 import numpy as np
 import tempfile
+import urllib.parse
+import urllib.request
+import uuid
+import zipfile
 import asyncio
+from multiprocessing import shared_memory
 import websockets
 import logging
 import os
 import subprocess
 import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
-from fastapi.responses import JSONResponse
+import sys
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers
 import traceback
-from typing import Optional
+import time
+from collections import OrderedDict, deque
+from contextlib import aclosing, asynccontextmanager, nullcontext
+from typing import List, NamedTuple, Optional
+
+from asr_metrics import RequestTimer, _request_timer, metrics, stage_timer
+from asr_engine import (
+    ASR_BATCH_MAX_AUDIO_SECONDS, ASR_BATCH_MAX_SIZE, ASR_BATCH_WINDOW_MS, ASR_ENGINE_NUM_THREADS, ASR_ENGINE_WORKERS,
+    SENSE_VOICE_DIR, SENSE_VOICE_MODEL, SENSE_VOICE_TOKENS, SENSE_VOICE_USE_ITN, LocalRecognizerEngine, sherpa_onnx,
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+SHERPA_WS_HOST = "127.0.0.1"
+SHERPA_WS_PORT = 6006
+
+# Sherpa 连接池配置（可通过环境变量覆盖）
+SHERPA_POOL_MIN_SIZE = int(os.environ.get("SHERPA_POOL_MIN_SIZE", "1"))
+SHERPA_POOL_MAX_SIZE = int(os.environ.get("SHERPA_POOL_MAX_SIZE", "8"))
+SHERPA_POOL_IDLE_TIMEOUT = float(os.environ.get("SHERPA_POOL_IDLE_TIMEOUT", "60"))
+SHERPA_CONNECT_TIMEOUT = float(os.environ.get("SHERPA_CONNECT_TIMEOUT", "5"))
+
+# 同机识别进程（shm_recognizer_worker.py）的共享内存传输：SHERPA_BACKENDS 中写作 unix:/path/to.sock
+SHM_SEGMENT_PREFIX = "asr_shm_"  # 段名为 前缀 + API 进程 pid + 随机串，启动时据此清理已退出进程遗留的段
+SHM_MIN_SEGMENT_BYTES = int(float(os.environ.get("SHM_MIN_SEGMENT_MB", "8")) * 1024 * 1024)
+SHM_DIR = "/dev/shm"
+
+# Sherpa 后端列表（逗号分隔的 host:port 或 unix:/path），start_voice_services.sh 启动多个实例时会设置
+SHERPA_BACKENDS = os.environ.get("SHERPA_BACKENDS", f"{SHERPA_WS_HOST}:{SHERPA_WS_PORT}")
+SHERPA_EJECT_FAILURES = int(os.environ.get("SHERPA_EJECT_FAILURES", "3"))  # 连续失败多少次后摘除
+SHERPA_EJECT_SECONDS = float(os.environ.get("SHERPA_EJECT_SECONDS", "10"))  # 首次摘除时长，重复摘除时翻倍
+SHERPA_EJECT_MAX_SECONDS = float(os.environ.get("SHERPA_EJECT_MAX_SECONDS", "300"))
+SHERPA_SLOW_START_SECONDS = float(os.environ.get("SHERPA_SLOW_START_SECONDS", "30"))  # 恢复后权重爬升时间
+SHERPA_HEALTH_INTERVAL = float(os.environ.get("SHERPA_HEALTH_INTERVAL", "5"))
+
+# 识别截止时间与对冲请求：截止时间 = BASE + 音频时长 × RTF（RTF 为 0 时不限时）
+SHERPA_DEADLINE_BASE = float(os.environ.get("SHERPA_DEADLINE_BASE", "10"))
+SHERPA_DEADLINE_RTF = float(os.environ.get("SHERPA_DEADLINE_RTF", "2.0"))
+SHERPA_HEDGE_PERCENTILE = float(os.environ.get("SHERPA_HEDGE_PERCENTILE", "95"))  # 超过该分位耗时后发送对冲请求，0 为关闭
+SHERPA_HEDGE_MIN_DELAY = float(os.environ.get("SHERPA_HEDGE_MIN_DELAY", "0.05"))
+SHERPA_HEDGE_MIN_SAMPLES = int(os.environ.get("SHERPA_HEDGE_MIN_SAMPLES", "20"))  # 样本不足时不对冲
+SHERPA_HEDGE_WINDOW = int(os.environ.get("SHERPA_HEDGE_WINDOW", "1000"))  # 统计分位数的最近请求数
+SHERPA_HEDGE_BUDGET = float(os.environ.get("SHERPA_HEDGE_BUDGET", "0.1"))  # 对冲请求占总请求的比例上限
+
+
+# 监控指标配置
+METRICS_RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+
+# 多进程模式：ASR_WORKERS > 1 时 python asr_openai_api.py 由 uvicorn 主进程预先启动多个工作进程，共享监听端口
+# 主进程收到 SIGHUP 时逐个替换工作进程（新进程就绪后才停止旧进程），SIGTTIN/SIGTTOU 增减进程数
+ASR_HOST = os.environ.get("ASR_HOST", "0.0.0.0")
+ASR_PORT = int(os.environ.get("ASR_PORT", "8000"))
+ASR_WORKERS = int(os.environ.get("ASR_WORKERS", "1"))
+ASR_WORKER_MAX_REQUESTS = int(os.environ.get("ASR_WORKER_MAX_REQUESTS", "0"))  # 处理多少个请求后重启工作进程，0 为不重启
+ASR_WORKER_MAX_REQUESTS_JITTER = int(
+    os.environ.get("ASR_WORKER_MAX_REQUESTS_JITTER", str(ASR_WORKER_MAX_REQUESTS // 10))
+)  # 随机增加的请求数，错开各进程的重启时间
+ASR_WORKER_STARTUP_TIMEOUT = int(os.environ.get("ASR_WORKER_STARTUP_TIMEOUT", "60"))  # 平滑重启时等待新进程就绪的秒数
+ASR_WORKER_GRACEFUL_TIMEOUT = int(os.environ.get("ASR_WORKER_GRACEFUL_TIMEOUT", "120"))  # 进程退出时等待进行中请求的秒数
+ASR_SHARED_DIR = os.environ.get("ASR_SHARED_DIR", "./asr_shared")  # 工作进程共享的指标库和转录缓存库所在目录
+# 由主进程设置；非空表示本进程是多进程模式下的工作进程（直接用 uvicorn --workers 启动时也可手动设置）
+ASR_MULTIPROCESS_DIR = os.environ.get("ASR_MULTIPROCESS_DIR", "")
+ASR_METRICS_PUBLISH_INTERVAL = float(os.environ.get("ASR_METRICS_PUBLISH_INTERVAL", "5"))
+# 多进程汇总时不能相加的 gauge：其余 gauge 对存活进程求和
+MULTIPROCESS_GAUGE_MODES = {
+    "asr_ready": "min",
+    "asr_sherpa_backend_up": "min",
+    "asr_circuit_state": "max",
+    "asr_sherpa_hedge_after_seconds": "max",
+    "asr_job_files_queued": "max",  # 各进程读的是同一个任务库
+    "asr_warmup_seconds": "max",
+}
+
+
+REQUEST_SECONDS = metrics.histogram("asr_request_seconds", "End-to-end transcription request latency")
+REQUESTS_TOTAL = metrics.counter("asr_requests_total", "Transcription requests by HTTP status", labels=("status",))
+REQUESTS_IN_FLIGHT = metrics.gauge("asr_requests_in_flight", "Transcription requests currently being processed")
+STREAMS_IN_FLIGHT = metrics.gauge("asr_streams_in_flight", "Open streaming transcription connections")
+AUDIO_SECONDS_TOTAL = metrics.counter(
+    "asr_audio_seconds_total", "Seconds of audio processed", labels=("endpoint",)
+)
+REAL_TIME_FACTOR = metrics.histogram(
+    "asr_real_time_factor", "Recognition time divided by audio duration per request", buckets=METRICS_RTF_BUCKETS
+)
+FFMPEG_FAILURES_TOTAL = metrics.counter("asr_ffmpeg_failures_total", "Failed ffmpeg decodes", labels=("reason",))
+SHERPA_CONNECTION_ERRORS_TOTAL = metrics.counter(
+    "asr_sherpa_connection_errors_total", "Connection errors talking to a Sherpa backend", labels=("backend",)
+)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# 多进程模式下的指标汇总
+class MultiprocessMetrics:
+    """各工作进程把自己的指标样本写入共享的 SQLite 库，任一进程响应 /metrics 时合并所有进程的样本
+
+    counter 和 histogram 按样本相加；gauge 只取存活进程，默认相加，MULTIPROCESS_GAUGE_MODES 中的取最大/最小值。
+    已退出进程（回收或崩溃）的 counter 和 histogram 并入 pid=0 的归档行，总数不会因为工作进程重启而回退。
+    db_path 为空（单进程）时不启用，/metrics 直接输出本进程的指标。
+    """
+
+    def __init__(self, db_path: str, interval: float):
+        self.db_path = db_path
+        self.interval = max(0.5, interval)
+        self.pid = os.getpid()
+        self.workers = 0
+        self.published_at = None
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._task = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    async def start(self):
+        if not self.db_path:
+            return
+        self.pid = os.getpid()
+        await asyncio.to_thread(self._open)
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            # 退出前写入最终计数，之后由其他进程归档
+            try:
+                await asyncio.to_thread(self.publish, metrics.families())
+            except Exception as e:
+                logger.warning(f"写入进程指标失败: {e}")
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        return {
+            "pid": self.pid,
+            "multiprocess": self.enabled,
+            "workers": self.workers if self.enabled else 1,
+            "published_at": int(self.published_at) if self.published_at else None,
+        }
+
+    def _open(self):
+        # 自行管理事务：归档时需要 BEGIN IMMEDIATE，避免两个进程重复归档同一个已退出进程
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "pid INTEGER NOT NULL, family TEXT NOT NULL, kind TEXT NOT NULL, help TEXT NOT NULL, "
+                "sample TEXT NOT NULL, labels TEXT NOT NULL, value NOT NULL, PRIMARY KEY (pid, sample, labels))"
+            )
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.publish, metrics.families())
+            except Exception as e:
+                logger.warning(f"写入进程指标失败: {e}")
+
+    def _transaction(self, fn, *args):
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(*args)
+                self._db.execute("COMMIT")
+                return result
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def publish(self, families: list) -> list:
+        """用本进程的当前样本替换库中的旧样本，返回库中有样本的进程；families 须在事件循环线程中取得"""
+        rows = [
+            (self.pid, name, kind, help, sample, labels, value)
+            for name, kind, help, samples in families
+            for sample, labels, value in samples
+        ]
+
+        def write():
+            self._db.execute("DELETE FROM samples WHERE pid = ?", (self.pid,))
+            self._db.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+        self._transaction(write)
+        self.published_at = time.time()
+        with self._db_lock:
+            pids = [row[0] for row in self._db.execute("SELECT DISTINCT pid FROM samples WHERE pid != 0")]
+        self.workers = sum(1 for pid in pids if pid == self.pid or _pid_alive(pid))
+        return pids
+
+    def _archive(self, pids: list):
+        marks = ",".join("?" * len(pids))
+        self._db.execute(
+            "INSERT INTO samples SELECT 0, family, kind, help, sample, labels, SUM(value) FROM samples "
+            f"WHERE pid IN ({marks}) AND kind != 'gauge' GROUP BY sample, labels "
+            "ON CONFLICT (pid, sample, labels) DO UPDATE SET value = value + excluded.value",
+            pids,
+        )
+        self._db.execute(f"DELETE FROM samples WHERE pid IN ({marks})", pids)
+
+    def collect(self, families: list) -> list:
+        """写入本进程的样本并返回所有进程合并后的指标，格式同 MetricsRegistry.families()"""
+        pids = self.publish(families)
+        dead = [pid for pid in pids if pid != self.pid and not _pid_alive(pid)]
+        if dead:
+            self._transaction(self._archive, dead)
+            logger.info(f"归档已退出工作进程的指标: {dead}")
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT family, kind, help, sample, labels, value FROM samples ORDER BY rowid"
+            ).fetchall()
+
+        merged = {}  # 指标名 -> (类型, 说明, {(样本名, 标签串): [各进程数值]})
+        for family, kind, help, sample, labels, value in rows:
+            merged.setdefault(family, (kind, help, {}))[2].setdefault((sample, labels), []).append(value)
+        result = []
+        for family, (kind, help, samples) in merged.items():
+            combine = {"sum": sum, "max": max, "min": min}[
+                MULTIPROCESS_GAUGE_MODES.get(family, "sum") if kind == "gauge" else "sum"
+            ]
+            result.append((family, kind, help, [(s, labels, combine(v)) for (s, labels), v in samples.items()]))
+        result.append(("asr_workers", "gauge", "Live API worker processes", [("asr_workers", "", self.workers)]))
+        return result
+
+
+multiprocess_metrics = MultiprocessMetrics(
+    os.path.join(ASR_MULTIPROCESS_DIR, "metrics.db") if ASR_MULTIPROCESS_DIR else "",
+    ASR_METRICS_PUBLISH_INTERVAL,
+)
+
+
+# Sherpa WebSocket 连接池
+class SherpaConnectionPool:
+    """到 Sherpa 服务的 WebSocket 长连接池
+
+    non_streaming_server.py 支持在同一连接上连续识别多段音频（直到收到 "Done"），
+    因此识别完成后连接放回池中复用，避免每个请求都重新握手。
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        min_size: int = 1,
+        max_size: int = 8,
+        idle_timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        ping_after: float = 10.0,
+        check_interval: float = 5.0,
+    ):
+        self.uri = uri
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.ping_after = ping_after  # 空闲超过该时长的连接在交付前先 ping 一次
+        self.check_interval = check_interval
+
+        self._idle = deque()  # (ws, 上次归还时间)，右端为最近归还
+        self._busy = set()
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+        self._reaper_task = None
+
+        self.connects_total = 0
+        self.reconnects_total = 0
+        self.evicted_total = 0
+        self.bytes_sent_total = 0
+        self.send_seconds_total = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._busy) + self._opening
+
+    def stats(self) -> dict:
+        return {
+            "uri": self.uri,
+            "open": len(self._idle) + len(self._busy),
+            "busy": len(self._busy),
+            "idle": len(self._idle),
+            "connecting": self._opening,
+            "waiting": self._waiting,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "connects_total": self.connects_total,
+            "reconnects_total": self.reconnects_total,
+            "evicted_total": self.evicted_total,
+            "bytes_sent_total": self.bytes_sent_total,
+            "send_throughput_mb_s": round(self.bytes_sent_total / self.send_seconds_total / 1e6, 1)
+            if self.send_seconds_total else 0.0,
+        }
+
+    def record_send(self, nbytes: int, seconds: float):
+        """累计发送字节数与耗时，用于统计发送吞吐"""
+        self.bytes_sent_total += nbytes
+        self.send_seconds_total += seconds
+
+    async def start(self):
+        """预建最小连接数并启动空闲回收任务"""
+        self._closed = False
+        await self._fill_min()
+        if self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._reaper())
+        logger.info(f"Sherpa 连接池已启动: {self.stats()}")
+
+    async def close(self):
+        """关闭连接池及其所有连接"""
+        self._closed = True
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+        async with self._cond:
+            conns = [ws for ws, _ in self._idle] + list(self._busy)
+            self._idle.clear()
+            self._busy.clear()
+            self._cond.notify_all()
+        await asyncio.gather(*(self._close_ws(ws) for ws in conns))
+        logger.info("Sherpa 连接池已关闭")
+
+    @asynccontextmanager
+    async def connection(self):
+        """借出一个可用连接；使用中出现异常时该连接会被丢弃而不是放回池中"""
+        ws = await self._acquire()
+        try:
+            yield ws
+        except BaseException:
+            await self._discard(ws)
+            raise
+        else:
+            await self._release(ws)
+
+    async def _connect(self):
+        ws = await asyncio.wait_for(websockets.connect(self.uri), self.connect_timeout)
+        self.connects_total += 1
+        return ws
+
+    async def _acquire(self):
+        while True:
+            async with self._cond:
+                self._waiting += 1
+                try:
+                    await self._cond.wait_for(
+                        lambda: self._closed or self._idle or self.size < self.max_size
+                    )
+                finally:
+                    self._waiting -= 1
+                if self._closed:
+                    raise ConnectionError("Sherpa 连接池已关闭")
+                if self._idle:
+                    ws, last_used = self._idle.pop()
+                    self._busy.add(ws)
+                else:
+                    ws, last_used = None, None
+                    self._opening += 1
+
+            if ws is None:
+                try:
+                    ws = await self._connect()
+                except BaseException:
+                    async with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+                    raise
+                async with self._cond:
+                    self._opening -= 1
+                    self._busy.add(ws)
+                return ws
+
+            try:
+                healthy = await self._is_healthy(ws, last_used)
+            except BaseException:
+                # 检查期间被取消（客户端断开、截止时间、对冲取消）：连接状态未知，丢弃以免一直占着 _busy
+                self._busy.discard(ws)
+                await self._discard(ws)
+                raise
+            if healthy:
+                return ws
+            logger.warning("Sherpa 连接已失效，丢弃并重新获取")
+            self.reconnects_total += 1
+            await self._discard(ws)
+
+    async def _is_healthy(self, ws, last_used: float) -> bool:
+        if ws.close_code is not None:
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            pong_waiter = await ws.ping()
+            await asyncio.wait_for(pong_waiter, self.connect_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _release(self, ws):
+        async with self._cond:
+            self._busy.discard(ws)
+            if not self._closed and ws.close_code is None:
+                self._idle.append((ws, time.monotonic()))
+                self._cond.notify()
+                return
+            self._cond.notify()
+        await self._close_ws(ws)
+
+    async def _discard(self, ws):
+        async with self._cond:
+            self._busy.discard(ws)
+            self._cond.notify()
+        await self._close_ws(ws)
+
+    async def _close_ws(self, ws):
+        try:
+            if ws.close_code is None:
+                await asyncio.wait_for(ws.send("Done"), 1.0)  # 通知服务器本连接传输结束
+            await asyncio.wait_for(ws.close(), 1.0)
+        except Exception:
+            pass
+
+    async def _fill_min(self, log_failure: bool = True):
+        while not self._closed and self.size < self.min_size:
+            async with self._cond:
+                self._opening += 1
+            try:
+                ws = await self._connect()
+            except Exception as e:
+                (logger.warning if log_failure else logger.debug)(f"预建 Sherpa 连接失败: {e}")
+                async with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                return
+            async with self._cond:
+                self._opening -= 1
+                self._idle.append((ws, time.monotonic()))
+                self._cond.notify()
+
+    async def _reaper(self):
+        """定期回收空闲过久的连接，并把连接数补足到最小值"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            expired = []
+            now = time.monotonic()
+            async with self._cond:
+                while (
+                    self._idle
+                    and self.size > self.min_size
+                    and now - self._idle[0][1] > self.idle_timeout
+                ):
+                    expired.append(self._idle.popleft()[0])
+                # 顺便剔除已被服务端关闭的空闲连接
+                alive = deque(item for item in self._idle if item[0].close_code is None)
+                expired.extend(ws for ws, _ in self._idle if ws.close_code is not None)
+                self._idle = alive
+            if expired:
+                self.evicted_total += len(expired)
+                logger.info(f"回收空闲 Sherpa 连接 {len(expired)} 个")
+                await asyncio.gather(*(self._close_ws(ws) for ws in expired))
+            await self._fill_min(log_failure=False)
+
+    async def probe(self) -> bool:
+        """建立一次新连接验证后端可用（不经过池，避免借到已失效的旧连接）"""
+        try:
+            ws = await asyncio.wait_for(websockets.connect(self.uri), self.connect_timeout)
+            await ws.close()
+            return True
+        except Exception:
+            return False
+
+
+def cleanup_stale_shm_segments() -> int:
+    """删除已退出的 API 进程遗留的共享内存段（进程被 SIGKILL 时 resource_tracker 也可能来不及回收）"""
+    try:
+        names = os.listdir(SHM_DIR)
+    except OSError:
+        return 0
+    removed = 0
+    for name in names:
+        if not name.startswith(SHM_SEGMENT_PREFIX):
+            continue
+        try:
+            pid = int(name[len(SHM_SEGMENT_PREFIX):].split("_", 1)[0])
+            os.kill(pid, 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except (ValueError, PermissionError):
+            continue
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.info(f"清理遗留共享内存段 {removed} 个")
+    return removed
+
+
+class _ShmChannel:
+    """一条到识别进程的 Unix socket 连接及其独占的共享内存段"""
+
+    __slots__ = ("reader", "writer", "shm", "last_used")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.shm = None
+        self.last_used = time.monotonic()
+
+    def ensure_segment(self, nbytes: int):
+        """段不够大时换一个更大的（按 2 的幂取整），旧段立即 unlink"""
+        if self.shm is not None and self.shm.size >= nbytes:
+            return self.shm
+        size = max(SHM_MIN_SEGMENT_BYTES, 1 << max(0, nbytes - 1).bit_length())
+        self.release_segment()
+        self.shm = shared_memory.SharedMemory(
+            name=f"{SHM_SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:12]}", create=True, size=size
+        )
+        return self.shm
+
+    def release_segment(self):
+        if self.shm is None:
+            return
+        shm, self.shm = self.shm, None
+        try:
+            shm.close()
+        except BufferError:
+            pass
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.release_segment()
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class SharedMemoryPool:
+    """到同机识别进程（shm_recognizer_worker.py）的连接池，样本经共享内存传递
+
+    每条 Unix socket 连接独占一块共享内存段：识别时把 float32 样本写入段内（唯一的一次复制），
+    socket 上只发送段名和样本数，识别进程映射同一段内存直接读取，不再经 WebSocket 分帧和回环网络。
+    接口与 SherpaConnectionPool 相同（start / close / probe / stats），由 SherpaBackend 按地址选择。
+    请求出错或被取消（截止时间、对冲落败）时连接和共享内存段一起丢弃，段立即 unlink；
+    识别进程只映射不删除，API 进程异常退出遗留的段在下次启动时清理。
+    """
+
+    def __init__(self, path: str, max_size: int = 8, idle_timeout: float = 60.0, connect_timeout: float = 5.0):
+        self.path = path
+        self.uri = f"unix:{path}"
+        self.min_size = 0
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+
+        self._idle = deque()  # 右端为最近归还
+        self._busy = set()
+        self._waiting = 0
+        self._closed = False
+        self._sem = asyncio.Semaphore(self.max_size)
+
+        self.connects_total = 0
+        self.reconnects_total = 0
+        self.evicted_total = 0
+        self.bytes_sent_total = 0
+        self.send_seconds_total = 0.0
+
+    def stats(self) -> dict:
+        channels = [*self._idle, *self._busy]
+        return {
+            "uri": self.uri,
+            "transport": "shm",
+            "open": len(channels),
+            "busy": len(self._busy),
+            "idle": len(self._idle),
+            "connecting": 0,
+            "waiting": self._waiting,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "connects_total": self.connects_total,
+            "reconnects_total": self.reconnects_total,
+            "evicted_total": self.evicted_total,
+            "bytes_sent_total": self.bytes_sent_total,
+            "send_throughput_mb_s": round(self.bytes_sent_total / self.send_seconds_total / 1e6, 1)
+            if self.send_seconds_total else 0.0,
+            "shm_bytes": sum(ch.shm.size for ch in channels if ch.shm is not None),
+        }
+
+    async def start(self):
+        self._closed = False
+        await asyncio.to_thread(cleanup_stale_shm_segments)
+        logger.info(f"共享内存识别连接池已启动: {self.uri}")
+
+    async def close(self):
+        self._closed = True
+        for ch in [*self._idle, *self._busy]:
+            ch.close()
+        self._idle.clear()
+        self._busy.clear()
+        logger.info(f"共享内存识别连接池已关闭: {self.uri}")
+
+    async def probe(self) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), self.connect_timeout)
+            writer.close()
+            return True
+        except Exception:
+            return False
+
+    async def _acquire(self) -> _ShmChannel:
+        now = time.monotonic()
+        while self._idle:
+            ch = self._idle.pop()
+            if now - ch.last_used <= self.idle_timeout and not ch.reader.at_eof():
+                self._busy.add(ch)
+                return ch
+            # 空闲过久的连接连同其共享内存段一起释放，避免长期占用内存
+            self.evicted_total += 1
+            ch.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(self.path, limit=1 << 20), self.connect_timeout
+        )
+        self.connects_total += 1
+        ch = _ShmChannel(reader, writer)
+        self._busy.add(ch)
+        return ch
+
+    async def recognize(self, samples: np.ndarray, sample_rate: int) -> str:
+        if self._closed:
+            raise ConnectionError("共享内存识别连接池已关闭")
+        self._waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self._waiting -= 1
+        ch = None
+        reusable = False
+        try:
+            ch = await self._acquire()
+            samples = np.ascontiguousarray(samples, dtype=np.float32)
+            start = time.perf_counter()
+            with stage_timer("sherpa_send"):
+                shm = ch.ensure_segment(samples.nbytes)
+                view = np.ndarray(len(samples), dtype=np.float32, buffer=shm.buf)
+                view[:] = samples
+                del view  # 不保留对段内存的引用，段才能在丢弃连接时关闭
+                header = {"shm": shm.name, "samples": len(samples), "sample_rate": sample_rate}
+                ch.writer.write(json.dumps(header).encode() + b"\n")
+                await ch.writer.drain()
+            self.bytes_sent_total += samples.nbytes
+            self.send_seconds_total += time.perf_counter() - start
+
+            with stage_timer("sherpa_wait"):
+                line = await ch.reader.readline()
+            if not line:
+                raise ConnectionError("识别进程关闭了连接")
+            reply = json.loads(line)
+            reusable = True
+            if "error" in reply:
+                raise RuntimeError(f"识别进程出错: {reply['error']}")
+            return reply["text"]
+        except (ConnectionError, OSError, ValueError) as e:
+            if ch is not None:
+                self.reconnects_total += 1
+            if isinstance(e, ValueError):
+                raise ConnectionError(f"识别进程返回了无法解析的响应: {e}") from e
+            raise
+        finally:
+            if ch is not None:
+                self._busy.discard(ch)
+                if reusable and not self._closed:
+                    ch.last_used = time.monotonic()
+                    self._idle.append(ch)
+                else:
+                    ch.close()
+            self._sem.release()
+
+
+# 单个 Sherpa 后端的负载与健康状态
+class SherpaBackend:
+    """一个 non_streaming_server.py 实例（或 unix: 地址的同机识别进程）：独立的连接池、在途音频时长和摘除状态"""
+
+    def __init__(self, address: str):
+        self.address = address
+        if address.startswith("unix:"):
+            self.pool = SharedMemoryPool(
+                address[len("unix:"):],
+                max_size=SHERPA_POOL_MAX_SIZE,
+                idle_timeout=SHERPA_POOL_IDLE_TIMEOUT,
+                connect_timeout=SHERPA_CONNECT_TIMEOUT,
+            )
+        else:
+            self.pool = SherpaConnectionPool(
+                f"ws://{address}",
+                min_size=SHERPA_POOL_MIN_SIZE,
+                max_size=SHERPA_POOL_MAX_SIZE,
+                idle_timeout=SHERPA_POOL_IDLE_TIMEOUT,
+                connect_timeout=SHERPA_CONNECT_TIMEOUT,
+            )
+        self.outstanding_seconds = 0.0  # 在途请求的音频总时长
+        self.outstanding_requests = 0
+        self.consecutive_failures = 0
+        self.eject_count = 0
+        self.ejected_until = None  # 摘除期结束时间；None 表示在线
+        self.recovered_at = None   # 最近一次恢复时间，用于慢启动
+
+        self.trial_in_flight = False  # 摘除期满后放行的半开试探请求
+        self.last_probe_ok = None
+        self.last_probe_at = None
+
+        self.requests_total = 0
+        self.failures_total = 0
+        self.timeouts_total = 0
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until is not None
+
+    async def send(self, samples: np.ndarray, sample_rate: int) -> str:
+        if isinstance(self.pool, SharedMemoryPool):
+            return await self.pool.recognize(samples, sample_rate)
+        return await send_to_sherpa(samples, sample_rate, self.pool)
+
+    def weight(self, now: float) -> float:
+        """恢复后的后端在慢启动期内按时间线性提升权重"""
+        if self.recovered_at is None or SHERPA_SLOW_START_SECONDS <= 0:
+            return 1.0
+        elapsed = now - self.recovered_at
+        if elapsed >= SHERPA_SLOW_START_SECONDS:
+            self.recovered_at = None
+            return 1.0
+        return max(0.05, elapsed / SHERPA_SLOW_START_SECONDS)
+
+    def score(self, now: float, audio_seconds: float) -> float:
+        """接收这个请求后的加权在途音频时长，越小越优先"""
+        return (self.outstanding_seconds + audio_seconds) / self.weight(now)
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.ejected:
+            self.reinstate()
+
+    def record_failure(self, trial: bool = False):
+        self.failures_total += 1
+        self.consecutive_failures += 1
+        if self.ejected:
+            if trial:
+                self.eject()  # 半开试探失败，重新摘除（时长翻倍）
+        elif self.consecutive_failures >= SHERPA_EJECT_FAILURES:
+            self.eject()
+
+    def eject(self):
+        duration = min(SHERPA_EJECT_SECONDS * (2 ** self.eject_count), SHERPA_EJECT_MAX_SECONDS)
+        self.eject_count += 1
+        self.ejected_until = time.monotonic() + duration
+        self.recovered_at = None
+        logger.warning(f"摘除 Sherpa 后端 {self.address} {duration:.0f} 秒（连续失败 {self.consecutive_failures} 次）")
+
+    def reinstate(self):
+        self.ejected_until = None
+        self.consecutive_failures = 0
+        self.recovered_at = time.monotonic()
+        logger.info(f"Sherpa 后端 {self.address} 探测恢复，进入慢启动")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "address": self.address,
+            "state": "ejected" if self.ejected else ("warming" if self.recovered_at else "up"),
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - now), 1) if self.ejected else 0.0,
+            "last_probe_ok": self.last_probe_ok,
+            "last_probe_age_seconds": round(now - self.last_probe_at, 1) if self.last_probe_at else None,
+            "weight": round(self.weight(now), 3),
+            "outstanding_requests": self.outstanding_requests,
+            "outstanding_audio_seconds": round(self.outstanding_seconds, 3),
+            "requests_total": self.requests_total,
+            "failures_total": self.failures_total,
+            "timeouts_total": self.timeouts_total,
+            "pool": self.pool.stats(),
+        }
+
+
+class RecognitionTimeoutError(Exception):
+    """识别超过截止时间仍未返回"""
+
+
+class CircuitOpenError(Exception):
+    """所有后端都处于摘除期（断路器打开），请求直接失败而不再等待连接超时"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LatencyTracker:
+    """最近若干次识别的归一化耗时（秒 / 秒音频，不足 1 秒的音频按 1 秒计），用于估计对冲等待时间"""
+
+    def __init__(self, window: int = SHERPA_HEDGE_WINDOW):
+        self._values = deque(maxlen=max(1, window))
+        self._sorted = []
+        self._stale = 0
+
+    @staticmethod
+    def _scale(audio_seconds: float) -> float:
+        return max(1.0, audio_seconds)
+
+    def record(self, latency: float, audio_seconds: float):
+        self._values.append(latency / self._scale(audio_seconds))
+        self._stale += 1
+
+    def quantile(self, percentile: float) -> Optional[float]:
+        if len(self._values) < SHERPA_HEDGE_MIN_SAMPLES:
+            return None
+        # 排序结果最多滞后 1/20 个窗口，避免每个请求都重新排序
+        if not self._sorted or self._stale >= max(1, len(self._values) // 20):
+            self._sorted = sorted(self._values)
+            self._stale = 0
+        idx = min(len(self._sorted) - 1, int(len(self._sorted) * percentile / 100))
+        return self._sorted[idx]
+
+    def expected(self, audio_seconds: float, percentile: float) -> Optional[float]:
+        q = self.quantile(percentile)
+        return None if q is None else q * self._scale(audio_seconds)
+
+
+# 多 Sherpa 后端负载均衡
+class SherpaBalancer:
+    """按最少在途音频时长路由请求
+
+    被动健康检查：连续连接失败的后端被摘除，摘除时长指数退避；
+    主动健康检查：后台定期探测所有后端，摘除期满且探测成功的后端以慢启动方式重新接入。
+    断路器：所有后端都被摘除时请求直接失败（open）；摘除期满的后端每次只放行一个试探请求（half_open），
+    成功即恢复，失败则重新摘除。
+    每个请求有截止时间；超过近期耗时的 SHERPA_HEDGE_PERCENTILE 分位仍未返回时，
+    向另一个后端（只有一个后端时为同一后端的另一条连接）发送对冲请求，先返回者胜出，另一个被取消。
+    """
+
+    def __init__(self, addresses):
+        self.backends = [SherpaBackend(a) for a in addresses]
+        if not self.backends:
+            raise ValueError("未配置 Sherpa 后端")
+        self._health_task = None
+        self.latency = LatencyTracker()
+        self._hedge_tokens = 1.0
+
+        self.requests_total = 0
+        self.hedges_total = 0
+        self.hedge_wins_total = 0      # 对冲请求先返回
+        self.hedge_losses_total = 0    # 原请求先返回，对冲请求被取消
+        self.hedge_failures_total = 0  # 两者都失败
+        self.hedges_throttled_total = 0  # 达到对冲比例上限而未发送
+        self.deadline_exceeded_total = 0
+        self.circuit_rejections_total = 0
+
+    @classmethod
+    def from_config(cls, spec: str):
+        return cls([a.strip() for a in spec.split(",") if a.strip()])
+
+    def stats(self) -> list:
+        return [b.stats() for b in self.backends]
+
+    def hedge_stats(self) -> dict:
+        quantile = self.latency.quantile(SHERPA_HEDGE_PERCENTILE) if SHERPA_HEDGE_PERCENTILE > 0 else None
+        return {
+            "requests_total": self.requests_total,
+            "hedges_total": self.hedges_total,
+            "hedge_rate": round(self.hedges_total / self.requests_total, 4) if self.requests_total else 0.0,
+            "hedge_wins_total": self.hedge_wins_total,
+            "hedge_losses_total": self.hedge_losses_total,
+            "hedge_failures_total": self.hedge_failures_total,
+            "hedges_throttled_total": self.hedges_throttled_total,
+            "deadline_exceeded_total": self.deadline_exceeded_total,
+            "hedge_after_seconds_per_audio_second": round(quantile, 4) if quantile is not None else None,
+        }
+
+    @staticmethod
+    def deadline_for(audio_seconds: float) -> Optional[float]:
+        if SHERPA_DEADLINE_RTF <= 0:
+            return None
+        return SHERPA_DEADLINE_BASE + audio_seconds * SHERPA_DEADLINE_RTF
+
+    async def start(self):
+        await asyncio.gather(*(b.pool.start() for b in self.backends))
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(b.pool.close() for b in self.backends))
+
+    def circuit_state(self) -> str:
+        now = time.monotonic()
+        if any(not b.ejected for b in self.backends):
+            return "closed"
+        if any(now >= b.ejected_until and not b.trial_in_flight for b in self.backends):
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> int:
+        """断路器打开时，距离最早一个后端摘除期满的秒数"""
+        now = time.monotonic()
+        waits = [b.ejected_until - now for b in self.backends if b.ejected]
+        return max(1, math.ceil(min(waits))) if waits else 1
+
+    def pick(self, audio_seconds: float, exclude=()) -> Optional[SherpaBackend]:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if not b.ejected and b not in exclude]
+        if not candidates:
+            # 所有后端都被摘除：摘除期已满的后端放行一个试探请求
+            trial = sorted(
+                (b for b in self.backends
+                 if b not in exclude and now >= b.ejected_until and not b.trial_in_flight),
+                key=lambda b: b.ejected_until,
+            )
+            if not trial:
+                return None
+            trial[0].trial_in_flight = True
+            return trial[0]
+        return min(candidates, key=lambda b: (b.score(now, audio_seconds), b.outstanding_requests))
+
+    async def recognize(self, samples: np.ndarray, sample_rate: int) -> str:
+        """选择负载最低的后端识别；连接类错误时换一个后端重试，必要时发送对冲请求"""
+        audio_seconds = len(samples) / sample_rate
+        timeout = self.deadline_for(audio_seconds)
+        deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        self.requests_total += 1
+        # 每个请求积累 SHERPA_HEDGE_BUDGET 个对冲额度，限制对冲请求给后端带来的额外负载
+        self._hedge_tokens = min(10.0, self._hedge_tokens + SHERPA_HEDGE_BUDGET)
+
+        hedge_after = None
+        if SHERPA_HEDGE_PERCENTILE > 0:
+            hedge_after = self.latency.expected(audio_seconds, SHERPA_HEDGE_PERCENTILE)
+        if hedge_after is None or (timeout is not None and hedge_after >= timeout):
+            return await self._recognize_with_failover(samples, sample_rate, audio_seconds, deadline, [])
+
+        primary_tried = []
+        primary = asyncio.create_task(
+            self._recognize_with_failover(samples, sample_rate, audio_seconds, deadline, primary_tried)
+        )
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=max(SHERPA_HEDGE_MIN_DELAY, hedge_after))
+            if done:
+                return primary.result()
+            if self._hedge_tokens < 1:
+                self.hedges_throttled_total += 1
+                return await primary
+            self._hedge_tokens -= 1
+            self.hedges_total += 1
+            hedge = asyncio.create_task(
+                self._recognize_with_failover(
+                    samples, sample_rate, audio_seconds, deadline, [], avoid=list(primary_tried)
+                )
+            )
+            logger.debug(
+                f"识别 {audio_seconds:.2f} 秒音频超过 {hedge_after * 1000:.0f} ms 未返回，发送对冲请求"
+            )
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins_total += 1
+                        else:
+                            self.hedge_losses_total += 1
+                        return task.result()
+                    error = task.exception()
+            self.hedge_failures_total += 1
+            raise error
+        finally:
+            # 输掉的请求被取消，其连接在连接池中被丢弃
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _recognize_with_failover(self, samples: np.ndarray, sample_rate: int, audio_seconds: float,
+                                       deadline: Optional[float], tried: list, avoid=()) -> str:
+        loop = asyncio.get_running_loop()
+        while True:
+            backend = self.pick(audio_seconds, exclude=[*tried, *avoid])
+            if backend is None and avoid:
+                backend = self.pick(audio_seconds, exclude=tried)
+            if backend is None:
+                if not tried:
+                    self.circuit_rejections_total += 1
+                    raise CircuitOpenError("所有 Sherpa 后端暂时不可用", self.retry_after())
+                raise ConnectionError("没有可用的 Sherpa 后端")
+            tried.append(backend)
+            trial = backend.trial_in_flight
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    raise RecognitionTimeoutError(f"识别超过截止时间 {self.deadline_for(audio_seconds):.1f} 秒")
+            backend.outstanding_seconds += audio_seconds
+            backend.outstanding_requests += 1
+            backend.requests_total += 1
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(backend.send(samples, sample_rate), timeout)
+                backend.record_success()
+                self.latency.record(time.perf_counter() - start, audio_seconds)
+                return result
+            except (websockets.ConnectionClosed, ConnectionError, OSError, asyncio.TimeoutError) as e:
+                backend.record_failure(trial)
+                if deadline is not None and loop.time() >= deadline:
+                    # 识别卡住：连接已随取消被丢弃，计入后端失败次数以便摘除
+                    backend.timeouts_total += 1
+                    self.deadline_exceeded_total += 1
+                    logger.warning(
+                        f"Sherpa 后端 {backend.address} 识别 {audio_seconds:.2f} 秒音频超过截止时间 "
+                        f"{self.deadline_for(audio_seconds):.1f} 秒"
+                    )
+                    raise RecognitionTimeoutError(
+                        f"识别超过截止时间 {self.deadline_for(audio_seconds):.1f} 秒"
+                    ) from e
+                SHERPA_CONNECTION_ERRORS_TOTAL.inc(backend.address)
+                if len(tried) >= len(self.backends):
+                    raise
+                logger.warning(f"Sherpa 后端 {backend.address} 失败，切换后端重试: {e}")
+            finally:
+                backend.outstanding_seconds -= audio_seconds
+                backend.outstanding_requests -= 1
+                if trial:
+                    backend.trial_in_flight = False
+
+    async def probe(self, backend: SherpaBackend) -> bool:
+        """建立一次新连接验证后端可用"""
+        return await backend.pool.probe()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(SHERPA_HEALTH_INTERVAL)
+            now = time.monotonic()
+            for backend in self.backends:
+                if backend.ejected and now < backend.ejected_until:
+                    continue
+                ok = await self.probe(backend)
+                backend.last_probe_ok = ok
+                backend.last_probe_at = time.monotonic()
+                if backend.ejected:
+                    if ok:
+                        backend.reinstate()
+                    else:
+                        backend.eject()
+                elif ok:
+                    backend.record_success()
+                else:
+                    logger.warning(f"Sherpa 后端 {backend.address} 主动探测失败")
+                    backend.record_failure()
+
+
+
+# 转录结果缓存配置
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TRANSCRIPTION_CACHE_TTL = float(os.environ.get("TRANSCRIPTION_CACHE_TTL", "3600"))
+TRANSCRIPTION_CACHE_DB = os.environ.get("TRANSCRIPTION_CACHE_DB", "")  # 为空时不启用磁盘缓存
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+
+
+# 以音频内容哈希为键的转录结果缓存
+class TranscriptionCache:
+    """两级转录结果缓存：内存 LRU（字节预算 + TTL）和可选的 SQLite 磁盘层
+
+    磁盘层在服务重启后依然有效，命中后会回填到内存层。
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, db_path: str = ""):
+        self.max_bytes = max(0, max_bytes)
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()  # key -> (过期时间, 字节数, 结果)
+        self._bytes = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(content, **params) -> str:
+        """音频内容与影响结果的表单参数共同决定缓存键
+
+        content 为音频字节，或已分块更新过的 hashlib.sha256 对象。
+        """
+        h = hashlib.sha256(content) if isinstance(content, (bytes, bytearray, memoryview)) else content.copy()
+        for name in sorted(params):
+            h.update(f"\0{name}={params[name]}".encode())
+        return h.hexdigest()
+
+    def open(self):
+        if not self.db_path:
+            return
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transcriptions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM transcriptions WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+        logger.info(f"转录结果磁盘缓存: {self.db_path}")
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "disk": bool(self._db),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, size, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            self._drop(key)
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._db_get, key)
+            if row is not None:
+                value, expires_at = json.loads(row[0]), row[1]
+                self._put_memory(key, value, expires_at)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: dict):
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, value, expires_at)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._db_put, key, json.dumps(value, ensure_ascii=False), expires_at)
+            except Exception as e:
+                logger.warning(f"写入磁盘缓存失败: {e}")
+
+    def _put_memory(self, key: str, value: dict, expires_at: float):
+        size = len(json.dumps(value, ensure_ascii=False).encode()) + len(key)
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _db_get(self, key: str):
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT value, expires_at FROM transcriptions WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+
+    def _db_put(self, key: str, value: str, expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcriptions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+
+
+transcription_cache = TranscriptionCache(
+    TRANSCRIPTION_CACHE_MAX_BYTES,
+    TRANSCRIPTION_CACHE_TTL,
+    TRANSCRIPTION_CACHE_DB,
+)
+
+
+# 识别后端: websocket（经由 non_streaming_server.py）或 local（进程内 sherpa-onnx 引擎）
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "websocket").lower()
+
+# 模型注册表配置
+ASR_MODELS_CONFIG = os.environ.get("ASR_MODELS_CONFIG", "")  # JSON 模型清单；为空时只注册默认的 SenseVoice 模型
+ASR_DEFAULT_MODEL = os.environ.get("ASR_DEFAULT_MODEL", "sense-voice")
+ASR_MODEL_ALIASES = os.environ.get("ASR_MODEL_ALIASES", "whisper-1")  # 默认模型的别名，兼容 OpenAI 客户端
+ASR_MODEL_MEMORY_BUDGET = int(os.environ.get("ASR_MODEL_MEMORY_BUDGET_MB", "4096")) * 1024 * 1024
+ASR_MODEL_MEMORY_FACTOR = float(os.environ.get("ASR_MODEL_MEMORY_FACTOR", "1.3"))  # 加载后内存 / 模型文件大小
+ASR_MODEL_RETRY_SECONDS = float(os.environ.get("ASR_MODEL_RETRY_SECONDS", "60"))  # 加载失败后多久再尝试
+
+
+class ModelNotFoundError(Exception):
+    """请求的模型未注册"""
+
+
+class ModelUnavailableError(Exception):
+    """模型无法加载（文件缺失、内存预算被正在使用的模型占满等），且没有可回退的 WebSocket 后端"""
+
+
+class AsrModel:
+    """注册表中的一个模型：进程内引擎（按需加载）和/或一组 Sherpa WebSocket 后端
+
+    两者都配置时优先使用进程内引擎，加载或识别失败时回退到 WebSocket 后端。
+    """
+
+    def __init__(self, model_id: str, engine: Optional[LocalRecognizerEngine] = None,
+                 balancer: Optional[SherpaBalancer] = None, aliases=(), pinned: bool = False,
+                 memory_bytes: Optional[int] = None, description: str = "", owned_by: str = "sherpa-onnx"):
+        if engine is None and balancer is None:
+            raise ValueError(f"模型 {model_id} 既没有模型文件也没有 WebSocket 后端")
+        self.id = model_id
+        self.engine = engine
+        self.balancer = balancer
+        self.aliases = [a for a in aliases if a and a != model_id]
+        self.pinned = pinned
+        self.description = description
+        self.owned_by = owned_by
+        self.created = int(time.time())
+        self._memory_bytes = memory_bytes
+
+        self.users = 0          # 正在使用进程内引擎的识别数，大于 0 时不会被淘汰
+        self.last_used = 0.0
+        self.load_error = None
+        self.load_failed_at = 0.0
+        self.load_seconds = 0.0
+        self.loads_total = 0
+        self.evictions_total = 0
+        self.requests_total = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        if self._memory_bytes is None:
+            self._memory_bytes = int(self.engine.model_bytes() * ASR_MODEL_MEMORY_FACTOR) if self.engine else 0
+        return self._memory_bytes
+
+    @property
+    def loaded(self) -> bool:
+        return self.engine is not None and self.engine.ready
+
+    @property
+    def backend(self) -> str:
+        return "+".join(name for name, part in (("local", self.engine), ("websocket", self.balancer)) if part)
+
+    def available(self) -> bool:
+        """能否接受请求：引擎已加载或可加载，或 WebSocket 后端的断路器未打开"""
+        return self.retry_after() is None
+
+    def retry_after(self) -> Optional[int]:
+        """不可用时返回预计多少秒后再试，可用时返回 None"""
+        if self.loaded:
+            return None
+        waits = []
+        if self.engine is not None and sherpa_onnx is not None:
+            if self.load_error is None:
+                return None
+            wait = ASR_MODEL_RETRY_SECONDS - (time.monotonic() - self.load_failed_at)
+            if wait <= 0:
+                return None
+            waits.append(math.ceil(wait))
+        if self.balancer is not None:
+            if self.balancer.circuit_state() != "open":
+                return None
+            waits.append(self.balancer.retry_after())
+        return min(waits) if waits else int(ASR_MODEL_RETRY_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "id": self.id,
+            "aliases": self.aliases,
+            "backend": self.backend,
+            "pinned": self.pinned,
+            "loaded": self.loaded,
+            "available": self.available(),
+            "memory_bytes": self.memory_bytes,
+            "in_use": self.users,
+            "requests_total": self.requests_total,
+            "loads_total": self.loads_total,
+            "evictions_total": self.evictions_total,
+            "load_seconds": round(self.load_seconds, 3),
+            "load_error": self.load_error,
+            "engine": self.engine.stats() if self.engine else None,
+            "sherpa_backends": [b.address for b in self.balancer.backends] if self.balancer else [],
+            "circuit": self.balancer.circuit_state() if self.balancer else None,
+            "circuit_rejections_total": self.balancer.circuit_rejections_total if self.balancer else 0,
+            "hedging": self.balancer.hedge_stats() if self.balancer else None,
+        }
+
+
+class ModelRegistry:
+    """按 model 字段路由到不同模型；进程内模型首次使用时加载，超出内存预算时按 LRU 淘汰
+
+    pinned 模型在启动时预加载且不会被淘汰；正在识别的模型也不会被淘汰。
+    加载串行进行，避免多个模型同时加载时预算计算失准。
+    """
+
+    def __init__(self, models: list, default_id: str, memory_budget: int):
+        self.models = {}
+        self._names = {}
+        for model in models:
+            if model.id in self._names:
+                raise ValueError(f"模型 ID 重复: {model.id}")
+            self.models[model.id] = model
+            for name in [model.id, *model.aliases]:
+                if name in self._names:
+                    raise ValueError(f"模型名称重复: {name}")
+                self._names[name] = model
+        if default_id not in self._names:
+            raise ValueError(f"默认模型未注册: {default_id}")
+        self.default = self._names[default_id]
+        self.memory_budget = memory_budget
+        self._load_lock = asyncio.Lock()
+
+    @classmethod
+    def from_config(cls, path: str = ASR_MODELS_CONFIG):
+        if not path:
+            return cls([_default_model()], ASR_DEFAULT_MODEL, ASR_MODEL_MEMORY_BUDGET)
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        if isinstance(config, list):
+            config = {"models": config}
+        models = [_model_from_config(entry) for entry in config["models"]]
+        default_id = os.environ.get("ASR_DEFAULT_MODEL") or config.get("default") or models[0].id
+        budget = config.get("memory_budget_mb")
+        budget = ASR_MODEL_MEMORY_BUDGET if budget is None or "ASR_MODEL_MEMORY_BUDGET_MB" in os.environ \
+            else int(budget) * 1024 * 1024
+        return cls(models, default_id, budget)
+
+    def resolve(self, name: Optional[str]) -> AsrModel:
+        if not name:
+            return self.default
+        model = self._names.get(name)
+        if model is None:
+            raise ModelNotFoundError(f"未知模型: {name}，可用模型: {', '.join(self._names)}")
+        return model
+
+    def balancers(self) -> list:
+        return [m.balancer for m in self.models.values() if m.balancer is not None]
+
+    @property
+    def loaded_bytes(self) -> int:
+        return sum(m.memory_bytes for m in self.models.values() if m.loaded)
+
+    def stats(self) -> dict:
+        return {
+            "default": self.default.id,
+            "memory_budget_bytes": self.memory_budget,
+            "loaded_bytes": self.loaded_bytes,
+            "models": [m.stats() for m in self.models.values()],
+        }
+
+    async def start(self):
+        await asyncio.gather(*(b.start() for b in self.balancers()))
+        for model in self.models.values():
+            if model.pinned and model.engine is not None:
+                try:
+                    await self.ensure_loaded(model)
+                except Exception as e:
+                    logger.warning(f"预加载模型 {model.id} 失败: {e}")
+
+    async def close(self):
+        await asyncio.gather(*(b.close() for b in self.balancers()))
+        for model in self.models.values():
+            if model.engine is not None:
+                model.engine.close()
+
+    async def ensure_loaded(self, model: AsrModel):
+        if model.loaded:
+            return
+        async with self._load_lock:
+            if model.loaded:
+                return
+            if model.load_error and time.monotonic() - model.load_failed_at < ASR_MODEL_RETRY_SECONDS:
+                raise ModelUnavailableError(f"模型 {model.id} 加载失败: {model.load_error}")
+            self._make_room(model)
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(model.engine.load)
+            except Exception as e:
+                model.load_error = str(e)
+                model.load_failed_at = time.monotonic()
+                logger.warning(f"模型 {model.id} 加载失败，{ASR_MODEL_RETRY_SECONDS:.0f} 秒内不再尝试: {e}")
+                raise ModelUnavailableError(f"模型 {model.id} 加载失败: {e}")
+            model.load_error = None
+            model.load_seconds = time.perf_counter() - start
+            model.loads_total += 1
+            model.last_used = time.monotonic()
+            logger.info(
+                f"模型 {model.id} 已加载，耗时 {model.load_seconds:.2f} 秒，"
+                f"已加载模型共占用约 {self.loaded_bytes / 1e6:.0f} / {self.memory_budget / 1e6:.0f} MB"
+            )
+
+    def _make_room(self, model: AsrModel):
+        """按最久未使用的顺序淘汰模型，直到能放下 model"""
+        needed = model.memory_bytes
+        candidates = sorted(
+            (m for m in self.models.values() if m.loaded and not m.pinned and m.users == 0 and m is not model),
+            key=lambda m: m.last_used,
+        )
+        while self.loaded_bytes + needed > self.memory_budget and candidates:
+            victim = candidates.pop(0)
+            victim.engine.close()
+            victim.evictions_total += 1
+            logger.info(f"淘汰模型 {victim.id}（约 {victim.memory_bytes / 1e6:.0f} MB），为 {model.id} 腾出内存")
+        if self.loaded_bytes + needed > self.memory_budget and not model.pinned:
+            raise ModelUnavailableError(
+                f"模型 {model.id} 需要约 {needed / 1e6:.0f} MB，超出内存预算且其他模型正在使用"
+            )
+
+    async def recognize(self, model: AsrModel, samples: np.ndarray, sample_rate: int) -> str:
+        model.requests_total += 1
+        if model.engine is not None:
+            model.users += 1
+            try:
+                await self.ensure_loaded(model)
+                model.last_used = time.monotonic()
+                return await model.engine.recognize(samples, sample_rate)
+            except Exception as e:
+                if model.balancer is None:
+                    raise
+                if not isinstance(e, ModelUnavailableError):
+                    logger.error(f"模型 {model.id} 进程内识别失败，回退到 Sherpa WebSocket: {e}")
+            finally:
+                model.users -= 1
+        return await model.balancer.recognize(samples, sample_rate)
+
+
+def _engine_args(entry: dict) -> dict:
+    return {
+        "workers": int(entry.get("workers", ASR_ENGINE_WORKERS)),
+        "num_threads": int(entry.get("num_threads", ASR_ENGINE_NUM_THREADS)),
+        "batch_window_ms": float(entry.get("batch_window_ms", ASR_BATCH_WINDOW_MS)),
+        "batch_max_size": int(entry.get("batch_max_size", ASR_BATCH_MAX_SIZE)),
+        "batch_max_audio_seconds": float(entry.get("batch_max_audio_seconds", ASR_BATCH_MAX_AUDIO_SECONDS)),
+        "name": entry["id"],
+    }
+
+
+def _default_model() -> AsrModel:
+    """未提供模型清单时的默认模型：与 start_voice_services.sh 启动的同一套 SenseVoice"""
+    engine = None
+    if ASR_BACKEND == "local":
+        engine = LocalRecognizerEngine(
+            "sense_voice",
+            {"model": SENSE_VOICE_MODEL, "tokens": SENSE_VOICE_TOKENS, "use_itn": SENSE_VOICE_USE_ITN},
+            workers=ASR_ENGINE_WORKERS,
+            num_threads=ASR_ENGINE_NUM_THREADS,
+            name=ASR_DEFAULT_MODEL,
+        )
+    return AsrModel(
+        ASR_DEFAULT_MODEL,
+        engine=engine,
+        balancer=SherpaBalancer.from_config(SHERPA_BACKENDS),
+        aliases=[a.strip() for a in ASR_MODEL_ALIASES.split(",") if a.strip()],
+        pinned=True,
+        description=os.path.basename(os.path.normpath(SENSE_VOICE_DIR)),
+    )
+
+
+def _model_from_config(entry: dict) -> AsrModel:
+    """模型清单中的一项，例如:
+
+    {"id": "paraformer-zh", "type": "paraformer",
+     "args": {"paraformer": "./paraformer/model.int8.onnx", "tokens": "./paraformer/tokens.txt"},
+     "backends": "127.0.0.1:6010", "pinned": false, "memory_mb": 300, "aliases": ["zh"]}
+    """
+    engine = None
+    if entry.get("type"):
+        engine = LocalRecognizerEngine(entry["type"], entry.get("args", {}), **_engine_args(entry))
+    backends = entry.get("backends")
+    if isinstance(backends, str):
+        backends = [a.strip() for a in backends.split(",") if a.strip()]
+    memory_mb = entry.get("memory_mb")
+    return AsrModel(
+        entry["id"],
+        engine=engine,
+        balancer=SherpaBalancer(backends) if backends else None,
+        aliases=entry.get("aliases", ()),
+        pinned=bool(entry.get("pinned", False)),
+        memory_bytes=int(memory_mb * 1024 * 1024) if memory_mb is not None else None,
+        description=entry.get("description", ""),
+        owned_by=entry.get("owned_by", "sherpa-onnx"),
+    )
+
+
+model_registry = ModelRegistry.from_config()
+
+
+# 应用生命周期：启动时建立连接池，退出时关闭
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await multiprocess_metrics.start()
+    transcription_cache.open()
+    # 连接各模型的 Sherpa 后端，预加载 pinned 的进程内模型
+    await model_registry.start()
+    await transcription_jobs.start()
+    await health_monitor.start()
+    # 预热完成前 /ready 返回 503；阻塞模式下完成后才开始接受连接
+    await startup_warmup.start(block=ASR_WARMUP_BLOCKING)
+    try:
+        yield
+    finally:
+        await startup_warmup.close()
+        await decoder_pool.close()
+        await health_monitor.close()
+        await transcription_jobs.close()
+        await model_registry.close()
+        transcription_cache.close()
+        await multiprocess_metrics.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # 添加CORS中间件
 app.add_middleware(
@@ -28,119 +1599,1482 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有头部
 )
 
-SHERPA_WS_HOST = "127.0.0.1"
-SHERPA_WS_PORT = 6006
+
+# 声明的请求体超过上传上限时，在解析表单、暂存文件之前直接拒绝
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    content_length = request.headers.get("content-length")
+    # 批量任务一次可提交多个文件，使用单独的总量上限
+    limit = ASR_JOBS_MAX_BYTES if request.url.path == "/v1/audio/jobs" else ASR_MAX_UPLOAD_BYTES
+    if request.method == "POST" and content_length and content_length.isdigit() \
+            and int(content_length) > limit + 64 * 1024:  # 留出 multipart 头部的余量
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"文件大小超过上限 {limit} 字节"},
+            headers={"Access-Control-Allow-Origin": "*"},
+        )
+    return await call_next(request)
 
 # 检查 ffmpeg 是否可用
 def check_ffmpeg():
-    """检查系统是否安装了 ffmpeg"""
+    """检查系统是否安装了 ffmpeg；健康监控运行时直接使用其定期刷新的结果"""
+    if health_monitor.ffmpeg_available is not None:
+        return health_monitor.ffmpeg_available
     return shutil.which("ffmpeg") is not None
 
-# 使用 ffmpeg 转换音频格式为 WAV
-def convert_to_wav(input_path: str, output_path: str):
-    """使用 ffmpeg 将音频文件转换为 WAV 格式"""
+# ffmpeg 解码输出的目标采样率
+TARGET_SAMPLE_RATE = 16000
+
+# 这些容器格式的索引（moov atom）可能位于文件末尾，需要可随机访问的输入，
+# ffmpeg 无法从管道解码，只能回退到临时文件
+SEEKABLE_INPUT_SUFFIXES = {".mp4", ".m4a", ".m4b", ".mov", ".3gp", ".3g2"}
+
+def _ffmpeg_decode_cmd(input_arg: str):
+    """构造把输入解码为 16kHz 单声道 s16le 原始 PCM 并写到 stdout 的 ffmpeg 命令"""
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", input_arg,
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ar", str(TARGET_SAMPLE_RATE),  # 采样率设为 16kHz
+        "-ac", "1",                      # 单声道
+        "pipe:1",
+    ]
+
+def pcm16_to_float32(pcm: bytes) -> np.ndarray:
+    """将 s16le 原始 PCM 转为 [-1, 1) 区间的 float32 样本"""
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    samples *= 1.0 / 32768.0
+    return samples
+
+# ffmpeg 解码池配置：并发进程数默认等于 CPU 核数，排队上限之外的请求直接返回 429
+FFMPEG_MAX_WORKERS = int(os.environ.get("FFMPEG_MAX_WORKERS", str(os.cpu_count() or 1)))
+FFMPEG_MAX_QUEUE = int(os.environ.get("FFMPEG_MAX_QUEUE", str(FFMPEG_MAX_WORKERS * 4)))
+FFMPEG_TIMEOUT = float(os.environ.get("FFMPEG_TIMEOUT", "120"))  # ffmpeg 持续无输出的最长时间
+# 预先启动、阻塞在 stdin 上等待输入的 ffmpeg 进程数，请求到来时省去进程创建和初始化，0 为关闭
+FFMPEG_PRESPAWN = int(os.environ.get("FFMPEG_PRESPAWN", str(min(2, FFMPEG_MAX_WORKERS))))
+
+# 上传限制与流式处理配置
+ASR_MAX_UPLOAD_BYTES = int(os.environ.get("ASR_MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+ASR_MAX_AUDIO_SECONDS = float(os.environ.get("ASR_MAX_AUDIO_SECONDS", str(4 * 3600)))
+ASR_PCM_WINDOW_SECONDS = float(os.environ.get("ASR_PCM_WINDOW_SECONDS", "30"))  # 每次做 VAD 切分的音频窗口
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PCM_READ_SIZE = 64 * 1024
+
+
+class DecoderBusyError(Exception):
+    """解码池排队已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"解码队列已满，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class AudioDecodeError(Exception):
+    """上传的音频无法解码"""
+
+
+class AudioTooLongError(Exception):
+    """音频时长超过 ASR_MAX_AUDIO_SECONDS"""
+
+
+# 有界 ffmpeg 解码池
+class DecoderPool:
+    """限制同时运行的 ffmpeg 进程数，并对排队长度做准入控制
+
+    另外保留 prespawn 个预先启动的管道输入 ffmpeg 进程，取走一个后在后台补足。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, prespawn: int = 0):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.prespawn_size = max(0, prespawn)
+        self._sem = asyncio.Semaphore(self.max_workers)
+        self._durations = deque(maxlen=100)  # 最近的解码耗时，用于估算 Retry-After
+        self._spares = deque()
+        self._spawning = 0
+        self._refill_task = None
+        self._closed = False
+        self.spares_used_total = 0
+
+        self.active = 0
+        self.queued = 0
+        self.completed_total = 0
+        self.rejected_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def retry_after(self) -> int:
+        """按平均解码耗时估算排到队尾需要等待的秒数"""
+        avg = sum(self._durations) / len(self._durations) if self._durations else 1.0
+        return max(1, int(np.ceil(avg * (self.queued + 1) / self.max_workers)))
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "completed_total": self.completed_total,
+            "rejected_total": self.rejected_total,
+            "avg_wait_seconds": round(self.wait_seconds_total / self.completed_total, 4) if self.completed_total else 0.0,
+            "max_wait_seconds": round(self.wait_seconds_max, 4),
+            "spares": len(self._spares),
+            "spares_used_total": self.spares_used_total,
+        }
+
+    async def prespawn(self):
+        """补足预先启动的 ffmpeg 进程"""
+        self._closed = False
+        while len(self._spares) + self._spawning < self.prespawn_size and not self._closed:
+            self._spawning += 1
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *_ffmpeg_decode_cmd("pipe:0"),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            except OSError as e:
+                logger.warning(f"预先启动 ffmpeg 失败: {e}")
+                return
+            finally:
+                self._spawning -= 1
+            if self._closed:
+                proc.kill()
+                await proc.wait()
+                return
+            self._spares.append(proc)
+
+    def take_spare(self):
+        """取一个预先启动的管道输入 ffmpeg 进程，没有时返回 None；取走后在后台补足"""
+        proc = None
+        while self._spares:
+            candidate = self._spares.popleft()
+            if candidate.returncode is None:
+                proc = candidate
+                self.spares_used_total += 1
+                break
+        if self.prespawn_size and not self._closed and (self._refill_task is None or self._refill_task.done()):
+            self._refill_task = asyncio.create_task(self.prespawn())
+        return proc
+
+    async def close(self):
+        self._closed = True
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+            self._refill_task = None
+        while self._spares:
+            proc = self._spares.popleft()
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个解码名额；队列已满时抛出 DecoderBusyError"""
+        if self._sem.locked() and self.queued >= self.max_queue:
+            self.rejected_total += 1
+            raise DecoderBusyError(self.retry_after())
+
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.queued -= 1
+        wait = time.monotonic() - start
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        timer = _request_timer.get()
+        if timer is not None:
+            timer.add("decode_wait", wait)
+        if wait > 0.1:
+            logger.debug(f"解码排队等待 {wait:.3f} 秒")
+
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed_total += 1
+            self._durations.append(time.monotonic() - start)
+            self._sem.release()
+
+
+decoder_pool = DecoderPool(FFMPEG_MAX_WORKERS, FFMPEG_MAX_QUEUE, FFMPEG_PRESPAWN)
+
+
+async def hash_upload(upload: UploadFile):
+    """分块计算上传内容的 sha256，返回 (hashlib 对象, 字节数)，读完后回到文件开头"""
+    h = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        h.update(chunk)
+        size += len(chunk)
+        if size > ASR_MAX_UPLOAD_BYTES:
+            break
+    await upload.seek(0)
+    return h, size
+
+
+async def _copy_upload_to_stdin(upload: UploadFile, proc):
+    """把上传内容分块写入 ffmpeg stdin；ffmpeg 读得慢时 drain 会阻塞，内存中最多一个分块"""
     try:
-        cmd = [
-            "ffmpeg", "-i", input_path,
-            "-ar", "16000",  # 采样率设为 16kHz
-            "-ac", "1",      # 单声道
-            "-sample_fmt", "s16",  # 16-bit 采样
-            "-y",            # 覆盖输出文件
-            output_path
-        ]
-        
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            check=True
-        )
-        
-        logger.info(f"音频转换成功: {input_path} -> {output_path}")
-        return True
-        
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            proc.stdin.write(chunk)
+            await proc.stdin.drain()
+        proc.stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg 提前退出，错误由退出码体现
+        pass
+
+
+async def _spool_upload_to_temp(upload: UploadFile, suffix: str) -> str:
+    """分块复制到临时文件，供需要随机访问的容器格式使用"""
+    tmp = await asyncio.to_thread(tempfile.NamedTemporaryFile, delete=False, suffix=suffix)
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.to_thread(tmp.write, chunk)
+    finally:
+        tmp.close()
+    return tmp.name
+
+
+async def _iter_ffmpeg_pcm(upload: UploadFile, temp_suffix: Optional[str] = None):
+    """运行 ffmpeg 并逐块产出 float32 样本
+
+    temp_suffix 为 None 时上传内容经 stdin 管道输入，否则先落盘为临时文件。
+    调用方停止消费时 ffmpeg 的 stdout 写满后自然阻塞，输入随之停止读取。
+    """
+    temp_path = None
+    writer = None
+    stderr = None
+    proc = None
+    try:
+        if temp_suffix is None:
+            cmd = _ffmpeg_decode_cmd("pipe:0")
+            proc = decoder_pool.take_spare()
+        else:
+            temp_path = await _spool_upload_to_temp(upload, temp_suffix)
+            cmd = _ffmpeg_decode_cmd(temp_path)
+        if proc is None:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=subprocess.PIPE if temp_path is None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        stderr = asyncio.create_task(proc.stderr.read())
+        if temp_path is None:
+            writer = asyncio.create_task(_copy_upload_to_stdin(upload, proc))
+
+        leftover = b""
+        while True:
+            chunk = await asyncio.wait_for(proc.stdout.read(PCM_READ_SIZE), FFMPEG_TIMEOUT)
+            if not chunk:
+                break
+            chunk = leftover + chunk if leftover else chunk
+            usable = len(chunk) - len(chunk) % 2
+            leftover = chunk[usable:]
+            if usable:
+                yield pcm16_to_float32(chunk[:usable])
+
+        if writer is not None:
+            await writer
+        returncode = await asyncio.wait_for(proc.wait(), FFMPEG_TIMEOUT)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, None, await stderr)
+    finally:
+        # 超时、出错或请求被取消时不留下孤儿进程
+        for task in (writer, stderr):
+            if task is not None and not task.done():
+                task.cancel()
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if temp_path and os.path.exists(temp_path):
+            try:
+                os.unlink(temp_path)
+            except Exception as e:
+                logger.warning(f"删除临时文件失败: {e}")
+
+
+# 使用 ffmpeg 流式解码上传的音频
+async def iter_decoded_upload(upload: UploadFile, file_suffix: str):
+    """上传内容分块送入 ffmpeg，边解码边产出 16kHz float32 样本块
+
+    需要随机访问的容器格式（或管道解码在产出任何样本前就失败时）回退到临时文件输入。
+    ffmpeg 运行期间占用 decoder_pool 名额，输出读完即释放，不等待识别结束。
+    排队已满时抛出 DecoderBusyError，解码失败时抛出 AudioDecodeError。
+    """
+    produced = False
+    try:
+        async with decoder_pool.slot():
+            if file_suffix not in SEEKABLE_INPUT_SUFFIXES:
+                try:
+                    async with aclosing(_iter_ffmpeg_pcm(upload)) as chunks:
+                        async for samples in chunks:
+                            produced = True
+                            yield samples
+                    return
+                except subprocess.CalledProcessError as e:
+                    if produced:
+                        raise
+                    logger.warning(f"ffmpeg 管道解码失败，回退到临时文件: {e.stderr.decode(errors='replace').strip()}")
+                    await upload.seek(0)
+
+            async with aclosing(_iter_ffmpeg_pcm(upload, file_suffix)) as chunks:
+                async for samples in chunks:
+                    yield samples
+
     except subprocess.CalledProcessError as e:
         logger.error(f"ffmpeg 转换失败: {e}")
-        logger.error(f"ffmpeg stderr: {e.stderr}")
-        return False
-    except Exception as e:
+        logger.error(f"ffmpeg stderr: {e.stderr.decode(errors='replace')}")
+        FFMPEG_FAILURES_TOTAL.inc("error")
+        raise AudioDecodeError("音频格式转换失败") from e
+    except asyncio.TimeoutError as e:
+        logger.error(f"ffmpeg 解码超时 ({FFMPEG_TIMEOUT} 秒无输出)")
+        FFMPEG_FAILURES_TOTAL.inc("timeout")
+        raise AudioDecodeError("音频格式转换超时") from e
+    except OSError as e:
         logger.error(f"音频转换异常: {e}")
-        return False
+        FFMPEG_FAILURES_TOTAL.inc("error")
+        raise AudioDecodeError(f"音频格式转换失败: {e}") from e
+
+# 进程内重采样配置：每侧 16 个过零点的 Kaiser 窗 sinc，阻带衰减约 80dB
+RESAMPLE_ZERO_CROSSINGS = 16
+RESAMPLE_ROLLOFF = 0.94
+RESAMPLE_KAISER_BETA = 8.6
+
+
+# 进程内多相重采样
+@functools.lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """设计 Kaiser 窗 sinc 低通滤波器并按相位拆分，返回形状为 (up, 每相抽头数) 的系数矩阵
+
+    每相系数已按时间倒序排列，可以直接与输入的滑动窗口做点积。
+    """
+    factor = max(up, down)
+    half = RESAMPLE_ZERO_CROSSINGS * factor
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    cutoff = RESAMPLE_ROLLOFF * 0.5 / factor  # 归一化到上采样后的采样率
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(len(n), RESAMPLE_KAISER_BETA) * up
+    per_phase = -(-len(taps) // up)
+    padded = np.zeros(per_phase * up)
+    padded[:len(taps)] = taps
+    # 第 p 相的第 k 个系数是 taps[p + k * up]，作用于输入 x[n - k]
+    return np.ascontiguousarray(padded.reshape(per_phase, up).T[:, ::-1], dtype=np.float32)
+
+
+class PolyphaseResampler:
+    """按有理数比例 up/down 流式重采样，结果与一次性处理整段音频一致
+
+    输出 y[m] 以上采样域中的 t = m * down + 滤波器延迟 为中心，按 t 的相位选择一组系数，
+    对输入的滑动窗口（不复制的视图）做矩阵乘法；每块只保留滤波器长度的历史样本。
+    """
+
+    def __init__(self, in_rate: int, out_rate: int):
+        g = math.gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.filters = _polyphase_filter(self.up, self.down)
+        self.taps = self.filters.shape[1]
+        self._delay = RESAMPLE_ZERO_CROSSINGS * max(self.up, self.down)  # 滤波器中心在上采样域的位置
+        self._buf = np.zeros(self.taps - 1, dtype=np.float32)  # 输入历史，首样本的绝对下标为 _buf_start
+        self._buf_start = -(self.taps - 1)
+        self._consumed = 0  # 已输入的样本数
+        self._produced = 0  # 已输出的样本数
+
+    def _run(self, n_out: int) -> np.ndarray:
+        """计算 [_produced, n_out) 的输出"""
+        m0 = self._produced
+        if n_out <= m0:
+            return np.zeros(0, dtype=np.float32)
+        out = np.empty(n_out - m0, dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(self._buf, self.taps)
+        for j in range(min(self.up, n_out - m0)):
+            t = (m0 + j) * self.down + self._delay
+            first = t // self.up - (self.taps - 1) - self._buf_start
+            count = len(range(j, n_out - m0, self.up))
+            rows = windows[first:first + count * self.down:self.down]
+            out[j::self.up] = rows @ self.filters[t % self.up]
+        self._produced = n_out
+        # 丢弃之后不再需要的历史样本
+        t_next = self._produced * self.down + self._delay
+        keep_from = t_next // self.up - (self.taps - 1) - self._buf_start
+        if keep_from > 0:
+            self._buf = self._buf[keep_from:].copy()
+            self._buf_start += keep_from
+        return out
 
-# 读取 wav 文件，返回 float32 数组和采样率
-def read_wave(wav_path):
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return samples
+        self._buf = np.concatenate((self._buf, samples.astype(np.float32, copy=False)))
+        self._consumed += len(samples)
+        # 只输出滤波器窗口右端的输入已经到达的样本
+        n_out = max(0, (self._consumed * self.up - self._delay - 1) // self.down + 1)
+        return self._run(n_out)
+
+    def flush(self) -> np.ndarray:
+        """输入结束：以零补齐滤波器右侧，输出剩余样本"""
+        if self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        self._buf = np.concatenate((self._buf, np.zeros(self.taps, dtype=np.float32)))
+        n_out = -(-self._consumed * self.up // self.down)
+        return self._run(n_out)
+
+
+# WAV 解析：内存映射 + 分块向量化转换
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+_WAV_SAMPLE_TYPES = {
+    (WAVE_FORMAT_PCM, 8): ("u1", 1.0 / 128),
+    (WAVE_FORMAT_PCM, 16): ("<i2", 1.0 / 32768),
+    (WAVE_FORMAT_PCM, 24): ("<i4", 1.0 / 2 ** 23),  # 按 3 字节步长读取，见 _wav_chunk_to_mono
+    (WAVE_FORMAT_PCM, 32): ("<i4", 1.0 / 2 ** 31),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): ("<f4", 1.0),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): ("<f8", 1.0),
+}
+
+
+class WavInfo(NamedTuple):
+    format_tag: int
+    channels: int
+    sample_rate: int
+    bits: int
+    block_align: int
+    data_offset: int
+    n_frames: int
+
+
+def parse_wav_header(buf) -> WavInfo:
+    """遍历 RIFF 块找到 fmt 和 data，支持 WAVE_FORMAT_EXTENSIBLE；格式不支持时抛出 ValueError"""
+    if len(buf) < 12 or bytes(buf[0:4]) != b"RIFF" or bytes(buf[8:12]) != b"WAVE":
+        raise ValueError("不是 RIFF/WAVE 文件")
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk_id = bytes(buf[pos:pos + 4])
+        size = struct.unpack_from("<I", buf, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            tag, channels, sample_rate, _, block_align, bits = struct.unpack_from("<HHIIHH", buf, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                tag = struct.unpack_from("<H", buf, body + 24)[0]  # SubFormat GUID 的前两字节
+            if (tag, bits) not in _WAV_SAMPLE_TYPES:
+                raise ValueError(f"不支持的 WAV 格式: format_tag={tag:#x}, bits={bits}")
+            if channels < 1 or block_align != channels * bits // 8 or not 1000 <= sample_rate <= 384000:
+                raise ValueError(f"无效的 WAV 参数: channels={channels}, block_align={block_align}, rate={sample_rate}")
+            fmt = (tag, channels, sample_rate, bits, block_align)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("data 块位于 fmt 块之前")
+            # 边录边写的 WAV 常把长度记为 0 或 0xFFFFFFFF，以文件实际长度为准
+            available = len(buf) - body
+            if size == 0 or size > available:
+                size = available
+            return WavInfo(*fmt, data_offset=body, n_frames=size // fmt[4])
+        pos = body + size + (size & 1)
+    raise ValueError("WAV 文件缺少 data 块")
+
+
+def _map_audio_file(source):
+    """把路径或文件对象映射为只读缓冲区；仍在内存中的小文件直接读出"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # SpooledTemporaryFile 未超过阈值时内容在内存中，fileno() 会强制落盘，不如直接读
+    if getattr(source, "_rolled", True):
+        try:
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+    position = source.tell()
+    source.seek(0)
     try:
-        with wave.open(wav_path, "rb") as wf:
-            # 记录音频文件信息
-            channels = wf.getnchannels()
-            sample_width = wf.getsampwidth()
-            sample_rate = wf.getframerate()
-            n_frames = wf.getnframes()
-            
-            logger.info(f"音频信息: 通道数={channels}, 采样宽度={sample_width}, 采样率={sample_rate}, 帧数={n_frames}")
-            
-            frames = wf.readframes(n_frames)
-            
-            # 处理16-bit音频数据
-            if sample_width == 2:  # 16-bit
-                samples = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
-            else:
-                raise ValueError(f"不支持的采样宽度: {sample_width}")
-            
-            # 如果是多通道，取平均值转为单通道
-            if channels > 1:
-                samples = samples.reshape(-1, channels)
-                samples = np.mean(samples, axis=1)
-            
-            return samples, sample_rate
-            
+        return source.read()
+    finally:
+        source.seek(position)  # 调用方（如准入估算）读取后，后续解码仍从原位置读起
+
+
+def _wav_chunk_to_mono(buf, info: WavInfo, start: int, n_frames: int) -> np.ndarray:
+    """把 [start, start + n_frames) 帧转换为单声道 float32，只分配输出数组大小的内存"""
+    dtype, scale = _WAV_SAMPLE_TYPES[(info.format_tag, info.bits)]
+    offset = info.data_offset + start * info.block_align
+    count = n_frames * info.channels
+    if info.bits == 24:
+        # 从每个样本前一个字节开始按 4 字节读取（步长 3），算术右移 8 位即得到符号扩展后的样本
+        data = np.ndarray((count,), dtype="<i4", buffer=buf, offset=offset - 1, strides=(3,)) >> 8
+        scale = 1.0 / 2 ** 23
+    else:
+        data = np.frombuffer(buf, dtype, count, offset)
+    # 逐声道累加到 float32 输出，比 reshape 后按轴求均值少一个整段大小的中间数组
+    mono = data[0::info.channels].astype(np.float32)
+    for c in range(1, info.channels):
+        mono += data[c::info.channels]
+    if info.bits == 8:
+        mono -= 128.0 * info.channels
+    mono *= scale / info.channels
+    return mono
+
+
+def iter_wav_samples(buf, info: WavInfo, target_rate: int = TARGET_SAMPLE_RATE):
+    """分块产出转换为单声道并重采样到 target_rate 的 float32 样本"""
+    frames_per_chunk = max(1, UPLOAD_CHUNK_SIZE // info.block_align)
+    resampler = PolyphaseResampler(info.sample_rate, target_rate) if info.sample_rate != target_rate else None
+    mapped = isinstance(buf, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED")
+    if mapped:
+        buf.madvise(mmap.MADV_SEQUENTIAL)
+    for start in range(0, info.n_frames, frames_per_chunk):
+        samples = _wav_chunk_to_mono(buf, info, start, min(frames_per_chunk, info.n_frames - start))
+        if mapped:
+            # 已转换的页不再需要，释放出常驻内存，长文件的 RSS 不随文件大小增长
+            done = (info.data_offset + (start + frames_per_chunk) * info.block_align) // mmap.PAGESIZE * mmap.PAGESIZE
+            if done:
+                buf.madvise(mmap.MADV_DONTNEED, 0, min(done, len(buf) // mmap.PAGESIZE * mmap.PAGESIZE))
+        if resampler is not None:
+            samples = resampler.process(samples)
+        if len(samples):
+            yield samples
+    if resampler is not None:
+        tail = resampler.flush()
+        if len(tail):
+            yield tail
+
+
+def _close_mapping(buf):
+    if isinstance(buf, mmap.mmap):
+        try:
+            buf.close()
+        except BufferError:
+            # 仍有样本视图引用映射时交给垃圾回收
+            pass
+
+
+# 读取 wav 文件（路径或文件对象），返回 16kHz 单声道 float32 数组和采样率
+def read_wave(wav_file, target_rate: int = TARGET_SAMPLE_RATE):
+    buf = _map_audio_file(wav_file)
+    try:
+        info = parse_wav_header(buf)
+        logger.debug(f"音频信息: {info}")
+        chunks = list(iter_wav_samples(buf, info, target_rate))
+        samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        return samples, target_rate
     except Exception as e:
         logger.error(f"读取音频文件失败: {e}")
         raise
+    finally:
+        _close_mapping(buf)
+
+# 无需 ffmpeg 即可读取的内容类型 / 扩展名
+WAV_CONTENT_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"}
+RAW_PCM_CONTENT_TYPES = {"audio/pcm", "audio/l16", "audio/x-pcm", "audio/raw"}
+RAW_PCM_SUFFIXES = {".pcm", ".raw"}
+
+def parse_content_type(content_type: Optional[str]):
+    """解析形如 "audio/L16; rate=16000; channels=1" 的内容类型，返回 (小写 MIME, 参数字典)"""
+    if not content_type:
+        return "", {}
+    parts = [p.strip() for p in content_type.split(";")]
+    params = {}
+    for part in parts[1:]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            params[key.strip().lower()] = value.strip().strip('"')
+    return parts[0].lower(), params
+
+def upload_decode_params(mime: str, params: dict, file_suffix: str) -> dict:
+    """决定上传内容如何解码的参数，计入缓存键：同样的字节按不同采样率或声道解析是不同的音频
+
+    decoder 为 pcm（原始 PCM 直接转换）、wav（直接读取，无法解析时内容决定回退到 ffmpeg）或 ffmpeg。
+    """
+    if mime in RAW_PCM_CONTENT_TYPES or file_suffix in RAW_PCM_SUFFIXES:
+        return {
+            "decoder": "pcm",
+            "mime": mime,
+            "rate": params.get("rate", str(TARGET_SAMPLE_RATE)),
+            "channels": params.get("channels", "1"),
+        }
+    if file_suffix == ".wav" or mime in WAV_CONTENT_TYPES:
+        return {"decoder": "wav", "mime": mime}
+    return {"decoder": "ffmpeg", "mime": mime, "suffix": file_suffix}
+
+# 读取原始 16-bit PCM，返回 float32 数组和采样率
+def read_raw_pcm(content: bytes, mime: str, params: dict):
+    """audio/L16 按 RFC 2586 为大端序，其余原始 PCM 类型按小端 s16le 处理
+
+    采样率和声道数取自内容类型参数 rate / channels，默认 16kHz 单声道。
+    """
+    sample_rate = int(params.get("rate", TARGET_SAMPLE_RATE))
+    channels = int(params.get("channels", 1))
+    if not 8000 <= sample_rate <= 192000:
+        raise ValueError(f"不支持的采样率: {sample_rate}")
+    if not 1 <= channels <= 8:
+        raise ValueError(f"不支持的声道数: {channels}")
+
+    dtype = ">i2" if mime == "audio/l16" else "<i2"
+    n_values = len(content) // (2 * channels) * channels
+    samples = np.frombuffer(content, dtype=dtype, count=n_values).astype(np.float32)
+    samples *= 1.0 / 32768.0
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    logger.debug(f"原始 PCM: 采样率={sample_rate}, 通道数={channels}, 帧数={len(samples)}")
+    return samples, sample_rate
+
+
+# 不经过 ffmpeg 的上传音频分块读取
+def open_raw_pcm_upload(upload: UploadFile, mime: str, params: dict):
+    """返回 (采样率, 样本块异步迭代器)，非 16kHz 的输入在进程内重采样；参数无效时抛出 ValueError"""
+    _, sample_rate = read_raw_pcm(b"", mime, params)
+    frame_bytes = 2 * int(params.get("channels", 1))
+    chunk_size = UPLOAD_CHUNK_SIZE - UPLOAD_CHUNK_SIZE % frame_bytes
+    resampler = PolyphaseResampler(sample_rate, TARGET_SAMPLE_RATE) if sample_rate != TARGET_SAMPLE_RATE else None
+
+    async def chunks():
+        leftover = b""
+        while True:
+            data = await upload.read(chunk_size)
+            if not data:
+                break
+            data = leftover + data if leftover else data
+            usable = len(data) - len(data) % frame_bytes
+            leftover = data[usable:]
+            samples = read_raw_pcm(data[:usable], mime, params)[0]
+            yield resampler.process(samples) if resampler is not None else samples
+        if resampler is not None:
+            yield resampler.flush()
+
+    return TARGET_SAMPLE_RATE, chunks()
+
+
+def open_wave_upload(upload: UploadFile):
+    """返回 (采样率, 样本块异步迭代器)；只解析头部，样本从内存映射中按块转换并重采样到 16kHz
+
+    不支持的编码（如 ADPCM、A-law）抛出 ValueError，由调用方改用 ffmpeg。
+    """
+    buf = _map_audio_file(upload.file)
+    try:
+        info = parse_wav_header(buf)
+    except Exception:
+        _close_mapping(buf)
+        raise
+    logger.debug(f"音频信息: {info}")
+
+    async def chunks():
+        try:
+            for samples in iter_wav_samples(buf, info):
+                yield samples
+        finally:
+            _close_mapping(buf)
+
+    return TARGET_SAMPLE_RATE, chunks()
+
+# 单个 WebSocket 帧的字节数
+SHERPA_FRAME_SIZE = max(64, int(os.environ.get("SHERPA_FRAME_SIZE", "10240")))
+
+def iter_sherpa_frames(samples: np.ndarray, sample_rate: int, frame_size: int = SHERPA_FRAME_SIZE):
+    """按 sherpa 协议切分数据帧：采样率(4字节) + 样本字节大小(4字节) + 样本字节流
+
+    首帧携带头部和第一段样本（只复制这一帧），其余帧都是样本数组上的
+    memoryview 切片，不复制数据，总开销与音频长度成线性关系。
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    payload = memoryview(samples).cast("B")
+    header = sample_rate.to_bytes(4, "little") + payload.nbytes.to_bytes(4, "little")
+    first = max(0, frame_size - len(header))
+    yield header + payload[:first].tobytes()
+    for offset in range(first, payload.nbytes, frame_size):
+        yield payload[offset:offset + frame_size]
 
 # 按照 sherpa 的协议发送 wav 数据并获取返回
-async def send_to_sherpa(samples: np.ndarray, sample_rate: int) -> str:
-    uri = f"ws://{SHERPA_WS_HOST}:{SHERPA_WS_PORT}"
+async def send_to_sherpa(samples: np.ndarray, sample_rate: int, pool: SherpaConnectionPool) -> str:
+    # 复用池中的连接；若借到的连接在发送途中断开，则换一个新连接重试一次
+    for attempt in range(2):
+        acquired = False
+        try:
+            async with pool.connection() as ws:
+                acquired = True
+                # 分块发送
+                start = time.perf_counter()
+                sent = 0
+                with stage_timer("sherpa_send"):
+                    for frame in iter_sherpa_frames(samples, sample_rate):
+                        await ws.send(frame)
+                        sent += len(frame)
+                elapsed = time.perf_counter() - start
+                pool.record_send(sent, elapsed)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        f"发送数据包大小: {sent} 字节, 耗时 {elapsed * 1000:.1f} ms, "
+                        f"吞吐 {sent / max(elapsed, 1e-9) / 1e6:.1f} MB/s"
+                    )
+
+                # 等待识别结果；连接保持打开，归还连接池
+                with stage_timer("sherpa_wait"):
+                    result = await ws.recv()
+
+                logger.debug("收到识别结果: %s", result)
+                return result
+
+        except (websockets.ConnectionClosed, ConnectionError, OSError) as e:
+            # 建连本身失败说明后端不可用，不在同一后端上重试
+            if attempt == 0 and acquired:
+                logger.warning(f"Sherpa 连接中断，重试: {e}")
+                continue
+            logger.error(f"Sherpa WebSocket 连接失败: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Sherpa WebSocket 连接失败: {e}")
+            raise
+
+# 识别入口：按模型选择后端
+async def recognize(samples: np.ndarray, sample_rate: int, model: Optional[AsrModel] = None) -> str:
+    """进程内引擎可用时优先使用，出错时回退到该模型的 Sherpa WebSocket 后端；model 为空时使用默认模型"""
+    return await model_registry.recognize(model or model_registry.default, samples, sample_rate)
+
+# VAD 分段配置
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "1") == "1"
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", "30"))
+VAD_MIN_SILENCE_SECONDS = float(os.environ.get("VAD_MIN_SILENCE_SECONDS", "0.5"))  # 短于此的停顿不切分
+VAD_MAX_SEGMENT_SECONDS = float(os.environ.get("VAD_MAX_SEGMENT_SECONDS", "20"))
+VAD_PAD_SECONDS = float(os.environ.get("VAD_PAD_SECONDS", "0.2"))  # 语音段前后保留的余量
+VAD_THRESHOLD_DB = float(os.environ.get("VAD_THRESHOLD_DB", "-45"))  # 绝对能量门限 (dBFS)
+VAD_SNR_DB = float(os.environ.get("VAD_SNR_DB", "10"))  # 相对底噪的门限
+VAD_MAX_PARALLEL = int(os.environ.get("VAD_MAX_PARALLEL", "4"))  # 单个请求同时识别的分段数
+
+
+def frame_energy_db(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """逐帧平均能量 (dBFS)，用 einsum 计算避免生成整段平方数组"""
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    power = np.einsum("ij,ij->i", frames, frames) / frame_len
+    return 10.0 * np.log10(power + 1e-10)
+
+
+def _split_long_run(energy: np.ndarray, start: int, end: int, max_frames: int):
+    """把超长语音段在后半部分能量最低处切开（相近时取最靠后的帧），保证每段不超过 max_frames"""
+    while end - start > max_frames:
+        lo = start + max_frames // 2
+        window = energy[lo:start + max_frames]
+        cut = lo + int(np.flatnonzero(window <= window.min() + 3.0)[-1])
+        yield start, cut
+        start = cut
+    yield start, end
+
+
+# 基于能量的语音活动检测
+def detect_speech_segments(samples: np.ndarray, sample_rate: int) -> list:
+    """在静音处把音频切成不超过 VAD_MAX_SEGMENT_SECONDS 的语音段
+
+    返回 [(起始样本, 结束样本), ...]；纯静音部分不包含在内。
+    """
+    frame_len = max(1, int(sample_rate * VAD_FRAME_MS / 1000))
+    energy = frame_energy_db(samples, frame_len)
+    if len(energy) == 0:
+        return [(0, len(samples))] if len(samples) else []
+
+    # 自适应门限：高于底噪 VAD_SNR_DB，但不高于语音主体能量，也不低于绝对门限
+    noise_floor = float(np.percentile(energy, 10))
+    speech_level = float(np.percentile(energy, 95))
+    threshold = max(VAD_THRESHOLD_DB, min(noise_floor + VAD_SNR_DB, speech_level - 6.0))
+    voiced = energy > threshold
+    if not voiced.any():
+        return []
+
+    # 找出连续的语音帧区间 [start, end)
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    frame_seconds = frame_len / sample_rate
+    min_gap = max(1, int(VAD_MIN_SILENCE_SECONDS / frame_seconds))
+    pad = int(VAD_PAD_SECONDS / frame_seconds)
+    max_frames = max(1, int(VAD_MAX_SEGMENT_SECONDS / frame_seconds))
+
+    # 合并间隔小于最短静音的区间，过长的区间随后在停顿处切开
+    runs = []
+    for s, e in zip(starts, ends):
+        if runs and s - runs[-1][1] < min_gap:
+            runs[-1][1] = e
+        else:
+            runs.append([s, e])
+
+    segments = []
+    n_frames = len(energy)
+    for s, e in runs:
+        s = max(0, s - pad)
+        e = min(n_frames, e + pad)
+        if segments and s < segments[-1][1]:
+            s = segments[-1][1]
+        for a, b in _split_long_run(energy, s, e, max_frames):
+            segments.append((a, b))
+
+    result = [(int(a) * frame_len, int(b) * frame_len) for a, b in segments]
+    # 最后一个不完整的帧归入末段
+    if result and segments[-1][1] == n_frames:
+        result[-1] = (result[-1][0], len(samples))
+    return result
+
+
+def join_segment_texts(texts) -> str:
+    """拼接分段识别结果：中日韩文字直接相连，拉丁字母之间补空格"""
+    out = ""
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if out and out[-1].isascii() and out[-1].isalnum() and text[0].isascii() and text[0].isalnum():
+            out += " "
+        out += text
+    return out
+
+
+# 分窗口流式识别
+def _complete_segments(samples: np.ndarray, sample_rate: int, final: bool):
+    """切分一个窗口，返回 (可以发送的语音段, 需要留到下个窗口的起始样本)
+
+    末尾的语音段可能延续到下一窗口，只有其后已有足够静音的语音段才算完整。
+    """
+    if VAD_ENABLED:
+        with stage_timer("vad"):
+            bounds = detect_speech_segments(samples, sample_rate)
+    else:
+        step = max(1, int(VAD_MAX_SEGMENT_SECONDS * sample_rate))
+        bounds = [(a, min(a + step, len(samples))) for a in range(0, len(samples), step)]
+    if final:
+        return bounds, len(samples)
+
+    cutoff = len(samples) - int((VAD_MIN_SILENCE_SECONDS + VAD_PAD_SECONDS) * sample_rate)
+    complete = [(a, b) for a, b in bounds if b <= cutoff]
+    rest = bounds[len(complete):]
+    keep_from = rest[0][0] if rest else max(0, cutoff)
+    if complete:
+        keep_from = max(keep_from, complete[-1][1])
+    return complete, keep_from
+
+
+async def recognize_pcm_stream(chunks, sample_rate: int, model: Optional[AsrModel] = None) -> tuple[list, int]:
+    """按窗口累积样本块，VAD 切出完整语音段后立即并发识别
+
+    同时识别的语音段不超过 VAD_MAX_PARALLEL 个，满额时暂停读取输入，
+    因此无论音频多长，内存中只有一个窗口和正在识别的语音段。
+    返回 (segments, total)：segments 为按时间排序的 [{"start", "end", "text"}]（单位秒），
+    total 为读入的总样本数（含静音），total / sample_rate 即音频时长。
+    超过 ASR_MAX_AUDIO_SECONDS 时抛出 AudioTooLongError。
+    """
+    window = max(1, int(ASR_PCM_WINDOW_SECONDS * sample_rate))
+    max_samples = int(ASR_MAX_AUDIO_SECONDS * sample_rate)
+    sem = asyncio.Semaphore(max(1, VAD_MAX_PARALLEL))
+    tasks = []
+
+    async def run(segment: np.ndarray, start: int, end: int) -> dict:
+        try:
+            text = await recognize(segment, sample_rate, model)
+        finally:
+            sem.release()
+        return {"start": start / sample_rate, "end": end / sample_rate, "text": text.strip()}
+
+    async def dispatch(samples: np.ndarray, offset: int, final: bool) -> np.ndarray:
+        bounds, keep_from = _complete_segments(samples, sample_rate, final)
+        for a, b in bounds:
+            await sem.acquire()
+            tasks.append(asyncio.create_task(run(samples[a:b].copy(), offset + a, offset + b)))
+        return samples[keep_from:].copy(), offset + keep_from
+
+    pending = []
+    pending_len = 0
+    carry = np.zeros(0, dtype=np.float32)
+    offset = 0
+    total = 0
+    try:
+        while True:
+            with stage_timer("decode"):
+                samples = await anext(chunks, None)
+            if samples is None:
+                break
+            total += len(samples)
+            if total > max_samples:
+                raise AudioTooLongError(f"音频时长超过上限 {ASR_MAX_AUDIO_SECONDS:.0f} 秒")
+            pending.append(samples)
+            pending_len += len(samples)
+            if len(carry) + pending_len >= window:
+                carry, offset = await dispatch(np.concatenate([carry, *pending]), offset, final=False)
+                pending, pending_len = [], 0
+            # 已有语音段识别失败时不再继续读取
+            for task in tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+
+        if pending or len(carry):
+            await dispatch(np.concatenate([carry, *pending]), offset, final=True)
+        segments = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if len(segments) > 1:
+        logger.debug("VAD 切分为 %d 个语音段", len(segments))
+    return segments, total
+
+# 准入调度配置：交互式（网页短语音）与批量（长文件、批量任务）请求分级排队
+ASR_ADMISSION_ENABLED = os.environ.get("ASR_ADMISSION_ENABLED", "1") == "1"
+ASR_ADMISSION_MAX_CONCURRENT = int(os.environ.get("ASR_ADMISSION_MAX_CONCURRENT", "8"))  # 同时解码识别的请求数
+ASR_ADMISSION_MAX_QUEUE = int(os.environ.get("ASR_ADMISSION_MAX_QUEUE", "256"))  # 每个优先级的排队上限
+# 优先级从高到低，name:权重[:最大并发]；低优先级设并发上限，给高优先级留出名额
+ASR_PRIORITY_CLASSES = os.environ.get("ASR_PRIORITY_CLASSES", "interactive:8,bulk:1:4")
+ASR_PRIORITY_HEADER = "X-ASR-Priority"
+ASR_INTERACTIVE_MAX_SECONDS = float(os.environ.get("ASR_INTERACTIVE_MAX_SECONDS", "30"))  # 估计时长不超过此值视为交互式
+ASR_CLIENT_MAX_CONCURRENT = int(os.environ.get("ASR_CLIENT_MAX_CONCURRENT", "4"))  # 单个客户端同时处理的请求数，0 为不限
+ASR_CLIENT_AUDIO_SECONDS_PER_MINUTE = float(os.environ.get("ASR_CLIENT_AUDIO_SECONDS_PER_MINUTE", "0"))  # 0 为不限
+ASR_ADMISSION_SJF_AGING = float(os.environ.get("ASR_ADMISSION_SJF_AGING", "1.0"))  # 每排队 1 秒抵扣的估计时长，避免长文件饿死
+ASR_COMPRESSED_BYTES_PER_SECOND = float(os.environ.get("ASR_COMPRESSED_BYTES_PER_SECOND", "8000"))  # 压缩格式按 64kbps 估计时长
+# API Key 配置（JSON），例如 {"sk-etl": {"client": "etl", "class": "bulk", "weight": 2,
+#   "max_concurrent": 8, "audio_seconds_per_minute": 3600, "trusted": true}}
+# 未配置的 Key（如网页端共用的 Key）按客户端地址区分；trusted 的客户端可用 X-ASR-Priority 提升优先级
+ASR_API_KEYS = os.environ.get("ASR_API_KEYS", "")
+ADMISSION_WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+ADMISSION_WAIT_SECONDS = metrics.histogram(
+    "asr_admission_wait_seconds", "Time a transcription request waited for admission", ADMISSION_WAIT_BUCKETS,
+    labels=("class",),
+)
+
+
+class AdmissionRejectedError(Exception):
+    """排队已满或客户端超出音频时长配额"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionClient(NamedTuple):
+    """请求方身份及其配额；priority 为空时按音频时长决定优先级"""
+    id: str
+    priority: Optional[str] = None
+    weight: float = 1.0
+    max_concurrent: int = ASR_CLIENT_MAX_CONCURRENT
+    audio_seconds_per_minute: float = ASR_CLIENT_AUDIO_SECONDS_PER_MINUTE
+
+
+class _AdmissionWaiter:
+    __slots__ = ("client", "cost", "enqueued", "future", "seq")
+
+    def __init__(self, client, cost: float, seq: int):
+        self.client = client
+        self.cost = cost
+        self.enqueued = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+        self.seq = seq
+
+
+class _AdmissionClientState:
+    """客户端的在途请求数和最近一分钟的音频时长"""
+
+    def __init__(self, spec: AdmissionClient):
+        self.spec = spec
+        self.active = 0
+        self.window = deque()  # (时间, 音频秒数)
+        self.window_seconds = 0.0
+        self.admitted_total = 0
+        self.rejected_total = 0
+
+    def trim(self, now: float):
+        while self.window and now - self.window[0][0] >= 60:
+            self.window_seconds -= self.window.popleft()[1]
+
+    def charge(self, now: float, seconds: float):
+        self.window.append((now, seconds))
+        self.window_seconds += seconds
+
+    @property
+    def saturated(self) -> bool:
+        return 0 < self.spec.max_concurrent <= self.active
+
+
+class _AdmissionClass:
+    """一个优先级：各客户端的排队请求（客户端之间按虚拟时间加权公平，客户端内短任务优先）"""
+
+    def __init__(self, name: str, rank: int, weight: float, max_concurrent: int):
+        self.name = name
+        self.rank = rank
+        self.weight = max(weight, 1e-3)
+        self.max_concurrent = max_concurrent  # 0 为不限
+        self.vtime = 0.0
+        self.vclock = 0.0  # 最近一次放行的客户端虚拟时间
+        self.queues = {}  # 客户端 ID -> [排队请求]
+        self.client_vtime = {}
+        self.queued = 0
+        self.active = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.recent_waits = deque(maxlen=1000)
+
+    def stats(self) -> dict:
+        waits = sorted(self.recent_waits)
+        return {
+            "weight": self.weight,
+            "max_concurrent": self.max_concurrent,
+            "queued": self.queued,
+            "active": self.active,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "avg_wait_seconds": round(self.wait_seconds_total / self.admitted_total, 4) if self.admitted_total else 0.0,
+            "p95_wait_seconds": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0.0,
+            "max_wait_seconds": round(self.wait_seconds_max, 4),
+        }
+
+
+# 解码和识别之前的准入调度
+class AdmissionScheduler:
+    """限制同时解码识别的请求数，名额按优先级、客户端公平和任务长短分配
+
+    - 优先级之间按权重做加权公平排队（代价为估计的音频秒数），低优先级可设并发上限，
+      保证批量请求占满后仍有名额留给交互式请求；高优先级空闲时批量请求可用满其上限。
+    - 同一优先级内各客户端按权重公平分配，单个客户端的排队请求按估计时长短的优先（排队越久抵扣越多）。
+    - 客户端配额：同时处理的请求数（超出时排队）和每分钟音频秒数（超出时直接 429）。
+    """
+
+    def __init__(self, max_concurrent: int, classes, max_queue: int):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.classes = {}
+        for rank, (name, weight, limit) in enumerate(classes):
+            self.classes[name] = _AdmissionClass(name, rank, weight, limit)
+        if not self.classes:
+            raise ValueError("未配置优先级")
+        self.default_class = next(iter(self.classes))
+        self.lowest_class = list(self.classes)[-1]
+        self.clients = {}
+        self.active = 0
+        self._vclock = 0.0
+        self._seq = 0
+
+    @classmethod
+    def from_config(cls, spec: str = ASR_PRIORITY_CLASSES):
+        classes = []
+        for part in spec.split(","):
+            fields = [f.strip() for f in part.split(":")]
+            if not fields[0]:
+                continue
+            weight = float(fields[1]) if len(fields) > 1 and fields[1] else 1.0
+            limit = int(fields[2]) if len(fields) > 2 and fields[2] else 0
+            classes.append((fields[0], weight, limit))
+        return cls(ASR_ADMISSION_MAX_CONCURRENT, classes, ASR_ADMISSION_MAX_QUEUE)
+
+    def class_for(self, client: AdmissionClient, audio_seconds: float) -> str:
+        if client.priority in self.classes:
+            return client.priority
+        return self.default_class if audio_seconds <= ASR_INTERACTIVE_MAX_SECONDS else self.lowest_class
+
+    def stats(self) -> dict:
+        clients = sorted(self.clients.values(), key=lambda c: (-c.active, c.spec.id))
+        return {
+            "enabled": ASR_ADMISSION_ENABLED,
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "classes": {name: c.stats() for name, c in self.classes.items()},
+            "clients": [
+                {
+                    "client": c.spec.id,
+                    "active": c.active,
+                    "queued": sum(len(k.queues.get(c.spec.id, ())) for k in self.classes.values()),
+                    "audio_seconds_last_minute": round(c.window_seconds, 1),
+                    "admitted_total": c.admitted_total,
+                    "rejected_total": c.rejected_total,
+                }
+                for c in clients[:20]
+            ],
+        }
+
+    def _client_state(self, spec: AdmissionClient) -> _AdmissionClientState:
+        state = self.clients.get(spec.id)
+        if state is None:
+            state = self.clients[spec.id] = _AdmissionClientState(spec)
+        else:
+            state.spec = spec  # 配置可能已更新
+        return state
+
+    def _prune(self, state: _AdmissionClientState):
+        """空闲且配额窗口已清空的客户端不再保留状态"""
+        if state.active == 0 and not state.window and not any(
+            state.spec.id in k.queues for k in self.classes.values()
+        ):
+            self.clients.pop(state.spec.id, None)
+            for k in self.classes.values():
+                k.client_vtime.pop(state.spec.id, None)
+
+    def _reject(self, klass: _AdmissionClass, state: _AdmissionClientState, message: str, retry_after: int):
+        klass.rejected_total += 1
+        state.rejected_total += 1
+        self._prune(state)
+        raise AdmissionRejectedError(message, retry_after)
+
+    def _eligible(self, klass: _AdmissionClass) -> bool:
+        return klass.queued > 0 and (klass.max_concurrent <= 0 or klass.active < klass.max_concurrent)
+
+    def _pick(self, klass: _AdmissionClass) -> Optional[_AdmissionWaiter]:
+        """按虚拟时间选客户端，再取该客户端排队中（扣除等待抵扣后）最短的请求"""
+        best = None
+        for client_id, queue in klass.queues.items():
+            if self.clients[client_id].saturated:
+                continue
+            vtime = klass.client_vtime.get(client_id, 0.0)
+            if best is None or vtime < best[0]:
+                best = (vtime, client_id, queue)
+        if best is None:
+            return None
+        _, client_id, queue = best
+        now = time.monotonic()
+        waiter = min(queue, key=lambda w: (w.cost - ASR_ADMISSION_SJF_AGING * (now - w.enqueued), w.seq))
+        queue.remove(waiter)
+        if not queue:
+            del klass.queues[client_id]
+        state = self.clients[client_id]
+        klass.vclock = klass.client_vtime.get(client_id, 0.0)
+        klass.client_vtime[client_id] = klass.vclock + waiter.cost / max(state.spec.weight, 1e-3)
+        return waiter
+
+    def _dispatch(self):
+        while self.active < self.max_concurrent:
+            candidates = [k for k in self.classes.values() if self._eligible(k)]
+            waiter = None
+            while candidates:
+                klass = min(candidates, key=lambda k: (k.vtime, k.rank))
+                waiter = self._pick(klass)
+                if waiter is not None:
+                    break
+                candidates.remove(klass)  # 该优先级的排队客户端都已达到并发上限
+            if waiter is None:
+                return
+            self._vclock = klass.vtime
+            klass.vtime += waiter.cost / klass.weight
+            klass.queued -= 1
+            self._grant(klass, waiter)
+
+    def _grant(self, klass: _AdmissionClass, waiter: _AdmissionWaiter):
+        wait = time.monotonic() - waiter.enqueued
+        klass.active += 1
+        klass.admitted_total += 1
+        klass.wait_seconds_total += wait
+        klass.wait_seconds_max = max(klass.wait_seconds_max, wait)
+        klass.recent_waits.append(wait)
+        waiter.client.active += 1
+        waiter.client.admitted_total += 1
+        self.active += 1
+        ADMISSION_WAIT_SECONDS.observe(wait, klass.name)
+        waiter.future.set_result(wait)
+
+    def _release(self, klass: _AdmissionClass, state: _AdmissionClientState):
+        klass.active -= 1
+        state.active -= 1
+        self.active -= 1
+        self._dispatch()
+        self._prune(state)
+
+    def retry_after(self, klass: _AdmissionClass) -> int:
+        avg = klass.wait_seconds_total / klass.admitted_total if klass.admitted_total else 1.0
+        return max(1, math.ceil(avg))
+
+    @asynccontextmanager
+    async def slot(self, client: AdmissionClient, audio_seconds: float):
+        """等待一个解码识别名额；yield 后调用方可把 ticket["audio_seconds"] 改为实际时长以修正配额"""
+        klass = self.classes[self.class_for(client, audio_seconds)]
+        state = self._client_state(client)
+        now = time.monotonic()
+        state.trim(now)
+        quota = client.audio_seconds_per_minute
+        if quota > 0 and state.window_seconds > 0 and state.window_seconds + audio_seconds > quota:
+            retry_after = max(1, math.ceil(60 - (now - state.window[0][0])))
+            self._reject(klass, state, f"客户端 {client.id} 超出每分钟 {quota:g} 秒音频的配额", retry_after)
+        if klass.queued >= self.max_queue:
+            self._reject(klass, state, f"{klass.name} 队列已满", self.retry_after(klass))
+
+        self._seq += 1
+        waiter = _AdmissionWaiter(state, max(1.0, audio_seconds), self._seq)
+        if klass.queued == 0:
+            # 空闲的优先级重新开始排队时从当前虚拟时间起算，不积攒空闲期间的份额
+            klass.vtime = max(klass.vtime, self._vclock)
+        if client.id not in klass.queues:
+            klass.client_vtime[client.id] = max(klass.client_vtime.get(client.id, 0.0), klass.vclock)
+        klass.queues.setdefault(client.id, []).append(waiter)
+        klass.queued += 1
+        state.charge(now, audio_seconds)
+        self._dispatch()
+        try:
+            wait = await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(klass, state)  # 放行与取消同时发生
+            else:
+                queue = klass.queues.get(client.id)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    klass.queued -= 1
+                    if not queue:
+                        del klass.queues[client.id]
+                state.charge(time.monotonic(), -audio_seconds)  # 未处理的请求不计入配额
+                self._prune(state)
+            raise
+
+        timer = _request_timer.get()
+        if timer is not None:
+            timer.add("queue_wait", wait)
+        ticket = {"class": klass.name, "client": client.id, "wait": wait, "audio_seconds": audio_seconds}
+        try:
+            yield ticket
+        finally:
+            if ticket["audio_seconds"] != audio_seconds:
+                state.charge(time.monotonic(), ticket["audio_seconds"] - audio_seconds)
+            self._release(klass, state)
+
+
+def _load_api_keys(spec: str) -> dict:
+    if not spec:
+        return {}
+    try:
+        keys = json.loads(spec)
+    except ValueError as e:
+        raise ValueError(f"ASR_API_KEYS 不是有效的 JSON: {e}")
+    return {key: dict(entry or {}) for key, entry in keys.items()}
+
+
+admission = AdmissionScheduler.from_config()
+api_keys = _load_api_keys(ASR_API_KEYS)
+
+
+def admission_client(request: Request) -> AdmissionClient:
+    """按 API Key 配置识别客户端，未配置的 Key（如网页端共用的 Key）按客户端地址区分
+
+    X-ASR-Priority 只有 trusted 的 Key 可以任意指定，其余客户端只能用它把自己降为最低优先级。
+    """
+    auth = request.headers.get("authorization", "")
+    key = auth[7:].strip() if auth[:7].lower() == "bearer " else ""
+    entry = api_keys.get(key)
+    header = request.headers.get(ASR_PRIORITY_HEADER, "").strip().lower() or None
+    if header not in admission.classes or (header != admission.lowest_class and not (entry or {}).get("trusted")):
+        header = None
+    if entry is None:
+        address = request.client.host if request.client else "unknown"
+        return AdmissionClient(f"addr:{address}", header)
+    return AdmissionClient(
+        str(entry.get("client") or "key:" + hashlib.sha256(key.encode()).hexdigest()[:8]),
+        header or entry.get("class"),
+        float(entry.get("weight", 1.0)),
+        int(entry.get("max_concurrent", ASR_CLIENT_MAX_CONCURRENT)),
+        float(entry.get("audio_seconds_per_minute", ASR_CLIENT_AUDIO_SECONDS_PER_MINUTE)),
+    )
+
+
+def estimate_audio_seconds(upload: UploadFile, upload_bytes: int, mime: str, params: dict, file_suffix: str) -> float:
+    """解码前估计音频时长，用于选择优先级和排序：WAV 读头部，原始 PCM 按字节数，其余按码率估算"""
+    if mime in RAW_PCM_CONTENT_TYPES or file_suffix in RAW_PCM_SUFFIXES:
+        try:
+            rate = int(params.get("rate", TARGET_SAMPLE_RATE))
+            channels = int(params.get("channels", 1))
+            return upload_bytes / (2 * max(1, channels) * max(1, rate))
+        except ValueError:
+            return 0.0
+    if file_suffix == ".wav" or mime in WAV_CONTENT_TYPES:
+        buf = None
+        try:
+            buf = _map_audio_file(upload.file)
+            info = parse_wav_header(buf)
+            return info.n_frames / info.sample_rate
+        except Exception:
+            pass
+        finally:
+            if buf is not None:
+                _close_mapping(buf)
+    return upload_bytes / ASR_COMPRESSED_BYTES_PER_SECOND
+
+# 处理 OPTIONS 预检请求
+@app.options("/v1/audio/transcriptions")
+async def transcriptions_options():
+    return JSONResponse(
+        content={},
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
+            "Access-Control-Allow-Headers": "*",
+        }
+    )
+
+# 转录一个上传文件（同步接口和批量任务共用）
+async def transcribe_upload(
+    file: UploadFile,
+    timer: RequestTimer,
+    language: Optional[str] = None,
+    response_format: Optional[str] = "json",
+    temperature: Optional[float] = None,
+    bypass_cache: bool = False,
+    model: Optional[str] = None,
+    client: Optional[AdmissionClient] = None,
+):
+    """返回 (响应数据, 缓存状态 HIT/MISS/BYPASS)；请求本身有问题时抛出 HTTPException
+
+    model 为模型 ID 或别名，为空时使用默认模型。
+    client 为准入调度中的请求方，决定排队的优先级和配额；缓存命中的请求不排队。
+    上传字节数和音频时长记录在 timer 上，供调用方输出汇总日志。
+    """
+    try:
+        asr_model = model_registry.resolve(model)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 分块计算上传内容的哈希（FastAPI 已把大文件暂存到磁盘），不把整个文件读入内存
+    with timer.stage("read_upload"):
+        digest, timer.upload_bytes = await hash_upload(file)
+    
+    if timer.upload_bytes == 0:
+        raise HTTPException(status_code=400, detail="上传的文件为空")
+    if timer.upload_bytes > ASR_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件大小超过上限 {ASR_MAX_UPLOAD_BYTES} 字节")
+    
+    # 获取文件扩展名
+    file_suffix = os.path.splitext(file.filename or "")[1].lower()
+    if not file_suffix:
+        file_suffix = ".webm"  # 默认为 webm（网页常用格式）
+    mime, mime_params = parse_content_type(file.content_type)
+    decode = upload_decode_params(mime, mime_params, file_suffix)
+    
+    # 相同音频和参数的请求直接返回缓存结果
+    with timer.stage("cache_lookup"):
+        cache_key = TranscriptionCache.make_key(
+            digest, model=asr_model.id, language=language, response_format=response_format, **decode
+        )
+        cached = None if bypass_cache else await transcription_cache.get(cache_key)
+    if bypass_cache:
+        transcription_cache.bypassed += 1
+    elif cached is not None:
+        return cached, "HIT"
+    
+    # 识别后端不可用（断路器打开）时快速失败，不再解码和等待连接超时
+    retry_after = asr_model.retry_after()
+    if retry_after is not None:
+        if asr_model.balancer is not None:
+            asr_model.balancer.circuit_rejections_total += 1
+        raise HTTPException(
+            status_code=503,
+            detail=f"模型 {asr_model.id} 的识别后端暂时不可用",
+            headers={"Retry-After": str(retry_after)},
+        )
+    
+    chunks = None
+    sample_rate = TARGET_SAMPLE_RATE
+    
+    # 原始 PCM（如网页端采集的 16kHz int16）直接转为样本，不启动 ffmpeg
+    if decode["decoder"] == "pcm":
+        try:
+            sample_rate, chunks = open_raw_pcm_upload(file, mime, mime_params)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"无效的 PCM 参数: {e}")
+    
+    # WAV 格式直接分块读取，无法解析的 WAV（如浮点采样）交给 ffmpeg
+    elif decode["decoder"] == "wav":
+        try:
+            sample_rate, chunks = open_wave_upload(file)
+        except Exception:
+            logger.debug("WAV 无法直接读取，改用 ffmpeg 解码")
+            await file.seek(0)
+    
+    if chunks is None:
+        # 检查 ffmpeg 是否可用
+        if not check_ffmpeg():
+            raise HTTPException(status_code=500, detail="系统未安装 ffmpeg，无法处理音频格式转换")
+        chunks = iter_decoded_upload(file, file_suffix)
+    
+    # 准入调度：按优先级和客户端公平排队，拿到名额后才开始解码和识别
+    estimate = estimate_audio_seconds(file, timer.upload_bytes, mime, mime_params, file_suffix)
+    slot = admission.slot(client or AdmissionClient("anonymous"), estimate) if ASR_ADMISSION_ENABLED \
+        else nullcontext({})
+    
+    # 边解码边识别：样本按窗口切分后立即发送识别
     try:
-        logger.info(f"连接到 Sherpa WebSocket: {uri}")
-        async with websockets.connect(uri) as ws:
-            # 构造数据包：采样率(4字节) + 样本字节大小(4字节) + 样本字节流
-            buf = sample_rate.to_bytes(4, "little")
-            buf += (samples.size * 4).to_bytes(4, "little")
-            buf += samples.tobytes()
-            
-            logger.info(f"发送数据包大小: {len(buf)} 字节")
-            
-            # 分块发送
-            payload_len = 10240
-            while len(buf) > payload_len:
-                await ws.send(buf[:payload_len])
-                buf = buf[payload_len:]
-            if buf:
-                await ws.send(buf)
-            
-            # 等待识别结果
-            result = await ws.recv()
-            await ws.send("Done")  # 通知服务器传输结束
-            
-            logger.info(f"收到识别结果: {result}")
-            return result
-            
-    except Exception as e:
-        logger.error(f"Sherpa WebSocket 连接失败: {e}")
-        raise
-
-# 处理 OPTIONS 预检请求
-@app.options("/v1/audio/transcriptions")
-async def transcriptions_options():
-    return JSONResponse(
-        content={},
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "POST, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        }
-    )
+        async with aclosing(chunks), slot as ticket:
+            recognize_start = time.perf_counter()
+            segments, n_samples = await recognize_pcm_stream(chunks, sample_rate, asr_model)
+            ticket["audio_seconds"] = n_samples / sample_rate
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DecoderBusyError as e:
+        logger.warning(f"解码队列已满，拒绝请求: {decoder_pool.stats()}")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except AudioTooLongError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except ModelUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RecognitionTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    recognize_seconds = time.perf_counter() - recognize_start
+    timer.add("recognize", recognize_seconds)
+    
+    timer.audio_seconds = n_samples / sample_rate
+    AUDIO_SECONDS_TOTAL.inc("transcriptions", amount=timer.audio_seconds)
+    if timer.audio_seconds > 0:
+        REAL_TIME_FACTOR.observe(recognize_seconds / timer.audio_seconds)
+    result = join_segment_texts(seg["text"] for seg in segments)
+    
+    # 根据响应格式返回结果
+    response_data = {
+        "text": result
+    }
+    
+    # 如果请求详细格式，可以添加更多信息
+    if response_format == "verbose_json":
+        response_data.update({
+            "task": "transcribe",
+            "language": language or "auto",
+            "duration": timer.audio_seconds,
+            "segments": [
+                {
+                    "id": i,
+                    "seek": 0,
+                    "start": round(seg["start"], 3),
+                    "end": round(seg["end"], 3),
+                    "text": seg["text"],
+                    "tokens": [],
+                    "temperature": temperature or 0.0,
+                    "avg_logprob": 0.0,
+                    "compression_ratio": 1.0,
+                    "no_speech_prob": 0.0
+                }
+                for i, seg in enumerate(segments)
+            ]
+        })
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"返回结果: {response_data}")
+    
+    with timer.stage("cache_store"):
+        await transcription_cache.put(cache_key, response_data)
+    return response_data, "BYPASS" if bypass_cache else "MISS"
 
 # OpenAI API 兼容接口
 @app.post("/v1/audio/transcriptions")
@@ -153,96 +3087,29 @@ async def transcribe_audio(
     response_format: Optional[str] = Form("json"),
     temperature: Optional[float] = Form(None)
 ):
-    temp_path = None
-    wav_path = None
-    
+    timer = RequestTimer()
+    timer_token = _request_timer.set(timer)
+    REQUESTS_IN_FLIGHT.inc()
+    status = 500
+    cache_state = "-"
     try:
-        # 记录请求信息
-        logger.info(f"收到转录请求:")
-        logger.info(f"  文件名: {file.filename}")
-        logger.info(f"  内容类型: {file.content_type}")
-        logger.info(f"  模型: {model}")
-        logger.info(f"  语言: {language}")
-        logger.info(f"  响应格式: {response_format}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"收到转录请求: 文件名={file.filename}, 内容类型={file.content_type}, "
+                f"模型={model}, 语言={language}, 响应格式={response_format}"
+            )
         
         # 检查文件类型
         if not file.filename:
             raise HTTPException(status_code=400, detail="未提供文件名")
         
-        # 检查 ffmpeg 是否可用
-        if not check_ffmpeg():
-            raise HTTPException(status_code=500, detail="系统未安装 ffmpeg，无法处理音频格式转换")
-        
-        # 读取上传的文件
-        content = await file.read()
-        logger.info(f"文件大小: {len(content)} 字节")
-        
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="上传的文件为空")
-        
-        # 获取文件扩展名
-        file_suffix = os.path.splitext(file.filename)[1].lower()
-        if not file_suffix:
-            file_suffix = ".webm"  # 默认为 webm（网页常用格式）
-            
-        # 创建临时文件保存原始音频
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_suffix) as tmp:
-            tmp.write(content)
-            temp_path = tmp.name
-        
-        logger.info(f"原始文件路径: {temp_path}")
-        
-        # 创建 WAV 临时文件
-        wav_fd, wav_path = tempfile.mkstemp(suffix=".wav")
-        os.close(wav_fd)  # 关闭文件描述符，让 ffmpeg 使用
-        
-        # 如果不是 WAV 格式，使用 ffmpeg 转换
-        if file_suffix.lower() != ".wav":
-            logger.info(f"检测到 {file_suffix} 格式，开始转换为 WAV...")
-            if not convert_to_wav(temp_path, wav_path):
-                raise HTTPException(status_code=500, detail="音频格式转换失败")
-        else:
-            # 如果已经是 WAV 格式，直接复制
-            shutil.copy2(temp_path, wav_path)
-        
-        logger.info(f"WAV 文件路径: {wav_path}")
-        
-        # 读取转换后的 WAV 文件
-        samples, sample_rate = read_wave(wav_path)
-        logger.info(f"音频处理完成: 样本数={len(samples)}, 采样率={sample_rate}")
-        
-        # 发送到 Sherpa 进行识别
-        result = await send_to_sherpa(samples, sample_rate)
-        
-        # 根据响应格式返回结果
-        response_data = {
-            "text": result.strip()
-        }
-        
-        # 如果请求详细格式，可以添加更多信息
-        if response_format == "verbose_json":
-            response_data.update({
-                "task": "transcribe",
-                "language": language or "auto",
-                "duration": len(samples) / sample_rate,
-                "segments": [
-                    {
-                        "id": 0,
-                        "seek": 0,
-                        "start": 0.0,
-                        "end": len(samples) / sample_rate,
-                        "text": result.strip(),
-                        "tokens": [],
-                        "temperature": temperature or 0.0,
-                        "avg_logprob": 0.0,
-                        "compression_ratio": 1.0,
-                        "no_speech_prob": 0.0
-                    }
-                ]
-            })
-        
-        logger.info(f"返回结果: {response_data}")
+        bypass_cache = request.headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes") \
+            or "no-cache" in request.headers.get("Cache-Control", "").lower()
+        response_data, cache_state = await transcribe_upload(
+            file, timer, language, response_format, temperature, bypass_cache, model, admission_client(request)
+        )
         
+        status = 200
         # 返回带有CORS头的响应
         return JSONResponse(
             content=response_data,
@@ -250,63 +3117,1471 @@ async def transcribe_audio(
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Methods": "POST, OPTIONS",
                 "Access-Control-Allow-Headers": "*",
+                "X-Cache": cache_state,
+                "Server-Timing": timer.server_timing(),
             }
         )
         
+    except HTTPException as e:
+        status = e.status_code
+        raise
     except Exception as e:
         error_msg = f"转录失败: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_msg)
-        
     finally:
-        # 清理临时文件
-        for path in [temp_path, wav_path]:
-            if path and os.path.exists(path):
-                try:
-                    os.unlink(path)
-                    logger.info(f"已删除临时文件: {path}")
-                except Exception as e:
-                    logger.warning(f"删除临时文件失败: {e}")
+        _request_timer.reset(timer_token)
+        REQUESTS_IN_FLIGHT.dec()
+        REQUESTS_TOTAL.inc(str(status))
+        REQUEST_SECONDS.observe(timer.elapsed)
+        timer.finish()
+        # 每个请求只输出一行汇总日志
+        logger.info(
+            f"转录请求 {file.filename}: status={status} cache={cache_state} size={timer.upload_bytes} "
+            f"audio={timer.audio_seconds:.2f}s total={timer.elapsed * 1000:.0f}ms {timer.summary()}"
+        )
 
-# 健康检查接口
-@app.get("/health")
-async def health_check():
-    try:
-        # 测试 Sherpa WebSocket 连接
-        uri = f"ws://{SHERPA_WS_HOST}:{SHERPA_WS_PORT}"
-        async with websockets.connect(uri) as ws:
-            await ws.close()
-        
-        # 检查 ffmpeg
-        ffmpeg_ok = check_ffmpeg()
-        
+# 批量转录任务配置
+ASR_JOBS_DIR = os.environ.get("ASR_JOBS_DIR", "./asr_jobs")  # 任务数据库和待处理音频的存放目录
+ASR_JOBS_DB = os.environ.get("ASR_JOBS_DB", os.path.join(ASR_JOBS_DIR, "jobs.db"))
+ASR_JOBS_WORKERS = int(os.environ.get("ASR_JOBS_WORKERS", "2"))  # 同时处理的任务文件数
+ASR_JOBS_MAX_FILES = int(os.environ.get("ASR_JOBS_MAX_FILES", "1000"))  # 单个任务（含压缩包展开后）的文件数上限
+ASR_JOBS_MAX_BYTES = int(os.environ.get("ASR_JOBS_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))  # 单次提交的总字节数上限
+ASR_JOBS_MAX_ATTEMPTS = int(os.environ.get("ASR_JOBS_MAX_ATTEMPTS", "3"))  # 后端错误时每个文件的最多尝试次数
+ASR_JOBS_RETENTION = float(os.environ.get("ASR_JOBS_RETENTION", str(7 * 86400)))  # 已结束任务的保留时长（秒）
+ASR_JOBS_CALLBACK_TIMEOUT = float(os.environ.get("ASR_JOBS_CALLBACK_TIMEOUT", "10"))
+ASR_JOBS_CALLBACK_ATTEMPTS = int(os.environ.get("ASR_JOBS_CALLBACK_ATTEMPTS", "5"))
+JOB_RESULTS_PAGE_SIZE = 500
+JOB_AUDIO_SUFFIXES = {
+    ".wav", ".webm", ".ogg", ".oga", ".opus", ".mp3", ".m4a", ".m4b", ".mp4", ".mov", ".3gp", ".3g2",
+    ".aac", ".flac", ".amr", ".wma", ".pcm", ".raw",
+}
+JOB_ARCHIVE_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+JOB_FINAL_STATES = {"completed", "failed", "cancelled"}
+# 批量任务以最低优先级排队；同时处理的文件数已由 ASR_JOBS_WORKERS 限制，不再设客户端配额
+JOBS_ADMISSION_CLIENT = AdmissionClient("jobs", admission.lowest_class, max_concurrent=0, audio_seconds_per_minute=0)
+
+
+# 持久化的批量任务队列
+class TranscriptionJobStore:
+    """SQLite 中的任务表和文件表，服务重启后未完成的文件会重新排队
+
+    每个任务包含若干文件，文件是调度和重试的最小单位；
+    音频暂存在 ASR_JOBS_DIR/files/<任务ID>/ 下，识别完成后即删除，结果保存在数据库中。
+    """
+
+    def __init__(self, db_path: str, files_dir: str, recover_all: bool = True):
+        self.db_path = db_path
+        self.files_dir = files_dir
+        # 多进程模式下主进程在启动工作进程前已恢复全部中断的文件，工作进程只接管已退出进程遗留的文件
+        self.recover_all = recover_all
+        self.pid = os.getpid()
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    def open(self):
+        os.makedirs(self.files_dir, exist_ok=True)
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "finished_at REAL, language TEXT, response_format TEXT, callback_url TEXT, callback_status TEXT, "
+                "total INTEGER NOT NULL, completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                "job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT NOT NULL, path TEXT, content_type TEXT, "
+                "status TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "not_before REAL NOT NULL DEFAULT 0, started_at REAL, finished_at REAL, "
+                "PRIMARY KEY (job_id, idx))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS job_items_status ON job_items (status, job_id)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "model" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN model TEXT")
+            if "callback_pid" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN callback_pid INTEGER")
+            if "worker_pid" not in {row[1] for row in self._db.execute("PRAGMA table_info(job_items)")}:
+                self._db.execute("ALTER TABLE job_items ADD COLUMN worker_pid INTEGER")
+            # 上次退出时正在处理的文件重新排队（不计入尝试次数）
+            requeued = self._requeue_running(self._stale_pids("job_items", "worker_pid", "status = 'running'"))
+            self._db.commit()
+        expired = self.purge_expired()
+        logger.info(f"批量任务存储: {self.db_path}，重新排队 {requeued} 个文件，清理过期任务 {expired} 个")
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                # 本进程被中断的文件立即交还给其他工作进程
+                requeued = self._requeue_running([self.pid])
+                self._db.commit()
+                self._db.close()
+            self._db = None
+            if requeued:
+                logger.info(f"退出前重新排队 {requeued} 个正在处理的批量任务文件")
+
+    def _stale_pids(self, table: str, column: str, where: str):
+        """持有者已退出的 pid 列表；recover_all 时返回 None，表示不论持有者全部接管"""
+        if self.recover_all:
+            return None
+        pids = {row[0] for row in self._db.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {where}")}
+        return [pid for pid in pids if pid is None or pid == self.pid or not _pid_alive(pid)]
+
+    def _requeue_running(self, pids) -> int:
+        sql = "UPDATE job_items SET status = 'queued', attempts = MAX(attempts - 1, 0), worker_pid = NULL " \
+              "WHERE status = 'running'"
+        if pids is None:
+            return self._db.execute(sql).rowcount
+        owners = [pid for pid in pids if pid is not None]
+        clauses = ["worker_pid IS NULL"] if None in pids else []
+        if owners:
+            clauses.append(f"worker_pid IN ({','.join('?' * len(owners))})")
+        if not clauses:
+            return 0
+        return self._db.execute(f"{sql} AND ({' OR '.join(clauses)})", owners).rowcount
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.files_dir, job_id)
+
+    def create_job(self, job_id: str, items: list, model, language, response_format, callback_url):
+        """items 为 (文件名, 暂存路径, 内容类型) 列表"""
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at, model, language, response_format, "
+                "callback_url, total) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, now, now, model, language, response_format, callback_url, len(items)),
+            )
+            self._db.executemany(
+                "INSERT INTO job_items (job_id, idx, filename, path, content_type, status) "
+                "VALUES (?, ?, ?, ?, ?, 'queued')",
+                [(job_id, idx, name, path, ct) for idx, (name, path, ct) in enumerate(items)],
+            )
+            self._db.commit()
+
+    def claim_item(self):
+        """取出最早提交的任务中下一个可处理的文件，标记为 running"""
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute(
+                "UPDATE job_items SET status = 'running', attempts = attempts + 1, started_at = ?, worker_pid = ? "
+                "WHERE rowid = ("
+                "  SELECT i.rowid FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                "  WHERE i.status = 'queued' AND i.not_before <= ? ORDER BY j.created_at, i.idx LIMIT 1"
+                ") RETURNING job_id, idx, filename, path, content_type, attempts",
+                (now, self.pid, now),
+            ).fetchone()
+            if row is None:
+                self._db.commit()
+                return None
+            job = self._db.execute(
+                "SELECT model, language, response_format FROM jobs WHERE id = ?", (row["job_id"],)
+            ).fetchone()
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (now, row["job_id"]),
+            )
+            self._db.commit()
+        return {**dict(row), **dict(job)}
+
+    def next_wakeup(self) -> Optional[float]:
+        """等待重试的文件中最早可处理的时间"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT MIN(not_before) FROM job_items WHERE status = 'queued'"
+            ).fetchone()
+        return row[0]
+
+    def requeue_item(self, job_id: str, idx: int, delay: float, error: str, count_attempt: bool = True):
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE job_items SET status = 'queued', not_before = ?, error = ?, "
+                "attempts = attempts - ? WHERE job_id = ? AND idx = ? AND status = 'running'",
+                (time.time() + delay, error, 0 if count_attempt else 1, job_id, idx),
+            )
+            self._db.commit()
+
+    def finish_item(self, job_id: str, idx: int, result: Optional[dict], error: Optional[str]):
+        """记录文件结果；任务的所有文件都结束时返回任务信息，否则返回 None"""
+        now = time.time()
+        ok = error is None
+        with self._db_lock:
+            updated = self._db.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, path = NULL, finished_at = ? "
+                "WHERE job_id = ? AND idx = ? AND status = 'running'",
+                (
+                    "completed" if ok else "failed",
+                    json.dumps(result, ensure_ascii=False) if ok else None,
+                    error, now, job_id, idx,
+                ),
+            ).rowcount
+            if not updated:
+                # 任务已被取消或删除
+                self._db.commit()
+                return None
+            self._db.execute(
+                f"UPDATE jobs SET {'completed' if ok else 'failed'} = {'completed' if ok else 'failed'} + 1, "
+                "updated_at = ? WHERE id = ?",
+                (now, job_id),
+            )
+            job = self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN completed = 0 THEN 'failed' ELSE 'completed' END, finished_at = ? "
+                "WHERE id = ? AND status = 'running' AND completed + failed >= total RETURNING *",
+                (now, job_id),
+            ).fetchone()
+            self._db.commit()
+        return self._job_dict(job) if job is not None else None
+
+    def cancel_job(self, job_id: str) -> Optional[dict]:
+        """未开始的文件标记为取消；正在识别的文件结束后结果会被丢弃"""
+        now = time.time()
+        with self._db_lock:
+            job = self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = ?, finished_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running') RETURNING *",
+                (now, now, job_id),
+            ).fetchone()
+            if job is not None:
+                self._db.execute(
+                    "UPDATE job_items SET status = 'cancelled', path = NULL, finished_at = ? "
+                    "WHERE job_id = ? AND status IN ('queued', 'running')",
+                    (now, job_id),
+                )
+            else:
+                job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._db.commit()
+        return self._job_dict(job) if job is not None else None
+
+    def set_callback_status(self, job_id: str, status: str):
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE jobs SET callback_status = ?, callback_pid = ? WHERE id = ?", (status, self.pid, job_id)
+            )
+            self._db.commit()
+
+    def pending_callbacks(self) -> list:
+        """重启前已结束但回调尚未送达的任务；多进程模式下只接管负责投递的进程已退出的任务，避免重复回调"""
+        pending = (
+            "callback_url IS NOT NULL AND finished_at IS NOT NULL AND status != 'cancelled' "
+            "AND (callback_status IS NULL OR callback_status = 'pending')"
+        )
+        with self._db_lock:
+            pids = self._stale_pids("jobs", "callback_pid", pending)
+            if pids is None:
+                rows = self._db.execute(f"SELECT * FROM jobs WHERE {pending}").fetchall()
+            else:
+                owners = [pid for pid in pids if pid is not None]
+                rows = self._db.execute(
+                    f"UPDATE jobs SET callback_pid = ? WHERE {pending} AND (callback_pid IS NULL "
+                    f"OR callback_pid IN ({','.join('?' * len(owners)) or 'NULL'})) RETURNING *",
+                    (self.pid, *owners),
+                ).fetchall()
+            self._db.commit()
+        return [self._job_dict(row) for row in rows]
+
+    def get_job(self, job_id: str, with_items: bool = True) -> Optional[dict]:
+        with self._db_lock:
+            job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            items = self._db.execute(
+                "SELECT idx, filename, status, error, attempts FROM job_items WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall() if with_items else None
+        data = self._job_dict(job)
+        if items is not None:
+            data["files"] = [
+                {
+                    "index": row["idx"],
+                    "filename": row["filename"],
+                    "status": row["status"],
+                    "attempts": row["attempts"],
+                    "error": row["error"],
+                }
+                for row in items
+            ]
+        return data
+
+    def list_jobs(self, limit: int) -> list:
+        with self._db_lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job_dict(row) for row in rows]
+
+    def results_page(self, job_id: str, after_idx: int, limit: int) -> list:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT idx, filename, status, result, error FROM job_items "
+                "WHERE job_id = ? AND idx > ? ORDER BY idx LIMIT ?",
+                (job_id, after_idx, limit),
+            ).fetchall()
+        return [
+            {
+                "index": row["idx"],
+                "filename": row["filename"],
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+            }
+            for row in rows
+        ]
+
+    def delete_job(self, job_id: str) -> bool:
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount
+            self._db.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            self._db.commit()
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return bool(deleted)
+
+    def purge_expired(self) -> int:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - ASR_JOBS_RETENTION,),
+            ).fetchall()
+        for row in rows:
+            self.delete_job(row["id"])
+        return len(rows)
+
+    def counts(self) -> dict:
+        if self._db is None:
+            return {"jobs": {}, "files_queued": 0, "files_running": 0}
+        with self._db_lock:
+            jobs = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            items = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE status IN ('queued', 'running') GROUP BY status"
+            ).fetchall())
+        return {"jobs": jobs, "files_queued": items.get("queued", 0), "files_running": items.get("running", 0)}
+
+    @staticmethod
+    def _job_dict(row) -> dict:
+        return {
+            "id": row["id"],
+            "object": "transcription.job",
+            "status": row["status"],
+            "created_at": int(row["created_at"]),
+            "finished_at": int(row["finished_at"]) if row["finished_at"] else None,
+            "model": row["model"],
+            "language": row["language"],
+            "response_format": row["response_format"],
+            "total": row["total"],
+            "completed": row["completed"],
+            "failed": row["failed"],
+            "callback_url": row["callback_url"],
+            "callback_status": row["callback_status"],
+        }
+
+
+class TranscriptionJobs:
+    """批量任务的工作协程池：从存储中逐个领取文件，复用同步接口的转录流程
+
+    并发由 ASR_JOBS_WORKERS 固定，排队中的文件只占数据库的一行，不占用协程和连接。
+    """
+
+    def __init__(self, store: TranscriptionJobStore, workers: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self._tasks = []
+        self._callbacks = set()
+        self._wakeup = asyncio.Event()
+        self.active = 0
+        self.completed_total = 0
+        self.failed_total = 0
+        self.retried_total = 0
+
+    async def start(self):
+        await asyncio.to_thread(self.store.open)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        for job in await asyncio.to_thread(self.store.pending_callbacks):
+            self._schedule_callback(job)
+
+    async def close(self):
+        for task in [*self._tasks, *self._callbacks]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._callbacks, return_exceptions=True)
+        self._tasks = []
+        # 被中断的文件由 store.close() 重新排队；进程异常退出时由下次启动（或其他工作进程）接管
+        self.store.close()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stats(self) -> dict:
         return {
-            "status": "healthy" if ffmpeg_ok else "warning",
-            "sherpa_connection": "ok",
-            "ffmpeg": "available" if ffmpeg_ok else "not_found"
+            "workers": self.workers,
+            "active": self.active,
+            "completed_total": self.completed_total,
+            "failed_total": self.failed_total,
+            "retried_total": self.retried_total,
+            **self.store.counts(),
         }
+
+    async def _wait_for_work(self):
+        next_at = await asyncio.to_thread(self.store.next_wakeup)
+        timeout = 30.0 if next_at is None else min(30.0, max(0.05, next_at - time.time()))
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self, worker_id: int):
+        while True:
+            try:
+                item = await asyncio.to_thread(self.store.claim_item)
+            except Exception as e:
+                logger.error(f"领取批量任务失败: {e}")
+                await asyncio.sleep(1)
+                continue
+            if item is None:
+                await self._wait_for_work()
+                continue
+            self.active += 1
+            try:
+                await self._process(item)
+            finally:
+                self.active -= 1
+
+    async def _process(self, item: dict):
+        job_id, idx = item["job_id"], item["idx"]
+        timer = RequestTimer()
+        timer_token = _request_timer.set(timer)
+        status = 500
+        try:
+            with open(item["path"], "rb") as f:
+                upload = UploadFile(
+                    file=f,
+                    filename=item["filename"],
+                    headers=Headers({"content-type": item["content_type"] or "application/octet-stream"}),
+                )
+                result, _ = await transcribe_upload(
+                    upload, timer, item["language"], item["response_format"], model=item["model"],
+                    client=JOBS_ADMISSION_CLIENT,
+                )
+            status = 200
+            await self._finish(job_id, idx, result, None, item["path"])
+        except HTTPException as e:
+            # 文件本身的问题（格式、大小、解码失败）重试也不会成功，直接记为失败
+            status = e.status_code
+            if e.status_code == 429 or (e.status_code == 503 and "Retry-After" in (e.headers or {})):
+                # 解码队列已满或识别后端断路：稍后重试，不计入尝试次数
+                delay = float((e.headers or {}).get("Retry-After", 1))
+                await asyncio.to_thread(self.store.requeue_item, job_id, idx, delay, e.detail, False)
+            elif e.status_code > 500 and item["attempts"] < ASR_JOBS_MAX_ATTEMPTS:
+                await self._retry(item, e.detail)
+            else:
+                await self._finish(job_id, idx, None, e.detail, item["path"])
+        except asyncio.CancelledError:
+            status = "interrupted"
+            raise
+        except FileNotFoundError:
+            status = 404
+            await self._finish(job_id, idx, None, "暂存的音频文件不存在")
+        except Exception as e:
+            # 连接后端失败等临时错误，退避后重试
+            logger.error(f"批量任务 {job_id}#{idx} 转录失败: {e}")
+            if item["attempts"] < ASR_JOBS_MAX_ATTEMPTS:
+                await self._retry(item, f"转录失败: {e}")
+            else:
+                await self._finish(job_id, idx, None, f"转录失败: {e}", item["path"])
+        finally:
+            _request_timer.reset(timer_token)
+            timer.finish()
+            logger.info(
+                f"批量任务 {job_id}#{idx} {item['filename']}: status={status} attempt={item['attempts']} "
+                f"size={timer.upload_bytes} audio={timer.audio_seconds:.2f}s "
+                f"total={timer.elapsed * 1000:.0f}ms {timer.summary()}"
+            )
+
+    async def _retry(self, item: dict, error: str):
+        self.retried_total += 1
+        delay = min(60.0, 2.0 ** item["attempts"])
+        await asyncio.to_thread(self.store.requeue_item, item["job_id"], item["idx"], delay, error)
+
+    async def _finish(self, job_id: str, idx: int, result: Optional[dict], error: Optional[str], path=None):
+        if error is None:
+            self.completed_total += 1
+        else:
+            self.failed_total += 1
+        job = await asyncio.to_thread(self.store.finish_item, job_id, idx, result, error)
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        if job is not None:
+            shutil.rmtree(self.store.job_dir(job_id), ignore_errors=True)
+            logger.info(
+                f"批量任务 {job_id} 结束: status={job['status']} completed={job['completed']} failed={job['failed']}"
+            )
+            if job["callback_url"]:
+                await asyncio.to_thread(self.store.set_callback_status, job_id, "pending")
+                job["callback_status"] = "pending"
+                self._schedule_callback(job)
+
+    def _schedule_callback(self, job: dict):
+        task = asyncio.create_task(self._deliver_callback(job))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _deliver_callback(self, job: dict):
+        """任务结束时向 callback_url POST 任务摘要，失败按指数退避重试"""
+        summary = {k: v for k, v in job.items() if k != "callback_status"}
+        summary["results_url"] = f"/v1/audio/jobs/{job['id']}/results"
+        payload = json.dumps(summary, ensure_ascii=False).encode()
+        error = None
+        for attempt in range(ASR_JOBS_CALLBACK_ATTEMPTS):
+            try:
+                await asyncio.to_thread(_post_json, job["callback_url"], payload)
+                await asyncio.to_thread(self.store.set_callback_status, job["id"], "delivered")
+                return
+            except Exception as e:
+                error = e
+                logger.warning(f"批量任务 {job['id']} 回调失败（第 {attempt + 1} 次）: {e}")
+                await asyncio.sleep(min(60.0, 2.0 ** attempt))
+        await asyncio.to_thread(self.store.set_callback_status, job["id"], f"failed: {error}")
+
+
+def _post_json(url: str, payload: bytes):
+    request = urllib.request.Request(
+        url, data=payload, method="POST", headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=ASR_JOBS_CALLBACK_TIMEOUT) as resp:
+        resp.read()
+
+
+transcription_jobs = TranscriptionJobs(
+    TranscriptionJobStore(ASR_JOBS_DB, os.path.join(ASR_JOBS_DIR, "files"), recover_all=not ASR_MULTIPROCESS_DIR),
+    ASR_JOBS_WORKERS,
+)
+
+
+def _copy_limited(src, dst, limit: int) -> int:
+    """分块复制，超过 limit 字节时抛出 ValueError"""
+    copied = 0
+    while True:
+        chunk = src.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if copied > limit:
+            raise ValueError(f"文件大小超过上限 {limit} 字节")
+        dst.write(chunk)
+
+
+def _is_zip_upload(upload: UploadFile) -> bool:
+    mime, _ = parse_content_type(upload.content_type)
+    return mime in JOB_ARCHIVE_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+
+def _extract_job_archive(archive, job_dir: str, items: list, budget: int) -> int:
+    """把压缩包中的音频文件展开为编号文件（不使用包内路径，避免路径穿越），返回写入的字节数"""
+    written = 0
+    with zipfile.ZipFile(archive) as zf:
+        for member in zf.infolist():
+            name = member.filename
+            base = os.path.basename(name.rstrip("/"))
+            if member.is_dir() or name.startswith("__MACOSX/") or base.startswith("."):
+                continue
+            suffix = os.path.splitext(base)[1].lower()
+            if suffix not in JOB_AUDIO_SUFFIXES:
+                continue
+            if len(items) >= ASR_JOBS_MAX_FILES:
+                raise ValueError(f"文件数超过上限 {ASR_JOBS_MAX_FILES}")
+            path = os.path.join(job_dir, f"{len(items):06d}{suffix}")
+            # 以实际解压出的字节数为准，不信任压缩包头部声明的大小
+            with zf.open(member) as src, open(path, "wb") as dst:
+                size = _copy_limited(src, dst, min(ASR_MAX_UPLOAD_BYTES, budget - written))
+            written += size
+            items.append((name, path, None))
+    return written
+
+
+def _store_job_uploads(uploads: list, job_dir: str) -> list:
+    """把上传文件（或压缩包中的音频）写入任务目录，返回 (文件名, 路径, 内容类型) 列表"""
+    os.makedirs(job_dir, exist_ok=True)
+    items = []
+    written = 0
+    for upload in uploads:
+        upload.file.seek(0)
+        if _is_zip_upload(upload):
+            try:
+                written += _extract_job_archive(upload.file, job_dir, items, ASR_JOBS_MAX_BYTES - written)
+            except zipfile.BadZipFile:
+                raise ValueError(f"无法解析压缩包: {upload.filename}")
+            continue
+        if len(items) >= ASR_JOBS_MAX_FILES:
+            raise ValueError(f"文件数超过上限 {ASR_JOBS_MAX_FILES}")
+        suffix = os.path.splitext(upload.filename or "")[1].lower()
+        path = os.path.join(job_dir, f"{len(items):06d}{suffix if len(suffix) <= 8 else ''}")
+        with open(path, "wb") as dst:
+            size = _copy_limited(upload.file, dst, min(ASR_MAX_UPLOAD_BYTES, ASR_JOBS_MAX_BYTES - written))
+        if size == 0:
+            raise ValueError(f"上传的文件为空: {upload.filename}")
+        written += size
+        items.append((upload.filename or f"file{len(items)}{suffix}", path, upload.content_type))
+    if not items:
+        raise ValueError("未找到可转录的音频文件")
+    return items
+
+
+# 批量转录任务接口
+@app.post("/v1/audio/jobs", status_code=202)
+async def create_transcription_job(
+    files: List[UploadFile] = File(...),
+    model: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+    response_format: Optional[str] = Form("json"),
+    callback_url: Optional[str] = Form(None),
+):
+    if callback_url and urllib.parse.urlparse(callback_url).scheme not in ("http", "https"):
+        raise HTTPException(status_code=400, detail="callback_url 只支持 http/https")
+    try:
+        model = model_registry.resolve(model).id
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job_id = f"job_{uuid.uuid4().hex}"
+    job_dir = transcription_jobs.store.job_dir(job_id)
+    try:
+        items = await asyncio.to_thread(_store_job_uploads, files, job_dir)
+        await asyncio.to_thread(
+            transcription_jobs.store.create_job, job_id, items, model, language, response_format,
+            callback_url or None,
+        )
+    except ValueError as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        status = 413 if "上限" in str(e) else 400
+        raise HTTPException(status_code=status, detail=str(e))
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    transcription_jobs.notify()
+    logger.info(f"批量任务 {job_id} 已提交: {len(items)} 个文件")
+    return JSONResponse(
+        status_code=202,
+        content=await asyncio.to_thread(transcription_jobs.store.get_job, job_id, False),
+        headers={"Location": f"/v1/audio/jobs/{job_id}"},
+    )
+
+@app.get("/v1/audio/jobs")
+async def list_transcription_jobs(limit: int = 50):
+    jobs = await asyncio.to_thread(transcription_jobs.store.list_jobs, max(1, min(limit, 1000)))
+    return {"object": "list", "data": jobs}
+
+@app.get("/v1/audio/jobs/{job_id}")
+async def get_transcription_job(job_id: str):
+    job = await asyncio.to_thread(transcription_jobs.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@app.get("/v1/audio/jobs/{job_id}/results")
+async def get_transcription_job_results(job_id: str, format: str = "json"):
+    """format=jsonl 时逐行流式返回每个文件的结果，适合上千个文件的任务"""
+    job = await asyncio.to_thread(transcription_jobs.store.get_job, job_id, False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def pages():
+        after = -1
+        while True:
+            rows = await asyncio.to_thread(
+                transcription_jobs.store.results_page, job_id, after, JOB_RESULTS_PAGE_SIZE
+            )
+            if not rows:
+                return
+            yield rows
+            after = rows[-1]["index"]
+
+    if format == "jsonl":
+        async def lines():
+            async for rows in pages():
+                yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    results = [row async for rows in pages() for row in rows]
+    return {**job, "results": results}
+
+@app.delete("/v1/audio/jobs/{job_id}")
+async def delete_transcription_job(job_id: str, purge: bool = False):
+    """取消未完成的任务；purge=true 时同时删除任务记录和结果"""
+    job = await asyncio.to_thread(transcription_jobs.store.cancel_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if purge:
+        await asyncio.to_thread(transcription_jobs.store.delete_job, job_id)
+        job["status"] = "deleted"
+    else:
+        shutil.rmtree(transcription_jobs.store.job_dir(job_id), ignore_errors=True)
+    return job
+
+# 实时流式识别配置
+STREAM_PARTIAL_INTERVAL = float(os.environ.get("STREAM_PARTIAL_INTERVAL", "0.4"))  # 中间结果的刷新间隔（秒音频）
+STREAM_ENDPOINT_SILENCE = float(os.environ.get("STREAM_ENDPOINT_SILENCE", "0.6"))  # 句尾静音时长
+STREAM_MAX_PENDING_FINALS = int(os.environ.get("STREAM_MAX_PENDING_FINALS", "4"))  # 排队等待识别的整句上限
+STREAM_SUPPORTED_FORMATS = {"pcm_s16le", "f32le", "webm", "ogg"}
+
+
+# 单个流式识别连接的状态
+class StreamingSession:
+    """增量接收 PCM，实时做端点检测，推送中间结果和整句结果
+
+    当前句子的音频保存在预分配的定长缓冲区中（最长 VAD_MAX_SEGMENT_SECONDS），
+    超长时强制断句；待识别的整句放在有界队列里，队列满时暂停读取客户端数据，
+    因此每个连接占用的内存有上限。
+    """
+
+    def __init__(self, websocket: WebSocket, sample_rate: int, model: Optional[AsrModel] = None):
+        self.websocket = websocket
+        self.sample_rate = sample_rate
+        self.model = model
+        self.frame_len = max(1, int(sample_rate * VAD_FRAME_MS / 1000))
+        self.preroll = int(VAD_PAD_SECONDS * sample_rate)
+        self.endpoint_frames = max(1, int(STREAM_ENDPOINT_SILENCE * 1000 / VAD_FRAME_MS))
+        self.partial_samples = max(self.frame_len, int(STREAM_PARTIAL_INTERVAL * sample_rate))
+
+        self._buf = np.empty(int(VAD_MAX_SEGMENT_SECONDS * sample_rate), dtype=np.float32)
+        self._len = 0           # 当前句子（含前置余量）的样本数
+        self._pending = np.empty(0, dtype=np.float32)  # 不足一帧的剩余样本
+        self._in_speech = False
+        self._silent_frames = 0
+        self._noise_db = VAD_THRESHOLD_DB - VAD_SNR_DB
+        self._utt_start = 0     # 当前句子在整个流中的起始样本
+        self._consumed = 0      # 已处理的样本总数
+        self._since_partial = 0
+        self._utt_id = 0
+
+        self._partial_task = None
+        self._finals = asyncio.Queue(maxsize=max(1, STREAM_MAX_PENDING_FINALS))
+        self._final_worker = asyncio.create_task(self._run_finals())
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def feed(self, samples: np.ndarray):
+        AUDIO_SECONDS_TOTAL.inc("stream", amount=len(samples) / self.sample_rate)
+        if len(self._pending):
+            samples = np.concatenate((self._pending, samples))
+        n_frames = len(samples) // self.frame_len
+        energy = frame_energy_db(samples, self.frame_len)
+        for i in range(n_frames):
+            await self._process_frame(samples[i * self.frame_len:(i + 1) * self.frame_len], float(energy[i]))
+        self._pending = samples[n_frames * self.frame_len:].copy()
+
+    async def _process_frame(self, frame: np.ndarray, energy: float):
+        threshold = max(VAD_THRESHOLD_DB, self._noise_db + VAD_SNR_DB)
+        voiced = energy > threshold
+        if not voiced and not self._in_speech:
+            # 只在非语音段跟踪底噪
+            self._noise_db = 0.95 * self._noise_db + 0.05 * energy
+
+        self._append(frame)
+        self._consumed += len(frame)
+
+        if not self._in_speech:
+            if voiced:
+                self._in_speech = True
+                self._silent_frames = 0
+                self._since_partial = 0
+                self._utt_start = self._consumed - self._len
+            else:
+                # 非语音时只保留前置余量
+                if self._len > self.preroll:
+                    keep = self._buf[self._len - self.preroll:self._len].copy()
+                    self._buf[:self.preroll] = keep
+                    self._len = self.preroll
+            return
+
+        self._silent_frames = 0 if voiced else self._silent_frames + 1
+        self._since_partial += len(frame)
+        if self._silent_frames >= self.endpoint_frames or self._len + self.frame_len > len(self._buf):
+            await self._finalize()
+        elif self._since_partial >= self.partial_samples:
+            self._since_partial = 0
+            self._start_partial()
+
+    def _append(self, frame: np.ndarray):
+        self._buf[self._len:self._len + len(frame)] = frame
+        self._len += len(frame)
+
+    def _start_partial(self):
+        # 上一次中间结果还没回来时跳过，避免识别请求堆积
+        if self._partial_task is not None and not self._partial_task.done():
+            return
+        self._partial_task = asyncio.create_task(
+            self._run_partial(self._utt_id, self._buf[:self._len].copy(), self._utt_start)
+        )
+
+    async def _run_partial(self, utt_id: int, samples: np.ndarray, start: int):
+        try:
+            text = await recognize(samples, self.sample_rate, self.model)
+        except Exception as e:
+            logger.warning(f"流式中间结果识别失败: {e}")
+            return
+        # 该句已经出整句结果时丢弃过期的中间结果
+        if utt_id == self._utt_id and text.strip():
+            await self.send({
+                "type": "partial",
+                "text": text.strip(),
+                "start": round(start / self.sample_rate, 3),
+            })
+
+    async def _finalize(self):
+        if not self._in_speech:
+            return
+        # 去掉句尾多余的静音，只保留余量
+        trim = max(0, self._silent_frames * self.frame_len - self.preroll)
+        end = self._len - trim
+        samples = self._buf[:end].copy()
+        start = self._utt_start
+        self._utt_id += 1
+        self._in_speech = False
+        self._silent_frames = 0
+        self._len = 0
+        await self._finals.put((samples, start))
+
+    async def _run_finals(self):
+        # 客户端断开后继续取出并丢弃剩余整句，否则 finish() 等待队列清空和 _finalize() 入队都会一直阻塞
+        disconnected = False
+        while True:
+            samples, start = await self._finals.get()
+            if disconnected:
+                self._finals.task_done()
+                continue
+            try:
+                text = await recognize(samples, self.sample_rate, self.model)
+                await self.send({
+                    "type": "final",
+                    "text": text.strip(),
+                    "start": round(start / self.sample_rate, 3),
+                    "end": round((start + len(samples)) / self.sample_rate, 3),
+                })
+            except WebSocketDisconnect:
+                disconnected = True
+            except Exception as e:
+                logger.error(f"流式整句识别失败: {e}")
+                try:
+                    await self.send({"type": "error", "message": f"识别失败: {e}"})
+                except (WebSocketDisconnect, RuntimeError):
+                    disconnected = True
+            finally:
+                self._finals.task_done()
+
+    async def finish(self):
+        """客户端结束发送：识别剩余语音并等待所有整句结果发出"""
+        await self._finalize()
+        await self._finals.join()
+
+    async def close(self):
+        for task in (self._partial_task, self._final_worker):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _pump_ffmpeg_output(proc, session: StreamingSession):
+    """把 ffmpeg 解码出的 PCM 持续送入会话"""
+    leftover = b""
+    while True:
+        chunk = await proc.stdout.read(8192)
+        if not chunk:
+            break
+        chunk = leftover + chunk
+        usable = len(chunk) - len(chunk) % 2
+        leftover = chunk[usable:]
+        await session.feed(pcm16_to_float32(chunk[:usable]))
+
+
+# 实时流式识别接口
+@app.websocket("/v1/audio/stream")
+async def stream_transcription(
+    websocket: WebSocket,
+    sample_rate: int = TARGET_SAMPLE_RATE,
+    format: str = "pcm_s16le",
+    model: Optional[str] = None,
+):
+    """客户端发送二进制音频帧，发送文本 "Done" 或 {"type": "stop"} 结束
+
+    format: pcm_s16le / f32le（sample_rate 指定采样率），或 webm / ogg（Opus，经 ffmpeg 实时解码）。
+    model: 模型 ID 或别名，为空时使用默认模型。
+    服务端推送 {"type": "partial"} 中间结果和 {"type": "final"} 整句结果。
+    """
+    await websocket.accept()
+    if format not in STREAM_SUPPORTED_FORMATS:
+        await websocket.send_json({"type": "error", "message": f"不支持的音频格式: {format}"})
+        await websocket.close(code=1003)
+        return
+    if format in ("pcm_s16le", "f32le") and not 8000 <= sample_rate <= 192000:
+        await websocket.send_json({"type": "error", "message": f"不支持的采样率: {sample_rate}"})
+        await websocket.close(code=1003)
+        return
+    try:
+        asr_model = model_registry.resolve(model)
+    except ModelNotFoundError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    proc = None
+    pump = None
+    if format in ("webm", "ogg"):
+        if not check_ffmpeg():
+            await websocket.send_json({"type": "error", "message": "系统未安装 ffmpeg，无法解码 Opus 音频"})
+            await websocket.close(code=1011)
+            return
+        sample_rate = TARGET_SAMPLE_RATE
+        cmd = _ffmpeg_decode_cmd("pipe:0")
+        cmd[1:1] = ["-fflags", "nobuffer", "-probesize", "4096", "-analyzeduration", "0"]
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+
+    session = StreamingSession(websocket, sample_rate, asr_model)
+    STREAMS_IN_FLIGHT.inc()
+    if proc is not None:
+        pump = asyncio.create_task(_pump_ffmpeg_output(proc, session))
+    logger.info(f"流式识别连接已建立: model={asr_model.id}, format={format}, sample_rate={sample_rate}")
+    await session.send({"type": "ready", "sample_rate": sample_rate, "format": format, "model": asr_model.id})
+
+    leftover = b""
+    width = 4 if format == "f32le" else 2
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is None:
+                text = (message.get("text") or "").strip()
+                control = None
+                if text.startswith("{"):
+                    # 格式错误的控制消息只回复错误，不结束会话，已缓冲的音频照常识别
+                    try:
+                        control = json.loads(text)
+                    except ValueError:
+                        pass
+                    if not isinstance(control, dict):
+                        await session.send({"type": "error", "message": f"无法解析的控制消息: {text[:100]}"})
+                        continue
+                if text == "Done" or (control is not None and control.get("type") == "stop"):
+                    if proc is not None:
+                        proc.stdin.close()
+                        await pump
+                    await session.finish()
+                    await session.send({"type": "done"})
+                    break
+                continue
+
+            if proc is not None:
+                proc.stdin.write(data)
+                await proc.stdin.drain()
+                continue
+
+            data = leftover + data
+            usable = len(data) - len(data) % width
+            leftover = data[usable:]
+            if format == "f32le":
+                samples = np.frombuffer(data[:usable], dtype=np.float32)
+            else:
+                samples = pcm16_to_float32(data[:usable])
+            await session.feed(samples)
+
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
+        logger.error(f"流式识别异常: {e}")
+        logger.error(traceback.format_exc())
+        try:
+            await session.send({"type": "error", "message": str(e)})
+        except Exception:
+            pass
+    finally:
+        STREAMS_IN_FLIGHT.dec()
+        await session.close()
+        if pump is not None and not pump.done():
+            pump.cancel()
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+        logger.info("流式识别连接已关闭")
+
+# 启动预热配置：完成前 /ready 返回 503
+ASR_WARMUP_ENABLED = os.environ.get("ASR_WARMUP_ENABLED", "1") == "1"
+# 合成音频时长（秒）：短句、VAD 切分后的典型段长和接近 VAD 窗口的长段
+ASR_WARMUP_DURATIONS = [float(x) for x in os.environ.get("ASR_WARMUP_DURATIONS", "1,5,20").split(",") if x.strip()]
+# 预先计算这些输入采样率到 16kHz 的重采样滤波器
+ASR_WARMUP_SAMPLE_RATES = [int(x) for x in os.environ.get("ASR_WARMUP_SAMPLE_RATES", "8000,22050,44100,48000").split(",") if x.strip()]
+ASR_WARMUP_TIMEOUT = float(os.environ.get("ASR_WARMUP_TIMEOUT", "120"))
+# 多进程模式下工作进程共享监听端口，无法按进程摘除流量，预热完成后才开始接受连接
+ASR_WARMUP_BLOCKING = os.environ.get("ASR_WARMUP_BLOCKING", "1" if ASR_MULTIPROCESS_DIR else "0") == "1"
+
+
+def synthetic_speech(seconds: float, sample_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    """预热用的合成音频：每秒 0.7 秒噪声加 0.3 秒静音，能量起伏足以让 VAD 切出语音段"""
+    n = int(seconds * sample_rate)
+    envelope = np.where(np.arange(n) % sample_rate < 0.7 * sample_rate, 0.1, 0.0).astype(np.float32)
+    return np.random.default_rng(0).standard_normal(n).astype(np.float32) * envelope
+
+
+def _wav_bytes(samples: np.ndarray, sample_rate: int) -> bytes:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ", 16, WAVE_FORMAT_PCM, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", len(pcm),
+    )
+    return header + pcm
+
+
+# 启动预热
+class StartupWarmup:
+    """服务启动后先把冷路径走一遍，避免由最初的用户请求承担
+
+    依次：验证各 Sherpa 后端的连接；预先计算常见采样率的重采样滤波器；
+    预先启动 ffmpeg 并用合成 WAV 走一遍管道解码；对每个可用后端和已加载的进程内引擎
+    识别 ASR_WARMUP_DURATIONS 中各时长的合成音频；最后用默认模型走一遍 WAV 解析、VAD 切分和识别。
+    单个步骤失败只记录警告，不阻止就绪（后端不可用由健康检查和断路器处理）；
+    预热产生的识别会计入后端和引擎的统计。
+    """
+
+    def __init__(self, enabled: bool, durations, sample_rates, timeout: float):
+        self.enabled = enabled
+        self.durations = [d for d in durations if d > 0]
+        self.sample_rates = list(sample_rates)
+        self.timeout = timeout
+        self.state = "pending" if enabled else "disabled"
+        self.steps = {}   # 步骤 -> 耗时（秒）
+        self.errors = {}  # 步骤 -> 错误信息
+        self.backends = {}  # 后端地址 -> 连接是否正常
+        self.seconds = None
+        self._task = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state not in ("pending", "running")
+
+    def stats(self) -> dict:
         return {
-            "status": "unhealthy", 
-            "sherpa_connection": f"error: {e}",
-            "ffmpeg": "available" if check_ffmpeg() else "not_found"
+            "state": self.state,
+            "seconds": self.seconds,
+            "steps": self.steps,
+            "errors": self.errors,
+            "backends": self.backends,
+        }
+
+    async def start(self, block: bool):
+        if not self.enabled:
+            return
+        self._task = asyncio.create_task(self._run())
+        if block:
+            await asyncio.shield(self._task)
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        self.state = "running"
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._warm(), self.timeout)
+            self.state = "done"
+        except asyncio.TimeoutError:
+            self.state = "timeout"
+            logger.warning(f"启动预热超过 {self.timeout:.0f} 秒，未完成的步骤已跳过")
+        self.seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"启动预热{'完成' if self.state == 'done' else '结束'}，用时 {self.seconds:.2f} 秒: {self.steps}")
+        # 立即刷新就绪状态，不等下一次定时检查
+        await health_monitor.refresh()
+
+    async def _step(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors[name] = str(e) or type(e).__name__
+            logger.warning(f"启动预热步骤 {name} 失败: {e!r}")
+        finally:
+            self.steps[name] = round(time.perf_counter() - start, 3)
+
+    async def _warm(self):
+        await self._step("connections", self._verify_connections())
+        await self._step("resampler", asyncio.to_thread(self._precompute_resamplers))
+        await self._step("decoder", self._warm_decoder())
+        await self._step("recognizers", self._warm_recognizers())
+        await self._step("request_path", self._warm_request_path())
+
+    async def _verify_connections(self):
+        backends = [b for balancer in model_registry.balancers() for b in balancer.backends]
+        results = await asyncio.gather(*(b.pool.probe() for b in backends))
+        self.backends = {b.address: ok for b, ok in zip(backends, results)}
+        failed = [address for address, ok in self.backends.items() if not ok]
+        if failed:
+            raise ConnectionError(f"无法连接 Sherpa 后端: {', '.join(failed)}")
+
+    def _precompute_resamplers(self):
+        for rate in self.sample_rates:
+            if rate != TARGET_SAMPLE_RATE:
+                PolyphaseResampler(rate, TARGET_SAMPLE_RATE)
+
+    async def _warm_decoder(self):
+        await decoder_pool.prespawn()
+        if not check_ffmpeg():
+            return
+        upload = UploadFile(file=io.BytesIO(_wav_bytes(synthetic_speech(1.0), TARGET_SAMPLE_RATE)),
+                            filename="warmup.wav")
+        async with aclosing(iter_decoded_upload(upload, ".wav")) as chunks:
+            async for _ in chunks:
+                pass
+
+    async def _warm_recognizers(self):
+        """每个连接正常的后端、每个已加载的引擎都识别一遍各时长的合成音频"""
+        clips = [synthetic_speech(d) for d in self.durations]
+
+        async def warm(target, send):
+            for samples in clips:
+                await send(samples, TARGET_SAMPLE_RATE)
+            logger.info(f"已预热识别后端: {target}")
+
+        jobs = []
+        for model in model_registry.models.values():
+            if model.balancer is not None:
+                jobs += [warm(b.address, b.send) for b in model.balancer.backends if self.backends.get(b.address)]
+            if model.loaded:
+                jobs.append(warm(f"{model.id}（进程内引擎）", model.engine.recognize))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+
+    async def _warm_request_path(self):
+        model = model_registry.default
+        reachable = model.loaded or (
+            model.balancer is not None and any(self.backends.get(b.address) for b in model.balancer.backends)
+        )
+        if not reachable or not self.durations:
+            return
+        upload = UploadFile(
+            file=io.BytesIO(_wav_bytes(synthetic_speech(max(self.durations)), TARGET_SAMPLE_RATE)),
+            filename="warmup.wav",
+        )
+        sample_rate, chunks = open_wave_upload(upload)
+        async with aclosing(chunks):
+            await recognize_pcm_stream(chunks, sample_rate, model)
+
+
+startup_warmup = StartupWarmup(ASR_WARMUP_ENABLED, ASR_WARMUP_DURATIONS, ASR_WARMUP_SAMPLE_RATES, ASR_WARMUP_TIMEOUT)
+
+
+# 健康监控配置
+ASR_HEALTH_INTERVAL = float(os.environ.get("ASR_HEALTH_INTERVAL", "5"))
+CIRCUIT_STATES = ("closed", "half_open", "open")
+
+
+class HealthMonitor:
+    """后台定期检查依赖，/health 和 /ready 直接返回缓存的结果，探活请求不再触发任何 I/O
+
+    Sherpa 后端由各 SherpaBalancer 的健康检查任务探测，这里只汇总摘除和断路器状态；
+    ffmpeg 是否可用也在这里定期刷新，转录请求不再每次调用 shutil.which。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = max(0.5, interval)
+        self.ffmpeg_available = None
+        self.snapshot = {"status": "starting", "ready": False, "checked_at": None}
+        self.checks_total = 0
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot["ready"]
+
+    async def start(self):
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.snapshot = {**self.snapshot, "status": "stopping", "ready": False}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"健康检查失败: {e}")
+
+    async def refresh(self):
+        self.ffmpeg_available = await asyncio.to_thread(shutil.which, "ffmpeg") is not None
+        jobs = await asyncio.to_thread(transcription_jobs.stats)
+        models = {
+            m.id: {
+                "available": m.available(),
+                "loaded": m.loaded,
+                "circuit": m.balancer.circuit_state() if m.balancer else None,
+                "retry_after": m.retry_after(),
+            }
+            for m in model_registry.models.values()
         }
+        default = models[model_registry.default.id]
+        up = [b for b in model_registry.balancers() for b in b.backends if not b.ejected]
+        if not default["available"]:
+            status = "unhealthy"
+        elif not startup_warmup.finished:
+            status = "warming_up"
+        elif not self.ffmpeg_available or not all(m["available"] for m in models.values()):
+            status = "warning"
+        else:
+            status = "healthy"
+        previous = self.snapshot["status"]
+        self.snapshot = {
+            "status": status,
+            "ready": default["available"] and startup_warmup.finished,
+            "checked_at": int(time.time()),
+            "sherpa_connection": "ok" if up or model_registry.default.loaded
+            else f"error: 所有 Sherpa 后端均不可用，{default['retry_after']} 秒后重试",
+            "ffmpeg": "available" if self.ffmpeg_available else "not_found",
+            "model_status": models,
+            "jobs": jobs,
+            "warmup": startup_warmup.stats(),
+        }
+        self.checks_total += 1
+        if previous != status and previous != "starting":
+            (logger.info if status == "healthy" else logger.warning)(f"服务健康状态: {previous} -> {status}")
+
+
+health_monitor = HealthMonitor(ASR_HEALTH_INTERVAL)
+
+
+# 健康检查接口：返回后台监控缓存的状态
+@app.get("/health")
+async def health_check():
+    return {
+        **health_monitor.snapshot,
+        "sherpa_backends": [st for b in model_registry.balancers() for st in b.stats()],
+        "decoder": decoder_pool.stats(),
+        "admission": admission.stats(),
+        "cache": transcription_cache.stats(),
+        "worker": multiprocess_metrics.stats(),
+        "backend": "local" if model_registry.default.loaded else "websocket",
+        "models": model_registry.stats(),
+    }
+
+# 就绪检查接口：默认模型可用时返回 200，否则 503（供编排系统摘除流量）
+@app.get("/ready")
+async def readiness_check():
+    snapshot = health_monitor.snapshot
+    return JSONResponse(
+        status_code=200 if snapshot["ready"] else 503,
+        content={"ready": snapshot["ready"], "status": snapshot["status"], "checked_at": snapshot["checked_at"]},
+    )
+
+# 连接池、解码池、缓存和引擎的状态在抓取时读取
+@metrics.collector
+def collect_component_metrics():
+    backends = [
+        ((model.id, b.address), b.stats())
+        for model in model_registry.models.values() if model.balancer
+        for b in model.balancer.backends
+    ]
+    engines = [((model.id,), model.engine.stats()) for model in model_registry.models.values() if model.engine]
+    hedging = [((model.id,), model.balancer.hedge_stats()) for model in model_registry.models.values() if model.balancer]
+    circuits = [
+        (model.id, {"circuit": model.balancer.circuit_state(),
+                    "circuit_rejections_total": model.balancer.circuit_rejections_total})
+        for model in model_registry.models.values() if model.balancer
+    ]
+    models = [((model.id,), model) for model in model_registry.models.values()]
+    decoder = decoder_pool.stats()
+    cache = transcription_cache.stats()
+    jobs = transcription_jobs.stats()
+    classes = [((name,), st) for name, st in admission.stats()["classes"].items()]
+    labels = ("model", "backend")
+
+    def per_backend(key, section=None):
+        return [(label_values, (st[section] if section else st)[key]) for label_values, st in backends]
+
+    return [
+        ("asr_sherpa_backend_up", "gauge", "1 if the Sherpa backend is not ejected", labels,
+         [(label_values, 0 if st["state"] == "ejected" else 1) for label_values, st in backends]),
+        ("asr_sherpa_outstanding_requests", "gauge", "Requests in flight per Sherpa backend", labels,
+         per_backend("outstanding_requests")),
+        ("asr_sherpa_outstanding_audio_seconds", "gauge", "Audio seconds in flight per Sherpa backend", labels,
+         per_backend("outstanding_audio_seconds")),
+        ("asr_sherpa_requests_total", "counter", "Recognition requests routed to each Sherpa backend", labels,
+         per_backend("requests_total")),
+        ("asr_sherpa_pool_open_connections", "gauge", "Open pooled connections", labels,
+         per_backend("open", "pool")),
+        ("asr_sherpa_pool_busy_connections", "gauge", "Pooled connections in use", labels,
+         per_backend("busy", "pool")),
+        ("asr_sherpa_pool_waiting", "gauge", "Callers waiting for a pooled connection", labels,
+         per_backend("waiting", "pool")),
+        ("asr_sherpa_pool_connects_total", "counter", "Connections opened by the pool", labels,
+         per_backend("connects_total", "pool")),
+        ("asr_sherpa_pool_reconnects_total", "counter", "Broken connections replaced by the pool", labels,
+         per_backend("reconnects_total", "pool")),
+        ("asr_sherpa_bytes_sent_total", "counter", "Sample bytes sent to the Sherpa backend", labels,
+         per_backend("bytes_sent_total", "pool")),
+        ("asr_sherpa_timeouts_total", "counter", "Recognitions that hit the deadline on each Sherpa backend", labels,
+         per_backend("timeouts_total")),
+        ("asr_sherpa_hedges_total", "counter", "Hedged recognition requests by outcome", ("model", "outcome"),
+         [(label_values + (outcome,), st[f"hedge_{outcome}_total"])
+          for label_values, st in hedging for outcome in ("wins", "losses", "failures")]),
+        ("asr_circuit_state", "gauge", "Sherpa circuit breaker state (0 closed, 1 half-open, 2 open)", ("model",),
+         [((model_id,), CIRCUIT_STATES.index(st["circuit"])) for model_id, st in circuits]),
+        ("asr_circuit_rejections_total", "counter", "Requests failed fast while the circuit was open", ("model",),
+         [((model_id,), st["circuit_rejections_total"]) for model_id, st in circuits]),
+        ("asr_ready", "gauge", "1 if the service is ready to accept transcriptions", (),
+         [((), int(health_monitor.ready))]),
+        ("asr_sherpa_hedges_throttled_total", "counter", "Hedges skipped because the hedge budget was exhausted",
+         ("model",), [(label_values, st["hedges_throttled_total"]) for label_values, st in hedging]),
+        ("asr_sherpa_deadline_exceeded_total", "counter", "Recognitions that exceeded their deadline", ("model",),
+         [(label_values, st["deadline_exceeded_total"]) for label_values, st in hedging]),
+        ("asr_sherpa_hedge_after_seconds", "gauge",
+         "Hedge delay per second of audio (recent latency percentile)", ("model",),
+         [(label_values, st["hedge_after_seconds_per_audio_second"]) for label_values, st in hedging
+          if st["hedge_after_seconds_per_audio_second"] is not None]),
+        ("asr_warmup_seconds", "gauge", "Time spent in each startup warm-up step", ("step",),
+         [((step,), seconds) for step, seconds in startup_warmup.steps.items()]
+         + ([(("total",), startup_warmup.seconds)] if startup_warmup.seconds is not None else [])),
+        ("asr_decoder_active", "gauge", "Running ffmpeg decodes", (), [((), decoder["active"])]),
+        ("asr_decoder_spares", "gauge", "Pre-spawned ffmpeg processes waiting for input", (),
+         [((), decoder["spares"])]),
+        ("asr_decoder_queued", "gauge", "Decodes waiting for an ffmpeg slot", (), [((), decoder["queued"])]),
+        ("asr_decoder_rejected_total", "counter", "Requests rejected because the decode queue was full", (),
+         [((), decoder["rejected_total"])]),
+        ("asr_admission_queued", "gauge", "Requests waiting for admission per priority class", ("class",),
+         [(label_values, st["queued"]) for label_values, st in classes]),
+        ("asr_admission_active", "gauge", "Admitted requests being decoded and recognized per priority class",
+         ("class",), [(label_values, st["active"]) for label_values, st in classes]),
+        ("asr_admission_rejected_total", "counter", "Requests rejected for a full queue or an exceeded quota",
+         ("class",), [(label_values, st["rejected_total"]) for label_values, st in classes]),
+        ("asr_cache_hits_total", "counter", "Transcription cache hits", ("tier",),
+         [(("memory",), cache["memory_hits"]), (("disk",), cache["disk_hits"])]),
+        ("asr_cache_misses_total", "counter", "Transcription cache misses", (), [((), cache["misses"])]),
+        ("asr_cache_evictions_total", "counter", "Transcription cache evictions", (), [((), cache["evictions"])]),
+        ("asr_cache_bytes", "gauge", "Bytes held by the in-memory transcription cache", (), [((), cache["bytes"])]),
+        ("asr_engine_in_flight", "gauge", "In-process engine decodes in flight", ("model",),
+         [(label_values, st["in_flight"]) for label_values, st in engines]),
+        ("asr_engine_decoded_total", "counter", "Segments decoded by the in-process engine", ("model",),
+         [(label_values, st["decoded_total"]) for label_values, st in engines]),
+        ("asr_model_loaded", "gauge", "1 if the in-process model is loaded", ("model",),
+         [(label_values, int(m.loaded)) for label_values, m in models]),
+        ("asr_model_requests_total", "counter", "Recognition requests per model", ("model",),
+         [(label_values, m.requests_total) for label_values, m in models]),
+        ("asr_model_loads_total", "counter", "In-process model loads", ("model",),
+         [(label_values, m.loads_total) for label_values, m in models]),
+        ("asr_model_evictions_total", "counter", "In-process models evicted to stay within the memory budget",
+         ("model",), [(label_values, m.evictions_total) for label_values, m in models]),
+        ("asr_model_loaded_bytes", "gauge", "Estimated memory held by loaded models", (),
+         [((), model_registry.loaded_bytes)]),
+        ("asr_model_memory_budget_bytes", "gauge", "Memory budget for loaded models", (),
+         [((), model_registry.memory_budget)]),
+        ("asr_job_files_queued", "gauge", "Batch job files waiting to be transcribed", (),
+         [((), jobs["files_queued"])]),
+        ("asr_job_files_active", "gauge", "Batch job files being transcribed", (), [((), jobs["active"])]),
+        ("asr_job_files_total", "counter", "Batch job files finished by this process", ("status",),
+         [(("completed",), jobs["completed_total"]), (("failed",), jobs["failed_total"])]),
+        ("asr_job_retries_total", "counter", "Batch job files requeued after a backend error", (),
+         [((), jobs["retried_total"])]),
+    ]
+
+
+# Prometheus 指标接口
+@app.get("/metrics")
+async def prometheus_metrics():
+    families = metrics.families()
+    if multiprocess_metrics.enabled:
+        # 多进程模式下合并所有工作进程的样本，无论请求落到哪个进程结果都一致
+        families = await asyncio.to_thread(multiprocess_metrics.collect, families)
+    return PlainTextResponse(metrics.render(families), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # 模型列表接口（OpenAI API 兼容）
 @app.get("/v1/models")
 async def list_models():
-    return {
-        "object": "list",
-        "data": [
-            {
-                "id": "whisper-1",
-                "object": "model",
-                "created": 1677610602,
-                "owned_by": "openai"
-            }
+    """列出注册表中的模型及其别名，别名条目的 root 指向实际模型"""
+    data = []
+    for model in model_registry.models.values():
+        entry = {
+            "id": model.id,
+            "object": "model",
+            "created": model.created,
+            "owned_by": model.owned_by,
+            "root": model.id,
+            "description": model.description,
+            "backend": model.backend,
+            "loaded": model.loaded,
+            "available": model.available(),
+            "pinned": model.pinned,
+            "default": model is model_registry.default,
+        }
+        data.append(entry)
+        data.extend({**entry, "id": alias} for alias in model.aliases)
+    return {"object": "list", "data": data}
+
+def prepare_multiprocess():
+    """多进程模式下，主进程在启动工作进程之前准备共享目录并恢复上次中断的批量任务文件
+
+    工作进程从环境变量继承配置：ASR_MULTIPROCESS_DIR 开启指标汇总，
+    未单独配置 TRANSCRIPTION_CACHE_DB 时各进程共用同一个磁盘缓存库，内存缓存作为各进程的一级缓存。
+    """
+    shared_dir = os.path.abspath(ASR_SHARED_DIR)
+    os.makedirs(shared_dir, exist_ok=True)
+    # 指标从本次启动开始累计
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.unlink(os.path.join(shared_dir, "metrics.db" + suffix))
+        except FileNotFoundError:
+            pass
+    os.environ["ASR_MULTIPROCESS_DIR"] = shared_dir
+    if not TRANSCRIPTION_CACHE_DB:
+        os.environ["TRANSCRIPTION_CACHE_DB"] = os.path.join(shared_dir, "transcriptions.db")
+    # 此时还没有工作进程，所有 running 状态的文件都是上次中断遗留的
+    store = TranscriptionJobStore(ASR_JOBS_DB, os.path.join(ASR_JOBS_DIR, "files"))
+    store.open()
+    store.close()
+
+
+def uvicorn_multiprocess_argv() -> list:
+    argv = [
+        sys.executable, "-m", "uvicorn", "asr_openai_api:app",
+        "--host", ASR_HOST,
+        "--port", str(ASR_PORT),
+        "--workers", str(ASR_WORKERS),
+        "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+        "--timeout-worker-healthcheck", str(ASR_WORKER_STARTUP_TIMEOUT),
+        "--timeout-graceful-shutdown", str(ASR_WORKER_GRACEFUL_TIMEOUT),
+    ]
+    if ASR_WORKER_MAX_REQUESTS > 0:
+        # 计数包含 /health 等所有 HTTP 请求
+        argv += [
+            "--limit-max-requests", str(ASR_WORKER_MAX_REQUESTS),
+            "--limit-max-requests-jitter", str(ASR_WORKER_MAX_REQUESTS_JITTER),
         ]
-    }
+    return argv
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -322,4 +4597,10 @@ if __name__ == "__main__":
     
     logger.info("启动语音转录中间件...")
     logger.info("✅ CORS 支持已启用，支持网页调用")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if ASR_WORKERS > 1:
+        logger.info(f"多进程模式: {ASR_WORKERS} 个工作进程，共享目录 {os.path.abspath(ASR_SHARED_DIR)}")
+        prepare_multiprocess()
+        # 由 uvicorn 命令行接管本进程作为主进程：工作进程以 spawn 方式启动，
+        # 在本脚本里调用 uvicorn.run 会让每个工作进程把本脚本作为 __mp_main__ 再执行一遍
+        os.execv(sys.executable, uvicorn_multiprocess_argv())
+    uvicorn.run(app, host=ASR_HOST, port=ASR_PORT)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""混合负载压测：批量客户端持续上传长音频的同时，测量交互式短音频请求的延迟
+
+批量请求带 API Key（在 ASR_API_KEYS 中配置为 bulk 优先级），交互式请求不带 Key，
+分别统计交互式请求的延迟分位数和批量请求的音频吞吐。
+--compare 会在本机启动模拟 Sherpa 服务和 API 服务，分别在关闭和开启准入调度时各测一次。
+
+    python benchmarks/make_corpus.py --durations 3,90 --formats wav
+    python benchmarks/bench_admission.py --compare --seconds 30
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from load_test import encode_multipart, load_corpus, wait_http  # noqa: E402
+
+BULK_KEY = "bench-bulk"
+
+
+def client_loop(url: str, clips: list, api_key: str, stop: threading.Event, results: list):
+    parsed = urllib.parse.urlparse(url)
+    conn = None
+    i = 0
+    while not stop.is_set():
+        clip = clips[i % len(clips)]
+        i += 1
+        body, content_type = encode_multipart(clip, "json")
+        headers = {"Content-Type": content_type, "X-Cache-Bypass": "1"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=600)
+            conn.request("POST", "/v1/audio/transcriptions", body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            conn = None
+            status = "error"
+        results.append((status, time.perf_counter() - start, clip["duration"] or 0.0, time.monotonic()))
+
+
+def run_mix(args, interactive: list, bulk: list) -> dict:
+    stop = threading.Event()
+    inter_results, bulk_results = [], []
+    threads = [
+        threading.Thread(target=client_loop, args=(args.url, bulk, BULK_KEY, stop, bulk_results))
+        for _ in range(args.bulk_concurrency)
+    ]
+    # 先让批量请求占满服务，再开始交互式请求
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    started = time.monotonic()
+    inter_threads = [
+        threading.Thread(target=client_loop, args=(args.url, interactive, "", stop, inter_results))
+        for _ in range(args.interactive_concurrency)
+    ]
+    for t in inter_threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads + inter_threads:
+        t.join()
+
+    latencies = np.array([lat for status, lat, _, _ in inter_results if status == 200])
+    bulk_audio = sum(audio for status, _, audio, done in bulk_results if status == 200 and done >= started)
+    return {
+        "interactive_requests": len(inter_results),
+        "interactive_ok": int(len(latencies)),
+        "interactive_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "interactive_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+        "interactive_p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        "bulk_requests": len(bulk_results),
+        "bulk_audio_seconds_per_second": bulk_audio / args.seconds,
+    }
+
+
+def spawn(args, admission: bool):
+    port = urllib.parse.urlparse(args.url).port or 8000
+    ports = [p for p in args.stub_ports.split(",") if p]
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_sherpa_server.py"), "--ports", ",".join(ports),
+        "--rtf", str(args.stub_rtf), "--workers", str(args.stub_workers),
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    env = dict(os.environ)
+    env.update({
+        "SHERPA_BACKENDS": ",".join(f"127.0.0.1:{p}" for p in ports),
+        "ASR_BACKEND": "websocket",
+        "ASR_ADMISSION_ENABLED": "1" if admission else "0",
+        "ASR_API_KEYS": json.dumps({BULK_KEY: {"client": "bench-bulk", "class": "bulk", "max_concurrent": 0}}),
+        "ASR_JOBS_DIR": os.path.join(ROOT, "asr_jobs_bench"),
+    })
+    api = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "asr_openai_api:app", "--host", "127.0.0.1", "--port", str(port),
+        "--log-level", "warning",
+    ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return [stub, api]
+
+
+def print_result(name: str, r: dict):
+    def ms(v):
+        return f"{v * 1000:.0f}ms" if v is not None else "-"
+    print(
+        f"{name:<10} 交互式 {r['interactive_ok']}/{r['interactive_requests']} 成功  "
+        f"p50={ms(r['interactive_p50'])} p95={ms(r['interactive_p95'])} p99={ms(r['interactive_p99'])}  "
+        f"批量吞吐={r['bulk_audio_seconds_per_second']:.1f} 秒音频/秒"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="交互式与批量混合负载压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus"))
+    parser.add_argument("--split-seconds", type=float, default=30, help="短于此时长的语料作为交互式请求")
+    parser.add_argument("--interactive-concurrency", type=int, default=2)
+    parser.add_argument("--bulk-concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--compare", action="store_true", help="启动本机服务，对比关闭与开启准入调度")
+    parser.add_argument("--stub-ports", default="16006,16007")
+    parser.add_argument("--stub-rtf", type=float, default=0.05)
+    parser.add_argument("--stub-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    clips = [c for c in load_corpus(args.corpus) if c["duration"]]
+    interactive = [c for c in clips if c["duration"] < args.split_seconds]
+    bulk = [c for c in clips if c["duration"] >= args.split_seconds]
+    if not interactive or not bulk:
+        parser.error("语料中需要同时有短于和长于 --split-seconds 的 wav 文件")
+
+    if not args.compare:
+        print_result("当前服务", run_mix(args, interactive, bulk))
+        return
+    for name, enabled in (("不调度", False), ("准入调度", True)):
+        procs = spawn(args, enabled)
+        try:
+            wait_http(args.url, 30)
+            result = run_mix(args, interactive, bulk)
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait()
+        print_result(name, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""对比进程内 sherpa-onnx 引擎与 Sherpa WebSocket 后端的实时率和延迟
+
+WebSocket 后端需要 non_streaming_server.py 已在运行（SHERPA_BACKENDS，默认 6006 端口）；
+进程内引擎使用与其相同的 SenseVoice 模型（可用 SENSE_VOICE_MODEL / SENSE_VOICE_TOKENS 覆盖）。
+
+用法:
+    python benchmarks/bench_engine_vs_ws.py --wav test.wav --requests 50 --concurrency 4
+    python benchmarks/bench_engine_vs_ws.py --duration 5 --backends local
+    python benchmarks/bench_engine_vs_ws.py --duration 3 --backends local --batch-windows 0,5,10,20 --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asr_openai_api as api  # noqa: E402
+
+api.logger.setLevel(logging.WARNING)
+
+
+def load_audio(args):
+    if args.wav:
+        samples, sample_rate = api.read_wave(args.wav)
+        return samples, sample_rate
+    # 没有提供音频时使用合成信号：识别结果无意义，但计算量与真实语音相当
+    rng = np.random.default_rng(0)
+    n = int(args.duration * api.TARGET_SAMPLE_RATE)
+    t = np.arange(n) / api.TARGET_SAMPLE_RATE
+    samples = 0.1 * np.sin(2 * np.pi * 220 * t) + 0.02 * rng.standard_normal(n)
+    return samples.astype(np.float32), api.TARGET_SAMPLE_RATE
+
+
+async def run(recognize, samples, sample_rate, requests: int, concurrency: int):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            await recognize(samples, sample_rate)
+            latencies.append(time.perf_counter() - start)
+
+    await recognize(samples, sample_rate)  # 预热
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - start
+    return wall, np.array(latencies)
+
+
+def report(name: str, wall: float, latencies: np.ndarray, audio_seconds: float):
+    total_audio = audio_seconds * len(latencies)
+    print(
+        f"{name:>10}  请求数={len(latencies)}  吞吐={len(latencies) / wall:6.2f} req/s  "
+        f"整体RTF={wall / total_audio:.4f}  单请求RTF={np.median(latencies) / audio_seconds:.4f}  "
+        f"p50={np.percentile(latencies, 50) * 1000:7.1f}ms  "
+        f"p99={np.percentile(latencies, 99) * 1000:7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="进程内引擎 vs WebSocket 后端基准测试")
+    parser.add_argument("--wav", help="WAV 测试音频；不提供时使用合成信号")
+    parser.add_argument("--duration", type=float, default=5.0, help="合成音频时长（秒）")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backends", default="local,websocket", help="要测试的后端，逗号分隔")
+    parser.add_argument("--model", help="注册表中的模型 ID（默认使用默认模型）")
+    parser.add_argument("--batch-windows", default=f"0,{api.ASR_BATCH_WINDOW_MS:g}",
+                        help="进程内引擎依次测试的微批窗口（毫秒），0 为不合批")
+    args = parser.parse_args()
+
+    samples, sample_rate = load_audio(args)
+    audio_seconds = len(samples) / sample_rate
+    print(f"音频时长 {audio_seconds:.2f} 秒, 请求数 {args.requests}, 并发 {args.concurrency}")
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    model = api.model_registry.resolve(args.model)
+    if "local" in backends:
+        # 默认配置（ASR_BACKEND=websocket）下模型没有进程内引擎，按 SenseVoice 配置单独创建
+        if model.engine is not None:
+            recognizer_type, recognizer_args = model.engine.recognizer_type, model.engine.recognizer_args
+        else:
+            recognizer_type = "sense_voice"
+            recognizer_args = {
+                "model": api.SENSE_VOICE_MODEL, "tokens": api.SENSE_VOICE_TOKENS, "use_itn": api.SENSE_VOICE_USE_ITN,
+            }
+        for window in (float(w) for w in args.batch_windows.split(",") if w.strip()):
+            engine = api.LocalRecognizerEngine(
+                recognizer_type, recognizer_args,
+                workers=api.ASR_ENGINE_WORKERS, num_threads=api.ASR_ENGINE_NUM_THREADS, batch_window_ms=window,
+            )
+            await asyncio.to_thread(engine.load)
+            wall, latencies = await run(engine.recognize, samples, sample_rate, args.requests, args.concurrency)
+            report(f"local/{window:g}ms", wall, latencies, audio_seconds)
+            batching = engine.batcher.stats()
+            if batching["enabled"]:
+                print(
+                    f"{'':>10}  平均批大小={batching['avg_batch_size']}  批大小分布={batching['batch_sizes']}  "
+                    f"排队 avg={batching['avg_wait_ms']}ms p95={batching['p95_wait_ms']}ms"
+                )
+            engine.close()
+    if "websocket" in backends and model.balancer is not None:
+        await model.balancer.start()
+        try:
+            wall, latencies = await run(model.balancer.recognize, samples, sample_rate, args.requests, args.concurrency)
+            report("websocket", wall, latencies, audio_seconds)
+        finally:
+            await model.balancer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
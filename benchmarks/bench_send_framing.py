@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""对比 send_to_sherpa 旧的切片分帧与 memoryview 分帧的耗时
+
+旧实现每发一帧都执行 buf = buf[payload_len:]，每次复制剩余的整个缓冲区，
+耗时随音频长度平方增长；memoryview 分帧不复制样本数据，耗时应线性增长。
+
+用法: python benchmarks/bench_send_framing.py --durations 10,60,300,600
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asr_openai_api import iter_sherpa_frames  # noqa: E402
+
+
+def legacy_frames(samples: np.ndarray, sample_rate: int, frame_size: int):
+    """改造前 send_to_sherpa 的分帧方式"""
+    buf = sample_rate.to_bytes(4, "little")
+    buf += (samples.size * 4).to_bytes(4, "little")
+    buf += samples.tobytes()
+    while len(buf) > frame_size:
+        yield buf[:frame_size]
+        buf = buf[frame_size:]
+    if buf:
+        yield buf
+
+
+def consume(frames) -> int:
+    """模拟 ws.send：websockets 组帧时会把每帧负载写入一次输出缓冲"""
+    total = 0
+    for frame in frames:
+        total += len(bytes(frame))
+    return total
+
+
+def bench(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sherpa 分帧发送基准测试")
+    parser.add_argument("--durations", default="10,30,60,120,300,600", help="音频时长（秒），逗号分隔")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--frame-size", type=int, default=10240)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max-duration", type=float, default=600, help="超过该时长不再测旧实现")
+    args = parser.parse_args()
+
+    durations = [float(d) for d in args.durations.split(",") if d]
+    print(f"{'时长(s)':>8} {'数据(MB)':>9} {'memoryview(ms)':>15} {'ns/样本':>8} {'旧实现(ms)':>11} {'ns/样本':>8}")
+    for duration in durations:
+        samples = np.random.default_rng(0).standard_normal(int(duration * args.sample_rate)).astype(np.float32)
+        size_mb = samples.nbytes / 1e6
+
+        new_s = bench(lambda: consume(iter_sherpa_frames(samples, args.sample_rate, args.frame_size)), args.repeat)
+        new_ns = new_s / samples.size * 1e9
+
+        if duration <= args.legacy_max_duration:
+            old_s = bench(lambda: consume(legacy_frames(samples, args.sample_rate, args.frame_size)), 1)
+            old_cols = f"{old_s * 1000:>11.2f} {old_s / samples.size * 1e9:>8.2f}"
+        else:
+            old_cols = f"{'-':>11} {'-':>8}"
+
+        print(f"{duration:>8.0f} {size_mb:>9.1f} {new_s * 1000:>15.2f} {new_ns:>8.2f} {old_cols}")
+
+    print("memoryview 分帧的 ns/样本 应基本恒定（线性），旧实现随时长增长（平方）。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""对比同机识别进程的两种样本传输：WebSocket 分帧 vs 共享内存段
+
+两端的识别都是零耗时的模拟（WebSocket 端为 stub_sherpa_server.py，共享内存端为
+shm_recognizer_worker.py 的服务类加一个只读样本的假引擎），测得的就是纯传输开销。
+
+用法: python benchmarks/bench_shm_transport.py --durations 60,600 --repeat 5
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import asr_openai_api as api  # noqa: E402
+
+
+class TouchEngine:
+    """读取一遍样本后立即返回，相当于识别耗时为零"""
+
+    async def recognize(self, samples: np.ndarray, sample_rate: int) -> str:
+        return f"{len(samples)} {float(samples[::4096].sum()):.3f}"
+
+
+def run_shm_worker(socket_path: str):
+    from shm_recognizer_worker import SharedMemoryRecognizerServer
+
+    async def serve():
+        server = SharedMemoryRecognizerServer(TouchEngine(), socket_path)
+        await server.start()
+        await asyncio.Future()
+
+    asyncio.run(serve())
+
+
+async def wait_ready(backend: "api.SherpaBackend", timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not await backend.pool.probe():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"识别进程未就绪: {backend.address}")
+        await asyncio.sleep(0.1)
+
+
+async def bench(address: str, durations: list, repeat: int):
+    backend = api.SherpaBackend(address)
+    await wait_ready(backend)
+    await backend.pool.start()
+    rows = []
+    try:
+        for duration in durations:
+            samples = (0.1 * np.random.default_rng(0).standard_normal(int(duration * 16000))).astype(np.float32)
+            await backend.send(samples, 16000)  # 预热连接（共享内存端同时分配好段）
+            start = time.perf_counter()
+            for _ in range(repeat):
+                await backend.send(samples, 16000)
+            seconds = (time.perf_counter() - start) / repeat
+            rows.append((duration, seconds, samples.nbytes / seconds / 1e6))
+    finally:
+        await backend.pool.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 与共享内存传输对比")
+    parser.add_argument("--durations", default="20,60,600", help="音频时长（秒），逗号分隔")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=16106)
+    args = parser.parse_args()
+    durations = [float(d) for d in args.durations.split(",") if d]
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "shm_bench.sock")
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_sherpa_server.py"),
+        "--ports", str(args.port), "--latency-base", "0", "--rtf", "0", "--jitter", "0",
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    worker = multiprocessing.Process(target=run_shm_worker, args=(socket_path,), daemon=True)
+    worker.start()
+    try:
+        results = {
+            "websocket": asyncio.run(bench(f"127.0.0.1:{args.port}", durations, args.repeat)),
+            "shm": asyncio.run(bench(f"unix:{socket_path}", durations, args.repeat)),
+        }
+    finally:
+        stub.terminate()
+        stub.wait()
+        worker.terminate()
+        worker.join()
+
+    print(f"{'传输':<10} {'音频(秒)':>8} {'每次(ms)':>10} {'吞吐(MB/s)':>11}")
+    for name, rows in results.items():
+        for duration, seconds, mb_s in rows:
+            print(f"{name:<10} {duration:>8.0f} {seconds * 1000:>10.1f} {mb_s:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""对比 WAV 读取：内存映射 + 分块转换 + 进程内重采样 vs ffmpeg 子进程解码
+
+旧流程中非 16-bit 或非 16kHz 的 WAV 要交给 ffmpeg 转换（或以原始采样率发给 Sherpa），
+新的 read_wave 直接从映射的文件分块转换为 16kHz 单声道，临时内存只有一个分块大小。
+
+用法: python benchmarks/bench_wav_reader.py --duration 600 --rate 44100 --channels 2 --bits 24
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asr_openai_api as api  # noqa: E402
+
+
+def write_test_wav(path: str, duration: float, rate: int, channels: int, bits: int):
+    """分块写出，避免生成测试文件本身占用大量内存"""
+    n_frames = int(duration * rate)
+    block_align = channels * bits // 8
+    fmt_tag = api.WAVE_FORMAT_IEEE_FLOAT if bits == 64 else api.WAVE_FORMAT_PCM
+    data_size = n_frames * block_align
+    rng = np.random.default_rng(0)
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + (36 + data_size).to_bytes(4, "little") + b"WAVE")
+        f.write(b"fmt " + (16).to_bytes(4, "little"))
+        f.write(np.array([fmt_tag, channels], "<u2").tobytes())
+        f.write(np.array([rate, rate * block_align], "<u4").tobytes())
+        f.write(np.array([block_align, bits], "<u2").tobytes())
+        f.write(b"data" + data_size.to_bytes(4, "little"))
+        step = rate * 10
+        for start in range(0, n_frames, step):
+            x = 0.3 * rng.standard_normal((min(step, n_frames - start), channels))
+            if bits == 16:
+                f.write((x * 32767).astype("<i2").tobytes())
+            elif bits == 24:
+                v = (x * (2 ** 23 - 1)).astype("<i4")
+                f.write(v.view(np.uint8).reshape(-1, 4)[:, :3].tobytes())
+            elif bits == 32:
+                f.write((x * (2 ** 31 - 1)).astype("<i4").tobytes())
+            else:
+                f.write(x.astype("<f8").tobytes())
+
+
+def bench_read_wave(path: str):
+    start = time.perf_counter()
+    samples, _ = api.read_wave(path)
+    return time.perf_counter() - start, len(samples)
+
+
+def bench_ffmpeg(path: str):
+    start = time.perf_counter()
+    out = subprocess.run(api._ffmpeg_decode_cmd(path), capture_output=True, check=True).stdout
+    samples = api.pcm16_to_float32(out)
+    return time.perf_counter() - start, len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WAV 读取基准测试")
+    parser.add_argument("--duration", type=float, default=600)
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--bits", type=int, default=24, choices=[16, 24, 32, 64])
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        write_test_wav(path, args.duration, args.rate, args.channels, args.bits)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"测试文件 {size_mb:.1f} MB: {args.duration:.0f} 秒, {args.rate} Hz, {args.channels} 声道, {args.bits} 位")
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        seconds, n = bench_read_wave(path)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss 在 Linux 上以 KB 为单位，macOS 上以字节为单位
+        rss_unit = 1 if sys.platform == "darwin" else 1024
+        print(
+            f"read_wave  {seconds * 1000:9.1f} ms  输出 {n} 样本  "
+            f"RTF={seconds / args.duration:.5f}  峰值内存增长 {(rss_after - rss_before) * rss_unit / 1e6:.1f} MB"
+            f"（含返回的 16kHz 样本 {n * 4 / 1e6:.1f} MB）"
+        )
+        if api.check_ffmpeg():
+            seconds, n = bench_ffmpeg(path)
+            print(f"ffmpeg     {seconds * 1000:9.1f} ms  输出 {n} 样本  RTF={seconds / args.duration:.5f}")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""对 /v1/audio/transcriptions 做并发压测，输出吞吐、延迟分位数和分阶段耗时
+
+分阶段耗时取自响应的 Server-Timing 头（read_upload、decode、vad、sherpa_wait 等）。
+只依赖标准库和 numpy，配合 stub_sherpa_server.py 可以在没有模型、没有网络的机器上运行：
+
+    python benchmarks/make_corpus.py
+    python benchmarks/load_test.py --spawn --requests 200 --concurrency 8
+
+--spawn 会在本机启动模拟 Sherpa 服务和 asr_openai_api（uvicorn 子进程），压测结束后关闭；
+不加 --spawn 时压测 --url 指向的已运行服务。
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONTENT_TYPES = {
+    ".wav": "audio/wav",
+    ".webm": "audio/webm",
+    ".ogg": "audio/ogg",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".pcm": "audio/pcm",
+}
+
+
+def load_corpus(path: str):
+    clips = []
+    for name in sorted(os.listdir(path)):
+        suffix = os.path.splitext(name)[1].lower()
+        if suffix not in CONTENT_TYPES:
+            continue
+        with open(os.path.join(path, name), "rb") as f:
+            data = f.read()
+        duration = None
+        if suffix == ".wav":
+            with wave.open(os.path.join(path, name), "rb") as w:
+                duration = w.getnframes() / w.getframerate()
+        clips.append({"name": name, "data": data, "content_type": CONTENT_TYPES[suffix], "duration": duration})
+    return clips
+
+
+def encode_multipart(clip: dict, response_format: str):
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="response_format"\r\n\r\n{response_format}\r\n'
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{clip["name"]}"\r\n'
+        f"Content-Type: {clip['content_type']}\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    return head + clip["data"] + tail, f"multipart/form-data; boundary={boundary}"
+
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = float(value) / 1000
+    return stages
+
+
+class LoadClient:
+    """每个压测线程复用一个 HTTP 长连接"""
+
+    def __init__(self, url: str, bypass_cache: bool, response_format: str, timeout: float):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = parsed.path.rstrip("/") + "/v1/audio/transcriptions"
+        self.bypass_cache = bypass_cache
+        self.response_format = response_format
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, clip: dict) -> dict:
+        body, content_type = encode_multipart(clip, self.response_format)
+        headers = {"Content-Type": content_type}
+        if self.bypass_cache:
+            headers["X-Cache-Bypass"] = "1"
+        start = time.perf_counter()
+        try:
+            conn = self._conn()
+            conn.request("POST", self.path, body=body, headers=headers)
+            resp = conn.getresponse()
+            payload = resp.read()
+            status = resp.status
+            timing = parse_server_timing(resp.getheader("Server-Timing", ""))
+            duration = clip["duration"]
+            if duration is None and status == 200 and self.response_format == "verbose_json":
+                duration = json.loads(payload).get("duration")
+        except (OSError, http.client.HTTPException) as e:
+            self._local.conn = None
+            return {"status": type(e).__name__, "latency": time.perf_counter() - start, "stages": {}, "audio": 0.0}
+        return {
+            "status": status,
+            "latency": time.perf_counter() - start,
+            "stages": timing,
+            "audio": duration or 0.0,
+        }
+
+
+def run_load(client: LoadClient, clips: list, requests: int, concurrency: int):
+    # 每个线程先发一个请求预热连接和服务端连接池
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client.send, [clips[i % len(clips)] for i in range(concurrency)]))
+        start = time.perf_counter()
+        results = list(pool.map(client.send, [clips[i % len(clips)] for i in range(requests)]))
+    return time.perf_counter() - start, results
+
+
+def summarize(wall: float, results: list) -> dict:
+    latencies = np.array([r["latency"] for r in results if r["status"] == 200])
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    stage_values = {}
+    for r in results:
+        for name, seconds in r["stages"].items():
+            stage_values.setdefault(name, []).append(seconds)
+    summary = {
+        "requests": len(results),
+        "ok": int(len(latencies)),
+        "statuses": statuses,
+        "wall_seconds": wall,
+        "requests_per_second": len(results) / wall if wall else 0.0,
+        "audio_seconds_per_second": sum(r["audio"] for r in results) / wall if wall else 0.0,
+        "latency": {},
+        "stages": {},
+    }
+    if len(latencies):
+        summary["latency"] = {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+        }
+    for name, values in stage_values.items():
+        values = np.array(values)
+        summary["stages"][name] = {
+            "mean": float(values.mean()),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "count": int(len(values)),
+        }
+    return summary
+
+
+def print_summary(summary: dict):
+    print(
+        f"请求数={summary['requests']}  成功={summary['ok']}  状态={summary['statuses']}  "
+        f"耗时={summary['wall_seconds']:.2f}s"
+    )
+    print(
+        f"吞吐={summary['requests_per_second']:.2f} req/s  "
+        f"音频吞吐={summary['audio_seconds_per_second']:.1f} 秒音频/秒"
+    )
+    lat = summary["latency"]
+    if lat:
+        print(
+            f"延迟 mean={lat['mean'] * 1000:.1f}ms  p50={lat['p50'] * 1000:.1f}ms  "
+            f"p95={lat['p95'] * 1000:.1f}ms  p99={lat['p99'] * 1000:.1f}ms  max={lat['max'] * 1000:.1f}ms"
+        )
+    if summary["stages"]:
+        print(f"{'阶段':<14} {'次数':>6} {'mean(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10}")
+        for name, st in summary["stages"].items():
+            print(
+                f"{name:<14} {st['count']:>6} {st['mean'] * 1000:>10.1f} "
+                f"{st['p50'] * 1000:>10.1f} {st['p95'] * 1000:>10.1f}"
+            )
+
+
+def wait_http(url: str, timeout: float):
+    parsed = urllib.parse.urlparse(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=1)
+            conn.request("GET", "/metrics")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务在 {timeout} 秒内未就绪: {url}")
+
+
+def spawn_services(args):
+    """启动模拟 Sherpa 服务和 API 服务，返回子进程列表"""
+    procs = []
+    ports = [p for p in args.stub_ports.split(",") if p]
+    procs.append(subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stub_sherpa_server.py"),
+        "--ports", ",".join(ports),
+        "--latency-base", str(args.stub_latency_base),
+        "--rtf", str(args.stub_rtf),
+        "--workers", str(args.stub_workers),
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    env = dict(os.environ)
+    env["SHERPA_BACKENDS"] = ",".join(f"127.0.0.1:{p}" for p in ports)
+    env["ASR_BACKEND"] = "websocket"
+    port = urllib.parse.urlparse(args.url).port or 8000
+    procs.append(subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "asr_openai_api:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转录接口并发压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus"), help="make_corpus.py 生成的目录")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--formats", default="", help="只使用这些扩展名的语料，如 wav,webm")
+    parser.add_argument("--response-format", default="json")
+    parser.add_argument("--use-cache", action="store_true", help="不发送 X-Cache-Bypass，允许命中转录缓存")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="把结果写入 JSON 文件，便于对比不同版本")
+    parser.add_argument("--spawn", action="store_true", help="在本机启动模拟 Sherpa 服务和 API 服务")
+    parser.add_argument("--stub-ports", default="16006,16007")
+    parser.add_argument("--stub-latency-base", type=float, default=0.02)
+    parser.add_argument("--stub-rtf", type=float, default=0.05)
+    parser.add_argument("--stub-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.corpus):
+        parser.error(f"语料目录不存在: {args.corpus}（先运行 benchmarks/make_corpus.py）")
+    clips = load_corpus(args.corpus)
+    if args.formats:
+        wanted = {"." + f.strip().lstrip(".") for f in args.formats.split(",") if f.strip()}
+        clips = [c for c in clips if os.path.splitext(c["name"])[1] in wanted]
+    if not clips:
+        parser.error(f"语料目录中没有可用的音频: {args.corpus}")
+    known = [c["duration"] for c in clips if c["duration"]]
+    print(f"语料 {len(clips)} 个文件, wav 总时长 {sum(known):.1f} 秒, 并发 {args.concurrency}, 请求数 {args.requests}")
+
+    procs = spawn_services(args) if args.spawn else []
+    try:
+        wait_http(args.url, 30)
+        response_format = args.response_format
+        # 非 wav 语料需要服务端返回时长才能计算音频吞吐
+        if response_format == "json" and any(c["duration"] is None for c in clips):
+            response_format = "verbose_json"
+        client = LoadClient(args.url, not args.use_cache, response_format, args.timeout)
+        wall, results = run_load(client, clips, args.requests, args.concurrency)
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            proc.wait()
+
+    summary = summarize(wall, results)
+    summary["config"] = {
+        "concurrency": args.concurrency,
+        "corpus": args.corpus,
+        "files": len(clips),
+        "spawn": args.spawn,
+    }
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
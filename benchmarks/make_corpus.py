@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""生成压测用的合成音频语料（wav / webm 等）
+
+合成信号由带谐波的"音节"和长短不一的停顿组成，能触发 VAD 分段，
+识别结果没有意义，但解码、分段和发送的开销与真实语音相当。
+wav 直接用 wave 模块写出；其他格式需要本机安装 ffmpeg（不需要联网）。
+
+用法:
+    python benchmarks/make_corpus.py --durations 2,5,15,60 --formats wav,webm --copies 2
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+
+FFMPEG_CODECS = {
+    "webm": ["-c:a", "libopus", "-b:a", "32k"],
+    "ogg": ["-c:a", "libopus", "-b:a", "32k"],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "64k"],
+    "m4a": ["-c:a", "aac", "-b:a", "64k"],
+}
+
+
+def synth_speech(duration: float, sample_rate: int, rng: np.random.Generator) -> np.ndarray:
+    """交替生成 0.1~0.3 秒的音节和 0.05~1.0 秒的停顿，叠加低电平底噪"""
+    n = int(duration * sample_rate)
+    out = 0.003 * rng.standard_normal(n)
+    pos = int(rng.uniform(0.1, 0.4) * sample_rate)
+    while pos < n:
+        syllable = int(rng.uniform(0.1, 0.3) * sample_rate)
+        end = min(n, pos + syllable)
+        t = np.arange(end - pos) / sample_rate
+        f0 = rng.uniform(100, 250)
+        tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        envelope = np.hanning(end - pos)
+        out[pos:end] += rng.uniform(0.1, 0.3) * envelope * tone
+        # 句内短停顿为主，偶尔出现长停顿，让 VAD 切出多个语音段
+        pause = rng.uniform(0.5, 1.0) if rng.random() < 0.15 else rng.uniform(0.05, 0.2)
+        pos = end + int(pause * sample_rate)
+    return np.clip(out, -1.0, 1.0).astype(np.float32)
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((samples * 32767).astype("<i2").tobytes())
+
+
+def encode(wav_path: str, out_path: str, fmt: str):
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", wav_path, *FFMPEG_CODECS[fmt], out_path]
+    subprocess.run(cmd, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成压测语料")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus"))
+    parser.add_argument("--durations", default="2,5,15,60", help="音频时长（秒），逗号分隔")
+    parser.add_argument("--formats", default="wav,webm", help=f"输出格式，可选 wav,{','.join(FFMPEG_CODECS)}")
+    parser.add_argument("--copies", type=int, default=1, help="每种时长生成的不同内容份数")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f != "wav" and f not in FFMPEG_CODECS]
+    if unknown:
+        parser.error(f"不支持的格式: {unknown}")
+    needs_ffmpeg = any(f != "wav" for f in formats)
+    if needs_ffmpeg and shutil.which("ffmpeg") is None:
+        parser.error("生成 wav 以外的格式需要 ffmpeg")
+
+    os.makedirs(args.out, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+    count = 0
+    for duration in (float(d) for d in args.durations.split(",") if d):
+        for copy in range(args.copies):
+            samples = synth_speech(duration, args.sample_rate, rng)
+            stem = os.path.join(args.out, f"clip_{duration:g}s_{copy}")
+            wav_path = stem + ".wav"
+            write_wav(wav_path, samples, args.sample_rate)
+            for fmt in formats:
+                if fmt != "wav":
+                    encode(wav_path, f"{stem}.{fmt}", fmt)
+                count += 1
+            if "wav" not in formats:
+                os.unlink(wav_path)
+    print(f"已生成 {count} 个文件: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
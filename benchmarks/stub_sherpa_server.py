@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""模拟 non_streaming_server.py 的 Sherpa WebSocket 服务，用于无模型压测
+
+协议与真实服务一致：采样率(4字节) + 样本字节大小(4字节) + float32 样本，
+收齐一段音频后返回识别文本，同一连接可连续识别多段，收到 "Done" 后关闭。
+识别耗时按 latency_base + rtf × 音频时长 模拟（可加随机抖动），
+并发识别数受 --workers 限制，与真实服务的线程池行为相近。
+--stall-rate 模拟偶发的识别卡顿（占用一个识别线程 --stall-seconds 秒），用于观察截止时间和对冲请求的效果。
+
+用法:
+    python benchmarks/stub_sherpa_server.py --ports 6006,6007 --rtf 0.05 --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import random
+
+import websockets
+
+logger = logging.getLogger("stub_sherpa")
+
+
+class StubRecognizer:
+    def __init__(self, latency_base: float, rtf: float, jitter: float, workers: int, fail_rate: float,
+                 stall_rate: float = 0.0, stall_seconds: float = 10.0):
+        self.latency_base = latency_base
+        self.rtf = rtf
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self._sem = asyncio.Semaphore(max(1, workers))
+        self.requests_total = 0
+
+    async def recognize(self, sample_rate: int, nbytes: int) -> str:
+        duration = nbytes / 4 / max(1, sample_rate)
+        latency = self.latency_base + self.rtf * duration
+        if self.jitter:
+            latency *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.stall_rate and random.random() < self.stall_rate:
+            latency += self.stall_seconds
+        async with self._sem:
+            await asyncio.sleep(max(0.0, latency))
+        self.requests_total += 1
+        return f"模拟识别结果 {duration:.2f} 秒"
+
+    async def handle(self, ws):
+        buf = bytearray()
+        expected = None
+        sample_rate = 0
+        async for message in ws:
+            if isinstance(message, str):
+                if message == "Done":
+                    break
+                continue
+            buf += message
+            if expected is None and len(buf) >= 8:
+                sample_rate = int.from_bytes(buf[:4], "little")
+                expected = int.from_bytes(buf[4:8], "little")
+            if expected is not None and len(buf) >= 8 + expected:
+                if self.fail_rate and random.random() < self.fail_rate:
+                    await ws.close(code=1011, reason="simulated failure")
+                    return
+                await ws.send(await self.recognize(sample_rate, expected))
+                del buf[:8 + expected]
+                expected = None
+
+
+async def serve(args):
+    ports = [int(p) for p in args.ports.split(",") if p]
+    servers = []
+    for port in ports:
+        # 每个端口相当于一个独立的服务实例，拥有各自的识别线程数
+        recognizer = StubRecognizer(
+            args.latency_base, args.rtf, args.jitter, args.workers, args.fail_rate,
+            args.stall_rate, args.stall_seconds,
+        )
+        servers.append(await websockets.serve(recognizer.handle, args.host, port, max_size=None))
+    logger.info(
+        f"模拟 Sherpa 服务已启动: {args.host}:{ports}, latency_base={args.latency_base}s, "
+        f"rtf={args.rtf}, workers={args.workers}"
+    )
+    try:
+        await asyncio.Future()
+    finally:
+        for server in servers:
+            server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 Sherpa WebSocket 识别服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", default="6006", help="监听端口，逗号分隔可模拟多个实例")
+    parser.add_argument("--latency-base", type=float, default=0.02, help="每段音频的固定耗时（秒）")
+    parser.add_argument("--rtf", type=float, default=0.05, help="每秒音频的识别耗时（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="耗时随机浮动比例")
+    parser.add_argument("--workers", type=int, default=4, help="每个端口同时识别的段数")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="随机断开连接的概率")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="识别卡顿的概率")
+    parser.add_argument("--stall-seconds", type=float, default=10.0, help="每次卡顿的额外耗时（秒）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""同机识别进程：通过共享内存接收样本，作为 asr_openai_api.py 的 unix: 后端
+
+API 与识别服务部署在同一台机器时，用它代替 non_streaming_server.py，
+省去把整段 float32 样本经 WebSocket 分帧、在回环网络上复制的开销，长音频的吞吐只受识别速度限制。
+
+协议（Unix socket，每行一个 JSON，同一连接上顺序处理）:
+  请求 {"shm": 段名, "samples": 样本数, "sample_rate": 采样率}，float32 样本位于共享内存段开头
+  响应 {"text": 识别结果} 或 {"error": 错误信息}
+共享内存段由 API 进程创建和删除，本进程只映射读取，从不 unlink。
+
+用法:
+    python3 shm_recognizer_worker.py --socket /tmp/asr_sherpa_0.sock \\
+        --sense-voice=./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17/model.int8.onnx \\
+        --tokens=./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17/tokens.txt
+    SHERPA_BACKENDS=unix:/tmp/asr_sherpa_0.sock python3 asr_openai_api.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from asr_engine import ASR_BATCH_MAX_SIZE, ASR_BATCH_WINDOW_MS, LocalRecognizerEngine
+
+logger = logging.getLogger("shm_recognizer")
+
+
+def attach_segment(name: str) -> shared_memory.SharedMemory:
+    """映射 API 进程创建的段；不登记到 resource_tracker，否则本进程退出时会把段删掉"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class SharedMemoryRecognizerServer:
+    """接受 API 进程的连接，按请求中的段名映射共享内存并交给识别引擎
+
+    engine 需提供 async recognize(samples, sample_rate) -> str，通常为 LocalRecognizerEngine。
+    每条连接缓存最近映射的段，API 进程复用同一段时不必重新映射。
+    """
+
+    def __init__(self, engine, socket_path: str):
+        self.engine = engine
+        self.socket_path = socket_path
+        self._server = None
+        self.connections = 0
+        self.requests_total = 0
+        self.errors_total = 0
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # 上次异常退出遗留的 socket 文件
+        self._server = await asyncio.start_unix_server(self.handle, path=self.socket_path, limit=1 << 20)
+        logger.info(f"共享内存识别服务已启动: {self.socket_path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    async def _recognize(self, shm: shared_memory.SharedMemory, request: dict) -> str:
+        n = int(request["samples"])
+        if n * 4 > shm.size:
+            raise ValueError(f"样本数 {n} 超出共享内存段大小 {shm.size}")
+        samples = np.ndarray(n, dtype=np.float32, buffer=shm.buf)
+        try:
+            return await self.engine.recognize(samples, int(request["sample_rate"]))
+        finally:
+            del samples
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        shm = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if shm is None or shm.name.lstrip("/") != request["shm"].lstrip("/"):
+                        if shm is not None:
+                            shm.close()
+                            shm = None
+                        shm = attach_segment(request["shm"])
+                    reply = {"text": await self._recognize(shm, request)}
+                except Exception as e:
+                    self.errors_total += 1
+                    logger.error(f"识别失败: {e}")
+                    reply = {"error": str(e)}
+                self.requests_total += 1
+                writer.write(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+            writer.close()
+
+
+async def serve(args):
+    engine = LocalRecognizerEngine(
+        "sense_voice",
+        {"model": args.sense_voice, "tokens": args.tokens, "use_itn": args.use_itn},
+        workers=args.workers,
+        num_threads=args.num_threads,
+        batch_window_ms=args.batch_window_ms,
+        batch_max_size=args.batch_max_size,
+    )
+    await asyncio.to_thread(engine.load)
+    server = SharedMemoryRecognizerServer(engine, args.socket)
+    await server.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+        engine.close()
+        logger.info(f"共享内存识别服务已退出，共处理 {server.requests_total} 个请求")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享内存传输的同机 SenseVoice 识别进程")
+    parser.add_argument("--socket", required=True, help="Unix socket 路径，API 中配置为 unix:<路径>")
+    parser.add_argument("--sense-voice", required=True, help="SenseVoice 模型文件")
+    parser.add_argument("--tokens", required=True)
+    parser.add_argument("--use-itn", type=int, default=1)
+    parser.add_argument("--num-threads", type=int, default=1, help="每次解码使用的线程数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="同时解码的批数")
+    parser.add_argument("--batch-window-ms", type=float, default=ASR_BATCH_WINDOW_MS, help="微批等待窗口，0 为关闭")
+    parser.add_argument("--batch-max-size", type=int, default=ASR_BATCH_MAX_SIZE, help="每批最多段数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
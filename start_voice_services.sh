@@ -6,6 +6,14 @@
 BASE_DIR="/Users/huang/Downloads/downlload/code-huangs/dockers/sherpa-onnx/sherpa-onnx"
 LOGS_DIR="$BASE_DIR/logs"
 
+# Sherpa 实例数量与起始端口：启动 N 个识别进程，端口依次递增，由 API 负载均衡
+SHERPA_BASE_PORT=${SHERPA_BASE_PORT:-6006}
+SHERPA_NUM_INSTANCES=${SHERPA_NUM_INSTANCES:-1}
+# Sherpa 传输方式：websocket（non_streaming_server.py）或 shm（同机 shm_recognizer_worker.py，样本经共享内存传递）
+SHERPA_TRANSPORT=${SHERPA_TRANSPORT:-websocket}
+# 等待所有服务就绪的最长时间（秒）
+SUPERVISOR_START_TIMEOUT=${SUPERVISOR_START_TIMEOUT:-120}
+
 # 颜色输出函数
 RED='\033[0;31m'
 GREEN='\033[0;32m'
@@ -66,14 +74,34 @@ check_port() {
     return $?
 }
 
-# 函数：杀死占用端口的进程
-kill_port_process() {
+# 函数：列出所有 Sherpa 实例端口
+sherpa_ports() {
+    seq "$SHERPA_BASE_PORT" $((SHERPA_BASE_PORT + SHERPA_NUM_INSTANCES - 1))
+}
+
+# 函数：shm 传输时实例的 Unix socket 路径（仍按端口号区分实例）
+sherpa_socket() {
+    echo "$LOGS_DIR/sherpa_$1.sock"
+}
+
+# 函数：检查 Sherpa 实例是否在监听
+sherpa_instance_up() {
     local port=$1
-    local pids=$(lsof -ti:$port 2>/dev/null)
-    if [ -n "$pids" ]; then
-        print_warning "杀死占用端口 $port 的进程: $pids"
-        echo $pids | xargs kill -9 2>/dev/null || true
-        sleep 2
+    if [ "$SHERPA_TRANSPORT" = "shm" ]; then
+        [ -S "$(sherpa_socket $port)" ]
+    else
+        check_port $port
+    fi
+}
+
+# 函数：生成传给 API 的 Sherpa 后端列表，例如 127.0.0.1:6006,127.0.0.1:6007 或 unix:.../sherpa_6006.sock
+sherpa_backends() {
+    if [ "$SHERPA_TRANSPORT" = "shm" ]; then
+        for port in $(sherpa_ports); do
+            echo "unix:$(sherpa_socket $port)"
+        done | paste -sd, -
+    else
+        sherpa_ports | sed 's/^/127.0.0.1:/' | paste -sd, -
     fi
 }
 
@@ -85,8 +113,11 @@ check_required_files() {
     local model_file="./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17/model.int8.onnx"
     local tokens_file="./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17/tokens.txt"
     local server_file="./python-api-examples/non_streaming_server.py"
+    if [ "$SHERPA_TRANSPORT" = "shm" ]; then
+        server_file="shm_recognizer_worker.py"
+    fi
     
-    for file in "$model_file" "$tokens_file" "$server_file" "asr_openai_api.py" "voice_web.py"; do
+    for file in "$model_file" "$tokens_file" "$server_file" "asr_openai_api.py" "asr_metrics.py" "asr_engine.py" "voice_web.py"; do
         if [ ! -f "$file" ]; then
             print_error "缺少必要文件: $file"
             return 1
@@ -97,109 +128,73 @@ check_required_files() {
     return 0
 }
 
-# 函数：启动sherpa服务
-start_sherpa() {
-    print_info "启动 Sherpa 语音识别服务..."
-    
-    # 检查并清理端口
-    if check_port 6006; then
-        print_warning "端口 6006 被占用，清理中..."
-        kill_port_process 6006
-    fi
-    
-    # 使用完整路径启动sherpa服务，不依赖sherpa_onnx模块导入
-    print_info "启动命令: python3 ./python-api-examples/non_streaming_server.py"
-    
-    nohup python3 ./python-api-examples/non_streaming_server.py \
-        --sense-voice=./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17/model.int8.onnx \
-        --tokens=./sherpa-onnx-sense-voice-zh-en-ja-ko-yue-2024-07-17/tokens.txt \
-        --port=6006 \
-        > "$LOGS_DIR/sherpa.log" 2>&1 &
-    
-    SHERPA_PID=$!
-    print_success "Sherpa 服务已启动，PID: $SHERPA_PID"
-    echo $SHERPA_PID > "$LOGS_DIR/sherpa.pid"
-    
-    # 等待服务启动
-    print_info "等待 Sherpa 服务启动..."
-    for i in {1..10}; do
-        if check_port 6006; then
-            print_success "Sherpa 服务启动成功 (端口 6006)"
-            return 0
-        fi
-        sleep 1
-    done
-    
-    print_error "Sherpa 服务启动失败，请检查日志"
-    return 1
+# 函数：监管进程是否在运行
+supervisor_running() {
+    [ -f "$LOGS_DIR/supervisor.pid" ] && kill -0 "$(cat "$LOGS_DIR/supervisor.pid")" 2>/dev/null
 }
 
-# 函数：启动API服务
-start_api() {
-    print_info "启动 ASR OpenAI API 服务..."
-    
-    # 检查并清理端口
-    if check_port 8000; then
-        print_warning "端口 8000 被占用，清理中..."
-        kill_port_process 8000
+# 函数：输出各服务的启动耗时（读取监管进程的状态文件）
+print_startup_times() {
+    python3 - "$LOGS_DIR/supervisor.json" <<'PY' 2>/dev/null
+import json, sys
+status = json.load(open(sys.argv[1]))
+print(f"全部就绪用时: {status['ready_seconds']} 秒")
+for name, st in status["services"].items():
+    warmup = f"，预热 {st['warmup_seconds']} 秒" if st["warmup_seconds"] is not None else ""
+    print(f"  {name:<14} {st['state']:<8} PID {st['pid']}  启动 {st['startup_seconds']} 秒{warmup}  重启 {st['restarts']} 次")
+PY
+}
+
+# 函数：启动服务监管进程，由它并发启动 Sherpa、API 和 Web，并在崩溃后自动重启
+start_supervisor() {
+    if supervisor_running; then
+        print_warning "服务监管进程已在运行 (PID: $(cat "$LOGS_DIR/supervisor.pid"))，可用 $0 restart 滚动重启"
+        return 0
     fi
-    
+
     # 检查依赖
     if ! python3 -c "import fastapi, uvicorn" 2>/dev/null; then
         print_error "缺少API服务依赖，请运行: pip3 install fastapi uvicorn python-multipart websockets"
         return 1
     fi
-    
-    # 启动API服务
-    nohup python3 asr_openai_api.py > "$LOGS_DIR/api.log" 2>&1 &
-    
-    API_PID=$!
-    print_success "API 服务已启动，PID: $API_PID"
-    echo $API_PID > "$LOGS_DIR/api.pid"
-    
-    # 等待服务启动
-    print_info "等待 API 服务启动..."
-    for i in {1..10}; do
-        if check_port 8000; then
-            print_success "API 服务启动成功 (端口 8000)"
+
+    print_info "启动服务监管进程: Sherpa ($SHERPA_NUM_INSTANCES 个实例，$SHERPA_TRANSPORT 传输)、API、Web"
+    rm -f "$LOGS_DIR/supervisor.json"
+    nohup python3 voice_supervisor.py \
+        --base-dir "$BASE_DIR" \
+        --logs-dir "$LOGS_DIR" \
+        --sherpa-instances "$SHERPA_NUM_INSTANCES" \
+        --sherpa-base-port "$SHERPA_BASE_PORT" \
+        --transport "$SHERPA_TRANSPORT" \
+        > "$LOGS_DIR/supervisor.log" 2>&1 &
+    local pid=$!
+    print_success "服务监管进程已启动，PID: $pid"
+
+    # 等待全部服务就绪：Sherpa 完成一次预热识别后才启动 API
+    print_info "等待服务就绪..."
+    for i in $(seq 1 $((SUPERVISOR_START_TIMEOUT * 5))); do
+        if grep -q '"ready": true' "$LOGS_DIR/supervisor.json" 2>/dev/null; then
+            print_success "所有服务已就绪"
+            print_startup_times
             return 0
         fi
-        sleep 1
+        if ! kill -0 $pid 2>/dev/null; then
+            print_error "服务监管进程已退出，请检查日志: $LOGS_DIR/supervisor.log"
+            return 1
+        fi
+        sleep 0.2
     done
-    
-    print_error "API 服务启动失败，请检查日志"
+
+    print_error "服务在 $SUPERVISOR_START_TIMEOUT 秒内未全部就绪（监管进程会继续重试），请检查日志"
+    print_startup_times
     return 1
 }
 
-# 函数：启动Web服务
-start_web() {
-    print_info "启动 Web 界面服务..."
-    
-    # 检查并清理端口
-    if check_port 8888; then
-        print_warning "端口 8888 被占用，清理中..."
-        kill_port_process 8888
-    fi
-    
-    # 启动Web服务
-    nohup python3 voice_web.py > "$LOGS_DIR/web.log" 2>&1 &
-    
-    WEB_PID=$!
-    print_success "Web 服务已启动，PID: $WEB_PID"
-    echo $WEB_PID > "$LOGS_DIR/web.pid"
-    
-    # 等待服务启动
-    print_info "等待 Web 服务启动..."
-    for i in {1..10}; do
-        if check_port 8888; then
-            print_success "Web 服务启动成功 (端口 8888)"
-            return 0
-        fi
-        sleep 1
-    done
-    
-    print_error "Web 服务启动失败，请检查日志"
-    return 1
+# 函数：滚动重启（监管进程逐个重启服务，新实例就绪后再处理下一个）
+reload_services() {
+    print_info "滚动重启服务..."
+    kill -HUP "$(cat "$LOGS_DIR/supervisor.pid")"
+    print_success "已通知服务监管进程，进度见 $LOGS_DIR/supervisor.log"
 }
 
 # 函数：检查服务状态
@@ -209,12 +204,14 @@ check_services() {
     local all_ok=true
     
     # 检查sherpa服务
-    if check_port 6006; then
-        print_success "✅ Sherpa 服务运行正常 (端口 6006)"
-    else
-        print_error "❌ Sherpa 服务未运行"
-        all_ok=false
-    fi
+    for port in $(sherpa_ports); do
+        if sherpa_instance_up $port; then
+            print_success "✅ Sherpa 服务运行正常 (端口 $port)"
+        else
+            print_error "❌ Sherpa 服务未运行 (端口 $port)"
+            all_ok=false
+        fi
+    done
     
     # 检查API服务
     if check_port 8000; then
@@ -251,9 +248,20 @@ check_services() {
 stop_services() {
     print_info "停止所有语音识别服务..."
     
-    # 方法1: 通过PID文件停止
-    for service in sherpa api web; do
-        local pid_file="$LOGS_DIR/${service}.pid"
+    # 由监管进程按依赖逆序停止（Web、API，最后是 Sherpa）
+    if supervisor_running; then
+        local supervisor_pid=$(cat "$LOGS_DIR/supervisor.pid")
+        print_info "停止服务监管进程 (PID: $supervisor_pid)"
+        kill "$supervisor_pid" 2>/dev/null
+        for i in $(seq 1 300); do
+            kill -0 "$supervisor_pid" 2>/dev/null || break
+            sleep 0.2
+        done
+    fi
+    
+    # 方法1: 通过PID文件停止（监管进程异常退出时遗留的子进程）
+    for pid_file in "$LOGS_DIR"/sherpa_*.pid "$LOGS_DIR"/sherpa.pid "$LOGS_DIR"/api.pid "$LOGS_DIR"/web.pid "$LOGS_DIR"/supervisor.pid; do
+        local service=$(basename "$pid_file" .pid)
         if [ -f "$pid_file" ]; then
             local pid=$(cat "$pid_file")
             if kill -0 "$pid" 2>/dev/null; then
@@ -266,15 +274,10 @@ stop_services() {
     
     # 方法2: 通过进程名停止
     pkill -f "non_streaming_server.py" 2>/dev/null || true
+    pkill -f "shm_recognizer_worker.py" 2>/dev/null || true
     pkill -f "asr_openai_api" 2>/dev/null || true  
     pkill -f "voice_web.py" 2>/dev/null || true
     
-    # 方法3: 通过端口强制停止
-    for port in 6006 8000 8888; do
-        kill_port_process $port
-    done
-    
-    sleep 2
     print_success "所有服务已停止"
 }
 
@@ -284,8 +287,10 @@ show_logs() {
     
     case $service in
         sherpa)
-            print_info "=== Sherpa 日志 ==="
-            tail -n 30 "$LOGS_DIR/sherpa.log" 2>/dev/null || echo "无日志文件"
+            for port in $(sherpa_ports); do
+                print_info "=== Sherpa 日志 (端口 $port) ==="
+                tail -n 30 "$LOGS_DIR/sherpa_$port.log" 2>/dev/null || echo "无日志文件"
+            done
             ;;
         api)
             print_info "=== API 日志 ==="
@@ -296,9 +301,11 @@ show_logs() {
             tail -n 30 "$LOGS_DIR/web.log" 2>/dev/null || echo "无日志文件"
             ;;
         all|*)
-            print_info "=== Sherpa 日志 ==="
-            tail -n 20 "$LOGS_DIR/sherpa.log" 2>/dev/null || echo "无日志文件"
-            echo ""
+            for port in $(sherpa_ports); do
+                print_info "=== Sherpa 日志 (端口 $port) ==="
+                tail -n 20 "$LOGS_DIR/sherpa_$port.log" 2>/dev/null || echo "无日志文件"
+                echo ""
+            done
             print_info "=== API 日志 ==="
             tail -n 20 "$LOGS_DIR/api.log" 2>/dev/null || echo "无日志文件"
             echo ""
@@ -324,32 +331,12 @@ main() {
                 exit 1
             fi
             
-            # 启动服务（按依赖顺序）
-            if start_sherpa; then
-                print_info "等待 Sherpa 完全启动..."
-                sleep 3
-                
-                if start_api; then
-                    print_info "等待 API 完全启动..."
-                    sleep 2
-                    
-                    if start_web; then
-                        print_info "等待 Web 完全启动..."
-                        sleep 2
-                        
-                        # 最终检查
-                        check_services
-                        print_success "🎉 语音识别服务套件启动完成！"
-                    else
-                        print_error "Web服务启动失败"
-                        exit 1
-                    fi
-                else
-                    print_error "API服务启动失败"
-                    exit 1
-                fi
+            # 由监管进程并发启动各服务
+            if start_supervisor; then
+                check_services
+                print_success "🎉 语音识别服务套件启动完成！"
             else
-                print_error "Sherpa服务启动失败"
+                print_error "服务启动失败"
                 exit 1
             fi
             ;;
@@ -359,15 +346,22 @@ main() {
             ;;
         
         restart)
-            print_info "重启服务..."
-            stop_services
-            sleep 3
-            $0 start
+            setup_environment
+            if supervisor_running; then
+                reload_services
+            else
+                print_info "重启服务..."
+                stop_services
+                $0 start
+            fi
             ;;
         
         status)
             setup_environment
             check_services
+            if supervisor_running; then
+                print_startup_times
+            fi
             ;;
             
         logs)
@@ -379,7 +373,7 @@ main() {
             print_info "执行服务测试..."
             
             # 测试各个端口
-            for port in 6006 8000 8888; do
+            for port in $(sherpa_ports) 8000 8888; do
                 if check_port $port; then
                     print_success "端口 $port 可访问"
                 else
@@ -403,11 +397,18 @@ main() {
             echo "命令说明:"
             echo "  start     - 启动所有服务"
             echo "  stop      - 停止所有服务"
-            echo "  restart   - 重启所有服务"
+            echo "  restart   - 重启所有服务（监管进程运行时为滚动重启）"
             echo "  status    - 检查服务状态"
             echo "  logs      - 查看服务日志 (可选: sherpa|api|web)"
             echo "  test      - 测试服务连通性"
             echo ""
+            echo "环境变量:"
+            echo "  SHERPA_NUM_INSTANCES - Sherpa 识别进程数量 (默认 1)"
+            echo "  SHERPA_BASE_PORT     - Sherpa 起始端口 (默认 6006)"
+            echo "  SHERPA_TRANSPORT     - websocket 或 shm（同机共享内存传输，默认 websocket）"
+            echo "  ASR_WORKERS          - API 工作进程数量 (默认 1；大于 1 时 kill -HUP \$(cat logs/api.pid) 平滑重启)"
+            echo "  ASR_WARMUP_ENABLED   - API 启动时预热识别后端和请求路径，完成前 /ready 返回 503 (默认 1)"
+            echo ""
             echo "服务地址:"
             echo "  🎤 Web界面: http://localhost:8888"
             echo "  🔌 API接口: http://localhost:8000/v1/audio/transcriptions"
@@ -0,0 +1,25 @@
+import hashlib
+
+from asr_openai_api import TranscriptionCache, parse_content_type, upload_decode_params
+
+
+def cache_key(content_type: str, filename: str = "audio.pcm") -> str:
+    mime, params = parse_content_type(content_type)
+    suffix = "." + filename.rsplit(".", 1)[-1]
+    return TranscriptionCache.make_key(
+        hashlib.sha256(b"\x00\x01" * 1600),
+        model="sense-voice", language=None, response_format="json",
+        **upload_decode_params(mime, params, suffix),
+    )
+
+
+def test_raw_pcm_rate_and_channels_change_key():
+    assert cache_key("audio/pcm;rate=8000") != cache_key("audio/pcm;rate=16000")
+    assert cache_key("audio/pcm;rate=16000;channels=2") != cache_key("audio/pcm;rate=16000")
+    # 未写参数时按默认 16kHz 单声道解析，与显式写出的参数是同一份音频
+    assert cache_key("audio/pcm") == cache_key("audio/pcm; rate=16000; channels=1")
+
+
+def test_decoder_path_changes_key():
+    assert cache_key("audio/l16;rate=16000") != cache_key("audio/pcm;rate=16000")
+    assert cache_key("audio/wav", "audio.wav") != cache_key("", "audio.webm")
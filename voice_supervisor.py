@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""语音服务监管进程：并发启动 Sherpa、API 和 Web 界面，按依赖就绪放行，崩溃后退避重启
+
+代替 start_voice_services.sh 中逐个启动、sleep 轮询端口的流程：
+  - 没有依赖的服务（各 Sherpa 实例、Web 界面）同时启动，API 在所有 Sherpa 实例就绪后立即启动
+  - Sherpa 实例以一段合成音频完成一次识别才算就绪，同时预热模型，API 的第一个请求不再承担冷启动
+  - 子进程意外退出后按指数退避重启，稳定运行一段时间后退避清零
+  - 各服务的启动耗时（其中的预热耗时）写入日志和状态文件 logs/supervisor.json
+
+信号:
+  SIGTERM / SIGINT  按依赖逆序停止所有服务后退出
+  SIGHUP            滚动重启：逐个重启 Sherpa 实例（新实例就绪后再处理下一个）；
+                    API 为多进程模式（ASR_WORKERS > 1）时转发 SIGHUP，由 uvicorn 逐个替换工作进程，否则重启 API
+
+用法:
+    python3 voice_supervisor.py --sherpa-instances 2
+    kill -HUP $(cat logs/supervisor.pid)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+import websockets
+
+# 不导入 asr_openai_api：它在导入时解析模型清单、API Key 等配置，配置有误时监管进程也会启动失败
+from asr_engine import SENSE_VOICE_MODEL, SENSE_VOICE_TOKENS
+
+logger = logging.getLogger("voice_supervisor")
+
+READY_POLL_INTERVAL = 0.2
+WARMUP_TIMEOUT = 60.0
+WARMUP_SAMPLE_RATE = 16000
+CONNECT_TIMEOUT = 5.0
+SHERPA_FRAME_SIZE = 10240
+SHM_SEGMENT_PREFIX = "asr_shm_"  # 与 asr_openai_api.py 一致，监管进程异常退出遗留的段由 API 启动时清理
+ASR_PORT = int(os.environ.get("ASR_PORT", "8000"))
+ASR_WORKERS = int(os.environ.get("ASR_WORKERS", "1"))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Service:
+    """一个受监管的子进程
+
+    ready 为 async () -> bool，进程启动后反复调用直到返回 True；
+    warmup 为可选的 async ()，就绪后执行一次，失败视为启动失败。
+    """
+
+    def __init__(self, name: str, argv: list, ready, warmup=None, requires=(), env=None, port=None,
+                 reload_signal=None):
+        self.name = name
+        self.argv = argv
+        self.ready = ready
+        self.warmup = warmup
+        self.requires = tuple(requires)
+        self.env = env or {}
+        self.port = port
+        self.reload_signal = reload_signal  # 支持平滑重启的服务收到该信号即可，不必重启进程
+
+        self.process = None
+        self.state = "waiting"
+        self.ready_event = asyncio.Event()
+        self.restarts = 0
+        self.failures = 0  # 连续失败次数，决定退避时长
+        self.startup_seconds = None
+        self.warmup_seconds = None
+        self.last_exit_code = None
+        self.restart_requested = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "pid": self.process.pid if self.process and self.process.returncode is None else None,
+            "requires": [dep.name for dep in self.requires],
+            "restarts": self.restarts,
+            "startup_seconds": self.startup_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "last_exit_code": self.last_exit_code,
+        }
+
+
+async def probe_recognizer(address: str) -> bool:
+    """能否建立到识别进程的连接：unix:<路径> 为共享内存识别进程，其余为 host:port 的 WebSocket 服务"""
+    try:
+        if address.startswith("unix:"):
+            _, writer = await asyncio.wait_for(asyncio.open_unix_connection(address[5:]), CONNECT_TIMEOUT)
+            writer.close()
+        else:
+            ws = await asyncio.wait_for(websockets.connect(f"ws://{address}"), CONNECT_TIMEOUT)
+            await ws.close()
+        return True
+    except Exception:
+        return False
+
+
+async def recognize_once(address: str, samples: np.ndarray, sample_rate: int) -> str:
+    """按识别进程的协议发送一段音频并返回识别结果（与 API 的 SherpaBackend.send 相同的线路格式）"""
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    if not address.startswith("unix:"):
+        payload = samples.tobytes()
+        async with websockets.connect(f"ws://{address}", open_timeout=CONNECT_TIMEOUT) as ws:
+            await ws.send(sample_rate.to_bytes(4, "little") + len(payload).to_bytes(4, "little"))
+            for offset in range(0, len(payload), SHERPA_FRAME_SIZE):
+                await ws.send(payload[offset:offset + SHERPA_FRAME_SIZE])
+            result = await ws.recv()
+            await ws.send("Done")
+            return result
+
+    shm = shared_memory.SharedMemory(
+        name=f"{SHM_SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:12]}", create=True, size=max(1, samples.nbytes)
+    )
+    try:
+        view = np.ndarray(len(samples), dtype=np.float32, buffer=shm.buf)
+        view[:] = samples
+        del view
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(address[5:]), CONNECT_TIMEOUT)
+        try:
+            header = {"shm": shm.name, "samples": len(samples), "sample_rate": sample_rate}
+            writer.write(json.dumps(header).encode() + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+        finally:
+            writer.close()
+        if not line:
+            raise ConnectionError("识别进程关闭了连接")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(f"识别进程出错: {reply['error']}")
+        return reply["text"]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def recognizer_checks(address: str, warmup_seconds: float):
+    """识别进程的就绪检查：能建立连接，且（warmup_seconds > 0 时）能完成一次合成音频的识别"""
+
+    async def ready() -> bool:
+        return await probe_recognizer(address)
+
+    async def warmup():
+        samples = 0.01 * np.random.default_rng(0).standard_normal(int(WARMUP_SAMPLE_RATE * warmup_seconds))
+        await asyncio.wait_for(recognize_once(address, samples, WARMUP_SAMPLE_RATE), WARMUP_TIMEOUT)
+
+    return ready, warmup if warmup_seconds > 0 else None
+
+
+def http_check(url: str):
+    def get() -> bool:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resp:
+                return resp.status == 200
+        except OSError:
+            return False
+
+    async def ready() -> bool:
+        return await asyncio.to_thread(get)
+
+    return ready
+
+
+def _port_in_use(port: int) -> bool:
+    with socket.socket() as s:
+        s.settimeout(0.5)
+        return s.connect_ex(("127.0.0.1", port)) == 0
+
+
+class VoiceSupervisor:
+    """按依赖顺序管理各服务的生命周期，并把状态写入 logs/supervisor.json"""
+
+    def __init__(self, services: list, base_dir: str, logs_dir: str, startup_timeout: float, stop_timeout: float,
+                 backoff_base: float, backoff_max: float, stable_seconds: float):
+        self.services = services
+        self.base_dir = base_dir
+        self.logs_dir = logs_dir
+        self.startup_timeout = startup_timeout
+        self.stop_timeout = stop_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_seconds = stable_seconds
+        self.started_at = None
+        self.ready_seconds = None
+        self._stop = asyncio.Event()
+        self._reloading = False
+
+    def _path(self, service: Service, suffix: str) -> str:
+        return os.path.join(self.logs_dir, f"{service.name}.{suffix}")
+
+    def write_status(self):
+        status = {
+            "pid": os.getpid(),
+            "ready": all(s.ready_event.is_set() for s in self.services),
+            "ready_seconds": self.ready_seconds,
+            "services": {s.name: s.stats() for s in self.services},
+        }
+        path = os.path.join(self.logs_dir, "supervisor.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(status, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    async def run(self):
+        os.makedirs(self.logs_dir, exist_ok=True)
+        with open(os.path.join(self.logs_dir, "supervisor.pid"), "w") as f:
+            f.write(str(os.getpid()))
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stop.set)
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.reload()))
+
+        self.started_at = time.monotonic()
+        tasks = [asyncio.create_task(self._lifecycle(s)) for s in self.services]
+        tasks.append(asyncio.create_task(self._report_ready()))
+        self.write_status()
+        try:
+            await self._stop.wait()
+        finally:
+            logger.info("停止所有服务...")
+            # 依赖方先停：Web、API，最后是识别进程
+            for service in reversed(self.services):
+                await self._terminate(service)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.write_status()
+            try:
+                os.unlink(os.path.join(self.logs_dir, "supervisor.pid"))
+            except FileNotFoundError:
+                pass
+            logger.info("所有服务已停止")
+
+    async def _report_ready(self):
+        await asyncio.gather(*(s.ready_event.wait() for s in self.services))
+        self.ready_seconds = round(time.monotonic() - self.started_at, 2)
+        self.write_status()
+        logger.info(f"全部服务就绪，用时 {self.ready_seconds:.1f} 秒")
+        for s in self.services:
+            warmup = f"（其中预热 {s.warmup_seconds:.2f} 秒）" if s.warmup_seconds is not None else ""
+            logger.info(f"  {s.name:<14} 启动 {s.startup_seconds:.2f} 秒{warmup}")
+
+    async def _lifecycle(self, service: Service):
+        for dep in service.requires:
+            await dep.ready_event.wait()
+        await self._reclaim(service)
+        while not self._stop.is_set():
+            service.state = "starting"
+            self.write_status()
+            started = time.monotonic()
+            try:
+                await self._spawn(service)
+            except OSError as e:
+                logger.error(f"{service.name} 启动失败: {e}")
+                code, ready_at = None, None
+            else:
+                ready_at = await self._wait_ready(service, started)
+                if ready_at is not None:
+                    service.startup_seconds = round(ready_at - started, 2)
+                    service.state = "ready"
+                    service.ready_event.set()
+                    self.write_status()
+                    logger.info(f"{service.name} 就绪，启动用时 {service.startup_seconds:.2f} 秒")
+                    await service.process.wait()
+                else:
+                    await self._terminate(service)
+                code = service.process.returncode
+            service.ready_event.clear()
+            service.last_exit_code = code
+            if self._stop.is_set():
+                break
+            service.restarts += 1
+            if service.restart_requested:
+                service.restart_requested = False
+                continue
+            if ready_at is not None and time.monotonic() - ready_at >= self.stable_seconds:
+                service.failures = 0
+            service.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (service.failures - 1))
+            logger.warning(f"{service.name} 已退出（code={code}），{delay:.1f} 秒后第 {service.restarts} 次重启")
+            service.state = "backoff"
+            self.write_status()
+            try:
+                await asyncio.wait_for(self._stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        service.state = "stopped"
+
+    async def _spawn(self, service: Service):
+        with open(self._path(service, "log"), "ab") as log:
+            service.process = await asyncio.create_subprocess_exec(
+                *service.argv,
+                cwd=self.base_dir,
+                env={**os.environ, **service.env},
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,  # 终端的 Ctrl+C 只发给监管进程，由它按顺序停止子进程
+            )
+        with open(self._path(service, "pid"), "w") as f:
+            f.write(str(service.process.pid))
+        logger.info(f"{service.name} 已启动，PID: {service.process.pid}")
+
+    async def _wait_ready(self, service: Service, started: float):
+        """返回就绪时刻；进程退出、超时或预热失败时返回 None"""
+        deadline = started + self.startup_timeout
+        while True:
+            if time.monotonic() > deadline:
+                logger.error(f"{service.name} 在 {self.startup_timeout:.0f} 秒内未就绪")
+                return None
+            try:
+                if await service.ready():
+                    break
+            except Exception as e:
+                logger.debug(f"{service.name} 就绪检查失败: {e}")
+            try:
+                await asyncio.wait_for(service.process.wait(), READY_POLL_INTERVAL)
+                logger.error(f"{service.name} 启动过程中退出（code={service.process.returncode}），请检查日志")
+                return None
+            except asyncio.TimeoutError:
+                pass
+        if service.warmup is not None:
+            warmup_started = time.monotonic()
+            try:
+                await service.warmup()
+            except Exception as e:
+                logger.error(f"{service.name} 预热识别失败: {e!r}")
+                return None
+            service.warmup_seconds = round(time.monotonic() - warmup_started, 2)
+        return time.monotonic()
+
+    async def _terminate(self, service: Service):
+        process = service.process
+        if process is None or process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), self.stop_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{service.name} 未在 {self.stop_timeout:.0f} 秒内退出，强制结束")
+            process.kill()
+            await process.wait()
+        try:
+            os.unlink(self._path(service, "pid"))
+        except FileNotFoundError:
+            pass
+
+    async def _reclaim(self, service: Service):
+        """结束上次启动遗留的同名服务进程（按 pid 文件），不误杀占用端口的其他程序"""
+        try:
+            with open(self._path(service, "pid")) as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            pid = None
+        if pid and _pid_alive(pid) and pid != os.getpid():
+            logger.warning(f"结束遗留的 {service.name} 进程 (PID: {pid})")
+            try:
+                os.kill(pid, signal.SIGTERM)
+                deadline = time.monotonic() + self.stop_timeout
+                while _pid_alive(pid) and time.monotonic() < deadline:
+                    await asyncio.sleep(0.1)
+                if _pid_alive(pid):
+                    os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        if service.port and await asyncio.to_thread(_port_in_use, service.port):
+            logger.error(f"端口 {service.port} 已被其他进程占用，{service.name} 可能无法启动")
+
+    async def restart(self, service: Service) -> bool:
+        """重启一个服务并等待新进程就绪；startup_timeout 内未就绪返回 False（进程仍由 _lifecycle 退避重启）"""
+        if service.process is None or service.process.returncode is not None:
+            return True
+        started = time.monotonic()
+        service.restart_requested = True
+        service.ready_event.clear()
+        await self._terminate(service)
+        try:
+            await asyncio.wait_for(service.ready_event.wait(), self.startup_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{service.name} 重启后 {self.startup_timeout:.0f} 秒内未就绪")
+            return False
+        logger.info(f"{service.name} 已重启，用时 {time.monotonic() - started:.2f} 秒")
+        return True
+
+    async def reload(self):
+        if self._reloading:
+            return
+        self._reloading = True
+        logger.info("收到 SIGHUP，滚动重启服务")
+        try:
+            for service in self.services:
+                if self._stop.is_set():
+                    return
+                if service.reload_signal is not None and service.ready_event.is_set():
+                    service.process.send_signal(service.reload_signal)
+                    logger.info(f"{service.name} 已转发 {signal.Signals(service.reload_signal).name}，由其自行平滑重启")
+                    continue
+                if not await self.restart(service):
+                    # 不再继续重启其余服务，避免滚动重启把仍在工作的实例也停掉
+                    logger.error(f"滚动重启已中止，{service.name} 之后的服务保持原进程")
+                    return
+        finally:
+            self._reloading = False
+
+
+def build_services(args) -> list:
+    python = sys.executable
+    model_args = [f"--sense-voice={args.sense_voice}", f"--tokens={args.tokens}"]
+    recognizers, addresses = [], []
+    for port in range(args.sherpa_base_port, args.sherpa_base_port + args.sherpa_instances):
+        if args.transport == "shm":
+            socket_path = os.path.join(args.logs_dir, f"sherpa_{port}.sock")
+            address = f"unix:{socket_path}"
+            argv = [python, "shm_recognizer_worker.py", *model_args, f"--socket={socket_path}"]
+            listen_port = None
+        else:
+            address = f"127.0.0.1:{port}"
+            argv = [python, "./python-api-examples/non_streaming_server.py", *model_args, f"--port={port}"]
+            listen_port = port
+        ready, warmup = recognizer_checks(address, args.warmup_seconds)
+        recognizers.append(Service(f"sherpa_{port}", argv, ready, warmup, port=listen_port))
+        addresses.append(address)
+
+    api_service = Service(
+        "api", [python, "asr_openai_api.py"],
+        http_check(f"http://127.0.0.1:{args.api_port}/ready"),
+        requires=recognizers,
+        env={"SHERPA_BACKENDS": ",".join(addresses), "ASR_PORT": str(args.api_port)},
+        port=args.api_port,
+        # 多进程模式下 API 主进程收到 SIGHUP 会逐个替换工作进程，不中断服务
+        reload_signal=signal.SIGHUP if ASR_WORKERS > 1 else None,
+    )
+    services = [*recognizers, api_service]
+    if not args.no_web:
+        services.append(Service("web", [python, "voice_web.py"], http_check("http://127.0.0.1:8888/"), port=8888))
+    return services
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发启动并监管 Sherpa、API 和 Web 服务")
+    parser.add_argument("--base-dir", default=os.getcwd(), help="服务脚本和模型所在目录")
+    parser.add_argument("--logs-dir", default=None, help="日志、pid 和状态文件目录，默认 <base-dir>/logs")
+    parser.add_argument("--sherpa-instances", type=int, default=int(os.environ.get("SHERPA_NUM_INSTANCES", "1")))
+    parser.add_argument("--sherpa-base-port", type=int, default=int(os.environ.get("SHERPA_BASE_PORT", "6006")))
+    parser.add_argument("--transport", choices=("websocket", "shm"),
+                        default=os.environ.get("SHERPA_TRANSPORT", "websocket"))
+    parser.add_argument("--sense-voice", default=SENSE_VOICE_MODEL)
+    parser.add_argument("--tokens", default=SENSE_VOICE_TOKENS)
+    parser.add_argument("--api-port", type=int, default=ASR_PORT)
+    parser.add_argument("--no-web", action="store_true", help="不启动 Web 界面")
+    parser.add_argument("--warmup-seconds", type=float, default=1.0, help="预热识别的合成音频时长，0 为只检查连接")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="单个服务等待就绪的最长时间（秒）")
+    parser.add_argument("--stop-timeout", type=float, default=30, help="停止服务时等待其退出的时间（秒）")
+    parser.add_argument("--backoff-base", type=float, default=1.0, help="崩溃后首次重启的等待时间（秒），之后逐次翻倍")
+    parser.add_argument("--backoff-max", type=float, default=60.0)
+    parser.add_argument("--stable-seconds", type=float, default=60.0, help="运行超过该时长后退出不再累计退避")
+    args = parser.parse_args()
+    args.base_dir = os.path.abspath(args.base_dir)
+    args.logs_dir = os.path.abspath(args.logs_dir or os.path.join(args.base_dir, "logs"))
+
+    os.chdir(args.base_dir)
+    supervisor = VoiceSupervisor(
+        build_services(args), args.base_dir, args.logs_dir, args.startup_timeout, args.stop_timeout,
+        args.backoff_base, args.backoff_max, args.stable_seconds,
+    )
+    asyncio.run(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
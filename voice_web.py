@@ -122,6 +122,19 @@ html_content = """
             box-shadow: none;
         }
 
+        .live-toggle {
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            gap: 8px;
+            margin-top: -25px;
+            margin-bottom: 25px;
+            color: #555;
+            font-size: 14px;
+            cursor: pointer;
+            user-select: none;
+        }
+
         .status {
             text-align: center;
             margin-bottom: 30px;
@@ -275,6 +288,11 @@ html_content = """
             </button>
         </div>
         
+        <label class="live-toggle" title="边说边把音频推送到服务器，实时显示识别结果">
+            <input type="checkbox" id="liveMode" checked>
+            ⚡ 实时识别（边说边出字）
+        </label>
+        
         <div class="status ready" id="status">准备就绪，点击开始录音</div>
         
         <div class="text-container">
@@ -289,10 +307,79 @@ html_content = """
     </div>
 
     <script>
+        const API_BASE = 'http://localhost:8000';
+        const STREAM_URL = API_BASE.replace(/^http/, 'ws') + '/v1/audio/stream?format=pcm_s16le&sample_rate=16000';
+        const TARGET_SAMPLE_RATE = 16000;
+        const CHUNK_MS = 100;                 // 每次推送 100ms 音频
+        const MAX_PENDING_CHUNKS = 100;       // 断线期间最多缓存 10 秒音频
+        const MAX_RECONNECT_DELAY = 5000;
+
+        // AudioWorklet：把麦克风音频降采样为 16kHz 单声道 int16，按固定时长分块发回主线程
+        const PCM_WORKLET = `
+        class PcmCaptureProcessor extends AudioWorkletProcessor {
+            constructor(options) {
+                super();
+                const opts = options.processorOptions;
+                this.ratio = sampleRate / opts.targetRate;
+                this.chunkSize = Math.round(opts.targetRate * opts.chunkMs / 1000);
+                this.buffer = new Int16Array(this.chunkSize);
+                this.filled = 0;
+                this.acc = 0;
+                this.accCount = 0;
+                this.pos = 0;
+                this.port.onmessage = (event) => {
+                    if (event.data === 'flush') {
+                        if (this.filled > 0) {
+                            this.port.postMessage(this.buffer.slice(0, this.filled).buffer);
+                            this.filled = 0;
+                        }
+                        this.port.postMessage('flushed');
+                    }
+                };
+            }
+
+            process(inputs) {
+                const input = inputs[0];
+                if (!input || input.length === 0) {
+                    return true;
+                }
+                const length = input[0].length;
+                for (let i = 0; i < length; i++) {
+                    let sample = 0;
+                    for (let c = 0; c < input.length; c++) {
+                        sample += input[c][i];
+                    }
+                    // 对每个输出样本对应的输入区间取平均，兼作简单的抗混叠滤波
+                    this.acc += sample / input.length;
+                    this.accCount++;
+                    this.pos += 1;
+                    if (this.pos >= this.ratio) {
+                        this.pos -= this.ratio;
+                        const v = Math.max(-1, Math.min(1, this.acc / this.accCount));
+                        this.buffer[this.filled++] = v < 0 ? v * 0x8000 : v * 0x7fff;
+                        this.acc = 0;
+                        this.accCount = 0;
+                        if (this.filled === this.chunkSize) {
+                            this.port.postMessage(this.buffer.buffer, [this.buffer.buffer]);
+                            this.buffer = new Int16Array(this.chunkSize);
+                            this.filled = 0;
+                        }
+                    }
+                }
+                return true;
+            }
+        }
+        registerProcessor('pcm-capture', PcmCaptureProcessor);
+        `;
+
         let mediaRecorder = null;
         let audioChunks = [];
         let isRecording = false;
 
+        // 实时模式 / PCM 录音状态
+        let live = null;
+        let pcmRecording = null;
+
         const startBtn = document.getElementById('startBtn');
         const stopBtn = document.getElementById('stopBtn');
         const status = document.getElementById('status');
@@ -300,11 +387,16 @@ html_content = """
         const wordCount = document.getElementById('wordCount');
         const recordingIndicator = document.getElementById('recordingIndicator');
         const errorMessage = document.getElementById('errorMessage');
+        const liveMode = document.getElementById('liveMode');
 
         // 检查浏览器支持
         if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
             showError('您的浏览器不支持录音功能，请使用现代浏览器（Chrome、Firefox、Safari等）');
         }
+        if (!window.AudioWorkletNode) {
+            liveMode.checked = false;
+            liveMode.disabled = true;
+        }
 
         async function startRecording() {
             try {
@@ -318,28 +410,15 @@ html_content = """
                     } 
                 });
                 
-                mediaRecorder = new MediaRecorder(stream, {
-                    mimeType: 'audio/webm;codecs=opus'
-                });
-                
-                audioChunks = [];
-                
-                mediaRecorder.ondataavailable = (event) => {
-                    if (event.data.size > 0) {
-                        audioChunks.push(event.data);
-                    }
-                };
-                
-                mediaRecorder.onstop = async () => {
-                    const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
-                    await sendAudioToServer(audioBlob);
-                    
-                    // 停止所有音轨
-                    stream.getTracks().forEach(track => track.stop());
-                };
-                
-                mediaRecorder.start();
+                if (liveMode.checked) {
+                    await startLiveRecording(stream);
+                } else if (window.AudioWorkletNode) {
+                    await startPcmRecording(stream);
+                } else {
+                    startBatchRecording(stream);
+                }
                 isRecording = true;
+                liveMode.disabled = true;
                 
                 // 更新UI
                 startBtn.disabled = true;
@@ -354,28 +433,266 @@ html_content = """
             }
         }
 
+        // 在浏览器端采集 16kHz 单声道 int16 PCM，录音结束后打包成 WAV 上传，
+        // 服务端可以直接读取样本，省去一次 ffmpeg 解码
+        async function startPcmRecording(stream) {
+            const chunks = [];
+            const capture = await createPcmCapture(stream, (data) => {
+                if (data === 'flushed') {
+                    capture.audioContext.close();
+                    pcmRecording = null;
+                    sendAudioToServer(encodeWav(chunks, TARGET_SAMPLE_RATE), 'recording.wav');
+                } else {
+                    chunks.push(new Int16Array(data));
+                }
+            });
+            pcmRecording = { stream, node: capture.node };
+        }
+
+        function stopPcmRecording() {
+            pcmRecording.stream.getTracks().forEach(track => track.stop());
+            pcmRecording.node.port.postMessage('flush');
+        }
+
+        function encodeWav(chunks, sampleRate) {
+            const length = chunks.reduce((n, chunk) => n + chunk.length, 0);
+            const buffer = new ArrayBuffer(44 + length * 2);
+            const view = new DataView(buffer);
+            const writeString = (offset, text) => {
+                for (let i = 0; i < text.length; i++) {
+                    view.setUint8(offset + i, text.charCodeAt(i));
+                }
+            };
+            writeString(0, 'RIFF');
+            view.setUint32(4, 36 + length * 2, true);
+            writeString(8, 'WAVE');
+            writeString(12, 'fmt ');
+            view.setUint32(16, 16, true);              // fmt 块大小
+            view.setUint16(20, 1, true);               // PCM
+            view.setUint16(22, 1, true);               // 单声道
+            view.setUint32(24, sampleRate, true);
+            view.setUint32(28, sampleRate * 2, true);  // 字节率
+            view.setUint16(32, 2, true);               // 块对齐
+            view.setUint16(34, 16, true);              // 16-bit
+            writeString(36, 'data');
+            view.setUint32(40, length * 2, true);
+            let offset = 44;
+            for (const chunk of chunks) {
+                new Int16Array(buffer, offset, chunk.length).set(chunk);
+                offset += chunk.length * 2;
+            }
+            return new Blob([buffer], { type: 'audio/wav' });
+        }
+
+        // 不支持 AudioWorklet 的浏览器回退到 MediaRecorder 录制 webm
+        function startBatchRecording(stream) {
+            mediaRecorder = new MediaRecorder(stream, {
+                mimeType: 'audio/webm;codecs=opus'
+            });
+            
+            audioChunks = [];
+            
+            mediaRecorder.ondataavailable = (event) => {
+                if (event.data.size > 0) {
+                    audioChunks.push(event.data);
+                }
+            };
+            
+            mediaRecorder.onstop = async () => {
+                const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
+                await sendAudioToServer(audioBlob, 'recording.webm');
+                
+                // 停止所有音轨
+                stream.getTracks().forEach(track => track.stop());
+            };
+            
+            mediaRecorder.start();
+        }
+
         function stopRecording() {
-            if (mediaRecorder && isRecording) {
+            if (!isRecording) {
+                return;
+            }
+            isRecording = false;
+            if (live) {
+                stopLiveRecording();
+            } else if (pcmRecording) {
+                stopPcmRecording();
+            } else if (mediaRecorder) {
                 mediaRecorder.stop();
-                isRecording = false;
-                
-                // 更新UI
-                startBtn.disabled = false;
-                stopBtn.disabled = true;
-                status.textContent = '🔄 正在处理音频，请稍候...';
-                status.className = 'status processing';
-                recordingIndicator.style.display = 'none';
             }
+            
+            // 更新UI
+            startBtn.disabled = false;
+            stopBtn.disabled = true;
+            status.textContent = '🔄 正在处理音频，请稍候...';
+            status.className = 'status processing';
+            recordingIndicator.style.display = 'none';
+        }
+
+        // ===== 实时模式：AudioWorklet 采集 + WebSocket 推流 =====
+
+        // 建立 麦克风 -> PCM 采集 AudioWorklet 的音频图，onData 收到 int16 块或 'flushed'
+        async function createPcmCapture(stream, onData) {
+            const audioContext = new AudioContext();
+            const workletUrl = URL.createObjectURL(new Blob([PCM_WORKLET], { type: 'application/javascript' }));
+            await audioContext.audioWorklet.addModule(workletUrl);
+            URL.revokeObjectURL(workletUrl);
+
+            const source = audioContext.createMediaStreamSource(stream);
+            const node = new AudioWorkletNode(audioContext, 'pcm-capture', {
+                processorOptions: { targetRate: TARGET_SAMPLE_RATE, chunkMs: CHUNK_MS }
+            });
+            // 接到静音的输出上，保证所有浏览器都会驱动处理器
+            const mute = audioContext.createGain();
+            mute.gain.value = 0;
+            source.connect(node);
+            node.connect(mute);
+            mute.connect(audioContext.destination);
+            node.port.onmessage = (event) => onData(event.data);
+            return { audioContext, node };
+        }
+
+        async function startLiveRecording(stream) {
+            const { audioContext, node } = await createPcmCapture(stream, onLiveAudio);
+
+            live = {
+                stream,
+                audioContext,
+                node,
+                ws: null,
+                pending: [],
+                committedText: textOutput.value,
+                reconnectDelay: 500,
+                reconnectTimer: null,
+                finishTimer: null,
+                stopping: false
+            };
+            connectStream();
+        }
+
+        function connectStream() {
+            if (!live) {
+                return;
+            }
+            const session = live;
+            const ws = new WebSocket(STREAM_URL);
+            ws.binaryType = 'arraybuffer';
+            session.ws = ws;
+
+            ws.onopen = () => {
+                session.reconnectDelay = 500;
+                hideError();
+                // 补发断线期间缓存的音频
+                while (session.pending.length > 0) {
+                    ws.send(session.pending.shift());
+                }
+                if (session.stopping) {
+                    ws.send('Done');
+                }
+            };
+
+            ws.onmessage = (event) => {
+                const message = JSON.parse(event.data);
+                if (message.type === 'partial') {
+                    renderLiveText(message.text);
+                } else if (message.type === 'final') {
+                    if (message.text) {
+                        session.committedText = joinText(session.committedText, message.text);
+                    }
+                    renderLiveText('');
+                } else if (message.type === 'done') {
+                    finishLiveRecording(session);
+                } else if (message.type === 'error') {
+                    console.error('实时识别错误:', message.message);
+                    showError(`实时识别错误: ${message.message}`);
+                }
+            };
+
+            ws.onclose = () => {
+                if (session !== live) {
+                    return;
+                }
+                if (isRecording || session.stopping) {
+                    // 断线自动重连，退避时间指数增长
+                    showError(`实时识别连接断开，${Math.round(session.reconnectDelay / 1000 * 10) / 10} 秒后重连...`);
+                    session.reconnectTimer = setTimeout(connectStream, session.reconnectDelay);
+                    session.reconnectDelay = Math.min(session.reconnectDelay * 2, MAX_RECONNECT_DELAY);
+                }
+            };
+        }
+
+        function onLiveAudio(data) {
+            if (!live) {
+                return;
+            }
+            if (data === 'flushed') {
+                // 录音结束：剩余音频已发出，通知服务器收尾
+                const session = live;
+                session.stopping = true;
+                if (session.ws && session.ws.readyState === WebSocket.OPEN) {
+                    session.ws.send('Done');
+                }
+                // 服务器迟迟不返回时也要结束，保留已确认的文本
+                session.finishTimer = setTimeout(() => finishLiveRecording(session), 15000);
+                return;
+            }
+            if (live.ws && live.ws.readyState === WebSocket.OPEN) {
+                live.ws.send(data);
+            } else {
+                live.pending.push(data);
+                if (live.pending.length > MAX_PENDING_CHUNKS) {
+                    live.pending.shift();
+                }
+            }
+        }
+
+        function stopLiveRecording() {
+            live.stream.getTracks().forEach(track => track.stop());
+            live.node.port.postMessage('flush');
+        }
+
+        function finishLiveRecording(session) {
+            if (session !== live) {
+                return;
+            }
+            clearTimeout(session.reconnectTimer);
+            clearTimeout(session.finishTimer);
+            if (session.ws) {
+                session.ws.onclose = null;
+                session.ws.close();
+            }
+            session.audioContext.close();
+            live = null;
+            liveMode.disabled = !window.AudioWorkletNode;
+            textOutput.value = session.committedText;
+            updateWordCount();
+            status.textContent = '✅ 识别完成！可以继续录音';
+            status.className = 'status ready';
+        }
+
+        // 中间结果临时显示在已确认文本之后，收到整句结果时被替换
+        function renderLiveText(partial) {
+            textOutput.value = joinText(live.committedText, partial);
+            resizeOutput();
+            updateWordCount();
+        }
+
+        function joinText(base, text) {
+            if (!text) {
+                return base;
+            }
+            return base ? base + ' ' + text : text;
         }
 
-        async function sendAudioToServer(audioBlob) {
+        async function sendAudioToServer(audioBlob, filename) {
             try {
                 const formData = new FormData();
-                formData.append('file', audioBlob, 'recording.webm');
+                formData.append('file', audioBlob, filename);
                 formData.append('model', 'whisper-1');
                 formData.append('response_format', 'json');
                 
-                const response = await fetch('http://localhost:8000/v1/audio/transcriptions', {
+                const response = await fetch(API_BASE + '/v1/audio/transcriptions', {
                     method: 'POST',
                     headers: {
                         'Authorization': 'Bearer 123'
@@ -403,22 +720,24 @@ html_content = """
                 showError(`音频处理失败: ${error.message}`);
                 status.textContent = '❌ 处理失败，请重试';
                 status.className = 'status ready';
+            } finally {
+                liveMode.disabled = !window.AudioWorkletNode;
             }
         }
 
         function appendText(text) {
-            const currentText = textOutput.value;
-            const newText = currentText ? currentText + ' ' + text : text;
-            textOutput.value = newText;
-            
+            textOutput.value = joinText(textOutput.value, text);
+            resizeOutput();
+            updateWordCount();
+        }
+
+        function resizeOutput() {
             // 自动调整高度
             textOutput.style.height = 'auto';
             textOutput.style.height = Math.min(textOutput.scrollHeight, 400) + 'px';
             
             // 滚动到底部
             textOutput.scrollTop = textOutput.scrollHeight;
-            
-            updateWordCount();
         }
 
         function clearText() {